@@ -1,10 +1,16 @@
 #!/usr/bin/env python
 
-"""Takes text file containing grb names and outputs text file containing dates"""
+"""Takes text file containing grb names and outputs text file containing dates, or the time windows around the
+    trigger times of the GRBs (for a targeted search, see submit_a_search.py --grbs)"""
 
 import re
 import argparse
 
+from SULI.profiling import profile_script
+
+# Origin of the Mission Elapsed Time (MET) of Fermi (UTC)
+MET_ORIGIN = '2001-01-01T00:00:00'
+
 
 def grb_name_to_date(grb_name):
 
@@ -12,24 +18,118 @@ def grb_name_to_date(grb_name):
 
     return '20%s-%s-%sT00:00:00' % (yy, mm, dd)
 
+
+def grb_name_to_met(grb_name):
+    """
+    Return the trigger time (MET) of a GRB. In names like GRB080916009 (or bn080916009, as in the GBM catalog) the
+    last three digits are the fraction of the day (in thousandths) of the trigger; names without them (like
+    GRB080916C) give the midnight of the day. A trigger time can also be given directly as a MET, with a decimal
+    point (like 243216766.6)
+
+    :param grb_name: the name of the GRB, or its trigger time
+    :return: the trigger time (MET)
+    """
+
+    if '.' in grb_name:
+
+        return float(grb_name)
+
+    match = re.search('([0-9]{2})([0-9]{2})([0-9]{2})([0-9]{3})?', grb_name)
+
+    if match is None:
+
+        raise RuntimeError("Cannot find the date in the name of the GRB %s" % grb_name)
+
+    yy, mm, dd, fraction = match.groups()
+
+    # Imported here because astropy is slow to import. The difference of two UTC times includes the leap seconds, as
+    # the MET does
+    from astropy.time import Time
+
+    met = (Time('20%s-%s-%sT00:00:00' % (yy, mm, dd), format='isot', scale='utc') -
+           Time(MET_ORIGIN, format='isot', scale='utc')).sec
+
+    if fraction is not None:
+
+        met += int(fraction) / 1000.0 * 86400.0
+
+    return met
+
+
+def grb_windows(trigger_times, before, after):
+    """
+    Return the time windows [trigger time - before, trigger time + after) around a list of trigger times. Windows
+    which overlap are merged, so that each interval is searched only once.
+
+    :param trigger_times: list of trigger times (MET)
+    :param before: seconds searched before each trigger time
+    :param after: seconds searched after each trigger time
+    :return: a list of (start, stop, list of the indices of the trigger times in the window), sorted in time
+    """
+
+    windows = []
+
+    for k in sorted(range(len(trigger_times)), key=lambda i: trigger_times[i]):
+
+        start = trigger_times[k] - before
+        stop = trigger_times[k] + after
+
+        if len(windows) > 0 and start <= windows[-1][1]:
+
+            windows[-1] = (windows[-1][0], max(stop, windows[-1][1]), windows[-1][2] + [k])
+
+        else:
+
+            windows.append((start, stop, [k]))
+
+    return windows
+
+
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     parser = argparse.ArgumentParser('Get dates of GRBs')
 
     # add the arguments needed to the parser
 
     parser.add_argument("--in_file", help="Name of input file containing grb names", type=str, required=True)
     parser.add_argument("--out_file", help="Name of output file containing dates", type=str, required=True)
+    parser.add_argument("--before", help="If given (with --after), write the windows around the trigger times instead "
+                                         "of the dates: one line for each window (start, duration and names of the "
+                                         "GRBs), with this many seconds before the trigger", type=float, default=None)
+    parser.add_argument("--after", help="Seconds of the window after the trigger", type=float, default=None)
 
     # parse the arguments
     args = parser.parse_args()
 
     grbs = [line.rstrip('\n') for line in open(args.in_file)]
 
-    with open(args.out_file + '.txt', 'w+') as f:
+    if args.before is not None or args.after is not None:
+
+        if args.before is None or args.after is None:
+
+            raise RuntimeError("Both --before and --after are needed for the windows")
+
+        grbs = [grb.strip() for grb in grbs if grb.strip() != '']
+
+        windows = grb_windows([grb_name_to_met(grb) for grb in grbs], args.before, args.after)
+
+        with open(args.out_file + '.txt', 'w+') as f:
+
+            for start, stop, members in windows:
+
+                f.write("%s %s %s\n" % (repr(start), repr(stop - start), ",".join(grbs[k] for k in members)))
+
+        print("%s GRBs in %s windows" % (len(grbs), len(windows)))
+
+    else:
+
+        with open(args.out_file + '.txt', 'w+') as f:
 
-        for i in range(len(grbs) - 1):
+            for i in range(len(grbs) - 1):
 
-            f.write("%s\n" % grb_name_to_date(grbs[i]))
+                f.write("%s\n" % grb_name_to_date(grbs[i]))
 
-        f.write("%s" % grb_name_to_date(grbs[len(grbs) - 1]))
\ No newline at end of file
+            f.write("%s" % grb_name_to_date(grbs[len(grbs) - 1]))
@@ -1,54 +1,474 @@
 #!/usr/bin/env python
 
-"""Every 15 minutes, this script will check for new FT1 files from Fermi (mdcget)
-    run search on farm for 12 hour intervals if new data in an interval is either > 1.2 * old
-    or if it is the last interval of the day
-    then send email to ltf-t for detections from ltf-b"""
+"""Real-time search: every 15 minutes, this script checks for new FT1/FT2 data from Fermi (mdcget), and runs the
+    search (search_for_transients.py, on this machine) on the 12 hour windows whose events grew by more than a factor
+    of 1.2 since their last search, or which have just been completed. The detections are sent by email, each one only
+    once (a window is searched several times while it grows).
+
+    The intervals are 12 hours long and start every 6 hours. Only the data taken after the last check are downloaded
+    (as a new segment), and the number of events ingested in each interval is kept in a state file, so that the script
+    can be stopped and restarted without downloading or searching anything twice. A poll which fails (for example
+    because mdcget fails) is logged and does not stop the script: what it did not complete is done again at the next
+    poll. The search of a window which fails is logged as well, and tried again at the next poll (a complete window is
+    given up after --max_failures attempts), without stopping the other windows. With SULI_TOOLS=local the data come from the local stand-in of mdcget (see
+    SULI.local_tools) and the search uses the local stand-ins as well"""
 
 import argparse
-from subprocess import check_call
-from ltfException import ltfException
-import datetime
+import glob
+import json
+import os
+import shutil
+import subprocess
 import time
-import dateutil
+import traceback
+
+import numpy as np
+from astropy.io import fits
+
+from SULI.execute_command import execute_command
+from SULI.remove_redundant_triggers import read_triggers, write_triggers
+from SULI.time_windows import peak_interval
+from SULI.tool_layer import tool_command
+from SULI.work_within_directory import work_within_directory
+from SULI.profiling import profile_script
+
+# Difference between the UNIX epoch and the MET epoch (2001-01-01 00:00:00 UTC), plus the leap seconds
+# inserted since then (2005, 2008, 2012, 2015, 2016)
+MET_EPOCH_UNIX = 978307200.0
+LEAP_SECONDS = 5.0
+
+
+def unix_to_met(unix_time):
+
+    return unix_time - MET_EPOCH_UNIX + LEAP_SECONDS
+
+
+def load_state(state_file, start_met):
+    """
+    Read the state of the search from the state file, or create a new one if the file does not exist
+
+    :param state_file: path of the state file
+    :param start_met: MET from which data are fetched, if the state is new
+    :return: the state (a dictionary)
+    """
+
+    if os.path.exists(state_file):
+
+        with open(state_file) as f:
+
+            return json.load(f)
+
+    else:
+
+        # segments: list of [ft1, ft2, tstart, tstop] of the data downloaded so far
+        # windows: window start (as a string) -> {'ingested': events in the window,
+        #                                         'searched': events in the window at the time of the last search,
+        #                                         'final': whether the search of the complete window was done,
+        #                                         'notified': [name, peak start, peak stop] of the detections sent,
+        #                                         'failures': failed searches since the last successful one}
+
+        return {'fetched_until': start_met, 'segments': [], 'windows': {}}
+
+
+def save_state(state, state_file):
+    """
+    Write the state to the state file. The file is replaced atomically, so that it is never left half-written
+    """
+
+    temp_file = state_file + '.tmp'
+
+    with open(temp_file, 'w+') as f:
+
+        json.dump(state, f, indent=1, sort_keys=True)
+
+    os.rename(temp_file, state_file)
+
+
+def window_starts(tstart, tstop, window, stride):
+    """
+    Return the starts of all the windows overlapping [tstart, tstop)
+    """
+
+    first = np.floor((tstart - window) / stride + 1) * stride
+
+    return [float(w) for w in np.arange(first, tstop, stride) if w + window > tstart]
+
+
+def fetch_segment(segment_dir, met_start, met_stop):
+    """
+    Download the data taken in [met_start, met_stop) with mdcget
+
+    :return: the names of the new FT1 and FT2 files
+    """
+
+    with work_within_directory(segment_dir):
+
+        before = set(glob.glob("*.fit*"))
+
+        execute_command("%s --met_start %s --met_stop %s" % (tool_command('mdcget'), met_start, met_stop))
+
+        new_files = sorted(set(glob.glob("*.fit*")) - before)
+
+    ft1 = [f for f in new_files if 'ft1' in f]
+    ft2 = [f for f in new_files if 'ft2' in f]
+
+    if len(ft1) != 1 or len(ft2) != 1:
+
+        raise RuntimeError("mdcget produced %s ft1 and %s ft2 files (one of each expected)" % (len(ft1), len(ft2)))
+
+    return os.path.join(segment_dir, ft1[0]), os.path.join(segment_dir, ft2[0])
+
+
+def merge_segments(files, extension, start_column, stop_column, tmin, tmax, out_file):
+    """
+    Write a file with the rows of the given extension (from all the input files) which overlap [tmin, tmax).
+    The other extensions and the headers are taken from the first file, and TSTART/TSTOP are set to the range
+    actually covered.
+    """
+
+    tables = []
+
+    for filename in files:
+
+        with fits.open(filename) as f:
+
+            data = f[extension].data
+
+            idx = (data.field(stop_column) >= tmin) & (data.field(start_column) < tmax)
+
+            tables.append(np.array(data[idx]))
+
+    table = np.concatenate(tables)
+
+    with fits.open(files[0]) as f:
+
+        hdus = [hdu.copy() for hdu in f]
+
+        hdus[f.index_of(extension)] = fits.BinTableHDU(data=table, header=f[extension].header)
+
+        if 'GTI' in [hdu.name for hdu in hdus]:
+
+            hdus[f.index_of('GTI')] = fits.BinTableHDU.from_columns(
+                [fits.Column(name='START', format='D', unit='s', array=[tmin]),
+                 fits.Column(name='STOP', format='D', unit='s', array=[tmax])], header=f['GTI'].header)
+
+    if len(table) > 0 and extension == 'SC_DATA':
+
+        tmin = table[start_column].min()
+        tmax = table[stop_column].max()
+
+    for hdu in hdus:
+
+        hdu.header.set('TSTART', tmin)
+        hdu.header.set('TSTOP', tmax)
+
+    fits.HDUList(hdus).writeto(out_file, overwrite=True)
+
+
+def search_window(state, window_start, window, args):
+    """
+    Build the FT1/FT2 files for a window from the downloaded segments and run the search on it
+
+    :return: path of the detection file
+    """
+
+    window_stop = min(window_start + window, state['fetched_until'])
+
+    segments = [s for s in state['segments'] if s[3] > window_start and s[2] < window_stop]
+
+    # The first windows might start before the first data
+    data_start = max(window_start, min([s[2] for s in segments]))
+
+    work_dir = os.path.join(args.out_dir, 'window_%s' % window_start)
+
+    if not os.path.exists(work_dir):
+
+        os.makedirs(work_dir)
+
+    ft1 = os.path.join(work_dir, 'window_ft1.fits')
+    ft2 = os.path.join(work_dir, 'window_ft2.fits')
+
+    merge_segments([s[0] for s in segments], 'EVENTS', 'TIME', 'TIME', data_start, window_stop, ft1)
+    merge_segments([s[1] for s in segments], 'SC_DATA', 'START', 'STOP', data_start, window_stop, ft2)
+
+    out_file = os.path.join(args.out_dir, '%s_detections.txt' % window_start)
+
+    with work_within_directory(work_dir):
+
+        cmd_line = "search_for_transients.py --inp_fts %s,%s --irf %s --probability %s --min_dist %s " \
+                   "--out_file %s" % (ft1, ft2, args.irf, args.probability, args.min_dist, out_file)
+
+        if args.incremental:
+
+            # The cache of the search lives in the work directory of the window until the window is complete
+            cmd_line += " --incremental --workdir %s" % work_dir
+
+        execute_command(cmd_line)
+
+    return out_file
+
+
+def notify(detection_file, window_state, email):
+    """
+    Send by email the detections of a window which were not sent after a previous search of the same window. A
+    detection was already sent if a detection of the same region with an overlapping peak (see
+    time_windows.peak_interval) is in window_state['notified'], which is updated here once the email is sent
+
+    :param detection_file: the detections of the last search of the window
+    :param window_state: the state of the window
+    :param email: the address to send the detections to (nothing is sent if empty)
+    :return: none
+    """
+
+    with open(detection_file) as f:
+
+        n_detections = len([line for line in f if line.strip() and not line.startswith('#')])
+
+    notified = window_state.setdefault('notified', [])
+
+    new = []
+
+    if n_detections > 0:
+
+        regions = read_triggers(detection_file)
+
+        for k, region in enumerate(regions):
+
+            start, stop = peak_interval(region)
+
+            if not any(name == region['name'] and old_start < stop and start < old_stop
+                       for name, old_start, old_stop in notified):
+
+                new.append((k, start, stop))
+
+    print("%s detections in %s, %s not notified yet" % (n_detections, detection_file, len(new)))
+
+    if len(new) == 0:
+
+        return
+
+    if email:
+
+        new_file = detection_file.rsplit('_detections.txt', 1)[0] + '_new_triggers.txt'
+
+        write_triggers(regions[[k for k, _, _ in new]], new_file)
+
+        status = subprocess.call("mail -s 'SULI real-time search: %s new detections' %s < %s" % (len(new), email,
+                                                                                               new_file), shell=True)
+
+        os.remove(new_file)
+
+        if status != 0:
+
+            # Not recorded as notified: they are sent after the next search of the window
+            raise RuntimeError("Could not send the detections of %s to %s" % (detection_file, email))
+
+    notified.extend([str(regions['name'][k]), start, stop] for k, start, stop in new)
+
+
+def poll(state, met_now, args):
+    """
+    One iteration of the real-time loop: fetch the new data, update the number of events in each window and search
+    the windows which grew enough (or which have just been completed)
+    """
+
+    # Fetch only the data taken since the last poll
+
+    if met_now - state['fetched_until'] >= args.min_segment:
+
+        ft1, ft2 = fetch_segment(args.segment_dir, state['fetched_until'], met_now)
+
+        with fits.open(ft1) as f:
+
+            times = f['EVENTS'].data.field('TIME')
+
+            new_events = [(w, int(np.sum((times >= w) & (times < w + args.window))))
+                          for w in window_starts(state['fetched_until'], met_now, args.window, args.stride)]
+
+        # The state is changed only once the segment has been read, so that a failure leaves it as it was
+        for w, n_events in new_events:
+
+            window_state = state['windows'].setdefault(repr(w), {'ingested': 0, 'searched': 0, 'final': False})
+
+            window_state['ingested'] += n_events
+
+        state['segments'].append([ft1, ft2, state['fetched_until'], met_now])
+
+        state['fetched_until'] = met_now
+
+    # Search the windows which need it
+
+    for key in sorted(state['windows'].keys(), key=float):
+
+        window_state = state['windows'][key]
+
+        window_start = float(key)
+
+        if window_state['final']:
+
+            continue
+
+        complete = state['fetched_until'] >= window_start + args.window
+
+        grown = window_state['ingested'] > args.growth * window_state['searched']
+
+        if complete or (grown and window_state['ingested'] >= args.min_events):
+
+            print("\nSearching window starting at %s (%s events, %s at the previous search)"
+                  % (window_start, window_state['ingested'], window_state['searched']))
+
+            try:
+
+                detection_file = search_window(state, window_start, args.window, args)
+
+                notify(detection_file, window_state, args.email)
+
+            except Exception:
+
+                # The window is searched again at the next poll, and the other windows go on
+                window_state['failures'] = window_state.get('failures', 0) + 1
+
+                print("\nSearch of the window starting at %s failed (%s times in a row):" % (window_start,
+                                                                                            window_state['failures']))
+
+                traceback.print_exc()
+
+                if complete and window_state['failures'] >= args.max_failures:
+
+                    print("Giving up on the window starting at %s" % window_start)
+
+                    window_state['final'] = True
+
+                continue
+
+            window_state['searched'] = window_state['ingested']
+            window_state['final'] = complete
+            window_state['failures'] = 0
+
+    # Forget the windows which are done and the segments which are not needed anymore
+
+    open_windows = [float(k) for k, v in state['windows'].items() if not v['final']]
+
+    oldest_needed = min(open_windows) if len(open_windows) > 0 else state['fetched_until']
+
+    for segment in [s for s in state['segments'] if s[3] <= oldest_needed]:
+
+        state['segments'].remove(segment)
+
+        for filename in segment[:2]:
+
+            if os.path.exists(filename):
+
+                os.remove(filename)
+
+    for key in [k for k, v in state['windows'].items() if v['final']]:
+
+        state['windows'].pop(key)
+
+        work_dir = os.path.join(args.out_dir, 'window_%s' % float(key))
+
+        if os.path.exists(work_dir):
+
+            shutil.rmtree(work_dir)
+
 
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     parser = argparse.ArgumentParser('RTS')
 
     # add the arguments needed to the parser
-    parser.add_argument('--date', help='Date of data to be searched')
-    parser.add_argument('--test', dest='test_run', action='store_true')
-    parser.set_defaults(test_run=False)
+    parser.add_argument('--start_met', help='MET from which data will be searched (default: now - window). Ignored '
+                                            'if the state file already exists', type=float, default=None)
+    parser.add_argument("--out_dir", help="Directory for the results, the state file and the downloaded data",
+                        required=True, type=str)
+    parser.add_argument("--irf", help="Instrument response function name to be used", type=str,
+                        default='P8R2_SOURCE_V6')
+    parser.add_argument("--probability", help="Probability of null hypothesis", type=float, default=1e-5)
+    parser.add_argument("--min_dist", help="Distance above which regions are not considered to overlap", type=float,
+                        required=True)
+    parser.add_argument("--window", help="Length of the windows (default: 12 hours)", type=float, default=43200.0)
+    parser.add_argument("--stride", help="Time between the starts of two windows (default: 6 hours)", type=float,
+                        default=21600.0)
+    parser.add_argument("--growth", help="A window is searched again when its events grow by this factor",
+                        type=float, default=1.2)
+    parser.add_argument("--min_events", help="Do not search windows with fewer events than this, unless they are "
+                                             "complete", type=int, default=100)
+    parser.add_argument("--poll", help="Seconds between two checks for new data (default: 15 minutes)", type=float,
+                        default=900.0)
+    parser.add_argument("--min_segment", help="Do not fetch segments shorter than this (seconds)", type=float,
+                        default=60.0)
+    parser.add_argument("--incremental", help="Search windows incrementally (in-process search which reuses the "
+                                              "results of the previous search of the same window)",
+                        action='store_true')
+    parser.add_argument("--email", help="If defined, detections are sent to this address", type=str, default='')
+    parser.add_argument("--max_failures", help="Give up on a complete window after this many failed searches "
+                                               "(default: 3)", type=int, default=3)
+    parser.add_argument("--clock_start", help="For testing: MET of the simulated clock when the script starts "
+                                              "(default: use the real clock)", type=float, default=None)
+    parser.add_argument("--clock_speed", help="For testing: speed of the simulated clock", type=float, default=1.0)
+    parser.add_argument("--n_polls", help="Stop after this many polls (default: run forever)", type=int,
+                        default=None)
 
     # parse the arguments
     args = parser.parse_args()
 
-    from GtBurst.dataHandling import date2met
+    args.out_dir = os.path.abspath(os.path.expandvars(os.path.expanduser(args.out_dir)))
+
+    if not os.path.exists(args.out_dir):
+
+        raise IOError("You need to create the directory %s before running this script" % args.out_dir)
+
+    args.segment_dir = os.path.join(args.out_dir, 'segments')
+
+    if not os.path.exists(args.segment_dir):
+
+        os.mkdir(args.segment_dir)
+
+    wall_start = time.time()
+
+    def met_now():
+
+        if args.clock_start is None:
+
+            return unix_to_met(time.time())
+
+        else:
+
+            return args.clock_start + (time.time() - wall_start) * args.clock_speed
+
+    state_file = os.path.join(args.out_dir, 'realtime_state.json')
+
+    start_met = args.start_met if args.start_met is not None else met_now() - args.window
+
+    state = load_state(state_file, start_met)
+
+    n_polls = 0
+
+    n_failed = 0
+
+    while args.n_polls is None or n_polls < args.n_polls:
+
+        try:
+
+            poll(state, met_now(), args)
 
-    # Check that the date is a valid date
-    try:
+        except Exception:
 
-        validated = dateutil.parser.parse(args.date).isoformat().replace("T", " ")
-    except:
+            # A transient failure (mdcget, the search...) must not stop the script. The steps of the poll which
+            # completed are in the state, the others are tried again at the next poll
+            n_failed += 1
 
-        raise ltfException("Invalid ISO date")
+            print("\nPoll failed (%s failed polls so far), retrying at the next poll:" % n_failed)
 
-    # check each of the defined intervals
-    def check_int(met_start):
+            traceback.print_exc()
 
-        check_call("mdcget --met_start %s --met_stop %s") % (met_start, met_start + 43200)
+        save_state(state, state_file)
 
-    # interval 1 begins at 00:00:00
-    met_start_1 = date2met(validated)
-    check_call("mdcget --met_start %s --met_stop %s") % (met_start_1, met_start_1 + 43200)
-    pass
+        n_polls += 1
 
-    ''''# interval 2 begins at 06:00:00
-    met_start_2 = met_start_1 + 21600
-    check_call("mdcget --met_start %s --met_stop %s") % (met_start_2, met_start_2 + 43200)
-    pass
+        if args.n_polls is None or n_polls < args.n_polls:
 
-    # interval 3 begins at 12:00:00
-    met_start_3 = met_start_1 + 43200
-    check_call("mdcget --met_start %s --met_stop %s") % (met_start_3, met_start_3 + 43200'''
+            time.sleep(args.poll)
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+def ncp_prior_from_probability(n_events, p0):
+    """
+    Prior on the number of change points for a given false positive probability (Scargle et al. 2013, eq. 21)
+
+    :param n_events: number of events in the light curve
+    :param p0: probability of detecting a spurious change point
+    :return: the value of the prior
+    """
+
+    return 4.0 - np.log(73.53 * p0 * max(n_events, 1) ** -0.478)
+
+
+def bayesian_blocks(times, tstart, tstop, p0=0.05, ncp_prior=None):
+    """
+    Optimal segmentation of a list of events in blocks with constant rate (Scargle et al. 2013, event mode)
+
+    :param times: arrival times of the events (sorted)
+    :param tstart: start of the observation
+    :param tstop: end of the observation
+    :param p0: false positive probability, used to compute the prior if ncp_prior is None
+    :param ncp_prior: prior on the number of change points (if None, it is computed from p0)
+    :return: the edges of the blocks (a np.array starting with tstart and ending with tstop)
+    """
+
+    if ncp_prior is None:
+
+        ncp_prior = ncp_prior_from_probability(len(times), p0)
+
+    edges, best, last = update_bayesian_blocks(times, tstart, tstop, ncp_prior)
+
+    return edges
+
+
+def update_bayesian_blocks(times, tstart, tstop, ncp_prior, best=None, last=None):
+    """
+    Same as bayesian_blocks, but reusing the partial results of a previous call made on a prefix of the same
+    list of events (with the same tstart and ncp_prior). The optimal partition of the first r cells only depends on
+    the events up to r + 1, so when events are appended only the new cells (and the last old one, whose edge
+    was tstop) need to be optimized. The result is identical to the one of a call on the full list.
+
+    :param times: arrival times of the events (sorted), starting with the events of the previous call
+    :param tstart: start of the observation
+    :param tstop: end of the observation
+    :param ncp_prior: prior on the number of change points
+    :param best: the best array returned by the previous call (or None to start from scratch)
+    :param last: the last array returned by the previous call (or None to start from scratch)
+    :return: (edges of the blocks, best, last), where best and last can be used for the next update
+    """
+
+    times = np.asarray(times, dtype=float)
+
+    n_events = len(times)
+
+    if n_events == 0:
+
+        return np.array([tstart, tstop]), np.zeros(0), np.zeros(0, dtype=int)
+
+    # Each event is in its own cell, which extends half-way to the neighbouring events
+    edges = np.concatenate(([tstart], 0.5 * (times[1:] + times[:-1]), [tstop]))
+
+    # Results for the cells which do not touch the end of the previous observation can be reused
+    n_reused = 0 if best is None else min(max(len(best) - 1, 0), n_events - 1)
+
+    new_best = np.zeros(n_events, dtype=float)
+    new_last = np.zeros(n_events, dtype=int)
+
+    if n_reused > 0:
+
+        new_best[:n_reused] = best[:n_reused]
+        new_last[:n_reused] = last[:n_reused]
+
+    best = new_best
+    last = new_last
+
+    for r in range(n_reused, n_events):
+
+        # Length and number of events of the blocks going from cell k to cell r, for all k <= r
+        width = np.maximum(edges[r + 1] - edges[:r + 1], 1e-10)
+        count = np.arange(r + 1, 0, -1, dtype=float)
+
+        fit = count * (np.log(count) - np.log(width)) - ncp_prior
+
+        fit[1:] += best[:r]
+
+        last[r] = np.argmax(fit)
+        best[r] = fit[last[r]]
+
+    # Go backward through last[] to find the change points
+    change_points = []
+
+    index = n_events
+
+    while index > 0:
+
+        change_points.append(index)
+
+        index = last[index - 1]
+
+    change_points.append(0)
+
+    return edges[np.array(change_points[::-1])], best, last
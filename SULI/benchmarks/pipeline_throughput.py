@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""This script runs the whole chain simulate -> split -> search -> dedup -> flag on one machine, using the local
+    stand-ins of the Fermi tools (see SULI.local_tools), and reports how long each stage takes. It is meant to measure
+    the end-to-end throughput of the pipeline and to test changes to the scripts without access to the farm"""
+
+import argparse
+import glob
+import os
+import time
+
+import SULI
+from SULI.benchmarks.synthetic import make_ft2
+from SULI.execute_command import execute_command
+from SULI.work_within_directory import work_within_directory
+
+# execute only if run from command line
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser('Run the pipeline end-to-end with the local stand-ins of the Fermi tools')
+
+    parser.add_argument("--out_dir", help="Directory where to run the pipeline (it must exist)", required=True,
+                        type=str)
+    parser.add_argument("--n_days", help="Number of days to simulate (default: 2)", type=int, default=2)
+    parser.add_argument("--tstart", help="Start time (MET) of the simulation", type=float, default=400000000.0)
+    parser.add_argument("--rate", help="Rate of the simulated background (events/s)", type=float, default=0.5)
+    parser.add_argument("--flares", help="Number of simulated transients per day", type=float, default=2.0)
+    parser.add_argument("--probability", help="Probability of null hypothesis", type=float, default=1e-5)
+    parser.add_argument("--min_dist", help="Distance above which regions are not considered to overlap", type=float,
+                        default=15.0)
+
+    args = parser.parse_args()
+
+    out_dir = os.path.abspath(os.path.expandvars(os.path.expanduser(args.out_dir)))
+
+    if not os.path.exists(out_dir):
+
+        raise IOError("You need to create the directory %s before running this script" % out_dir)
+
+    # Use the stand-ins, and make sure the SULI scripts can be found by the scripts calling them
+
+    os.environ['SULI_TOOLS'] = 'local'
+    os.environ['SULI_LOCAL_RATE'] = str(args.rate)
+    os.environ['SULI_LOCAL_FLARES'] = str(args.flares)
+    os.environ['PATH'] = os.path.dirname(os.path.abspath(SULI.__file__)) + os.pathsep + os.environ['PATH']
+
+    duration = args.n_days * 86400.0
+
+    timings = []
+
+    with work_within_directory(out_dir):
+
+        for directory in ('source', 'simulation', 'days', 'detections'):
+
+            if not os.path.exists(directory):
+
+                os.mkdir(directory)
+
+        # Inputs: a FT2 file covering the whole simulation and an (empty) source model
+
+        in_ft2 = os.path.abspath('input_ft2.fits')
+
+        make_ft2(in_ft2, args.tstart - 20000.0, args.tstart + duration + 20000.0)
+
+        for filename in ('xml_files.txt', 'source_names.txt'):
+
+            open(os.path.join('source', filename), 'w+').close()
+
+        # Simulate all the days as one FT1 file, so that the splitting stage has something to do
+
+        start = time.time()
+
+        with work_within_directory('simulation'):
+
+            execute_command("sim_day_fits.py --tstart %s --in_ft2 %s --src_dir %s --n_days 1 --interval %s "
+                            "--seed_mult 1" % (args.tstart, in_ft2, os.path.abspath('../source'), duration))
+
+            sim_ft1 = os.path.abspath(glob.glob("simulated_*_ft1.fits")[0])
+
+        timings.append(('simulate', time.time() - start))
+
+        start = time.time()
+
+        with work_within_directory('days'):
+
+            execute_command("get_day_fits.py --in_ft1 %s --in_ft2 %s --buffer 10000 --evclass 128" % (sim_ft1,
+                                                                                                      in_ft2))
+
+            day_ft1s = sorted(glob.glob("*_ft1.fit"))
+            day_ft2s = sorted(glob.glob("*_ft2.fit"))
+
+        timings.append(('split', time.time() - start))
+
+        start = time.time()
+
+        with work_within_directory('detections'):
+
+            for ft1, ft2 in zip(day_ft1s, day_ft2s):
+
+                out_name = ft1.replace('_ft1.fit', '_detections.txt')
+
+                execute_command("search_for_transients.py --inp_fts %s,%s --irf P8R2_SOURCE_V6 --probability %s "
+                                "--min_dist %s --out_file %s" % (os.path.join(out_dir, 'days', ft1),
+                                                                 os.path.join(out_dir, 'days', ft2),
+                                                                 args.probability, args.min_dist, out_name))
+
+        timings.append(('search+dedup', time.time() - start))
+
+        start = time.time()
+
+        execute_command("flag_detections.py --directory %s --out_file flagged_days" % os.path.abspath('detections'))
+
+        timings.append(('flag', time.time() - start))
+
+    print("\n%-14s %12s %12s" % ('stage', 'time (s)', 'days/hour'))
+
+    for stage, elapsed in timings:
+
+        print("%-14s %12.2f %12.1f" % (stage, elapsed, args.n_days / elapsed * 3600.0))
+
+    total = sum(elapsed for stage, elapsed in timings)
+
+    print("%-14s %12.2f %12.1f" % ('total', total, args.n_days / total * 3600.0))
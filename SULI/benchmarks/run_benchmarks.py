@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+
+"""This script measures the execution time and the memory usage of the python parts of the pipeline (deduplication
+    of triggers, aggregation of detection files, splitting of a FT1 file in days with SULI.time_index as
+    get_day_fits.py --use_index does, and validation of FT1/FT2 pairs) on synthetic inputs of increasing size. No Fermi
+    tool is needed. Each measurement runs in its own process, so that the memory figures of different cases do not
+    contaminate each other, and a case whose process dies (for example, out of memory) is reported as failed.
+
+    The sizes go from 10^2 to 10^6 rows, except for the deduplication, which stops at 300 triggers by default:
+    check_nearest compares every pair of triggers with astropy's SkyCoord, so its time grows as n^2 (about 7 minutes
+    for 1000 triggers already). Use --dedup_sizes (or --sizes) to run it on larger lists."""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from astropy.io import fits
+
+from SULI.benchmarks import synthetic
+from SULI.check_ft_pair import check_ft_pair
+from SULI.flag_detections import get_detection_files, flag_days
+from SULI.remove_redundant_triggers import check_nearest
+from SULI.time_index import index_file_name, load_index, cut_file
+
+try:
+
+    from Queue import Empty
+
+except ImportError:
+
+    # Python 3
+    from queue import Empty
+
+try:
+
+    import resource
+
+except ImportError:
+
+    # Not available on Windows
+    resource = None
+
+try:
+
+    import tracemalloc
+
+except ImportError:
+
+    # Python 2
+    tracemalloc = None
+
+
+def split_in_days(ft1, interval, out_root):
+    """
+    Cut a FT1 file in intervals of the given length as get_day_fits.py --use_index does: the time index of the file is
+    built (see SULI.time_index), then the rows of each interval (TIME >= start && TIME =< stop) are copied to a new
+    file with cut_file
+
+    :param ft1: the input FT1 file
+    :param interval: length of the intervals
+    :param out_root: root for the names of the output files
+    :return: number of files written
+    """
+
+    # Every execution builds the index, as the first use of a file does
+    if os.path.exists(index_file_name(ft1)):
+
+        os.remove(index_file_name(ft1))
+
+    index = load_index(ft1, build=True)
+
+    with fits.open(ft1) as f:
+
+        tstart = f[0].header['TSTART']
+        tstop = f[0].header['TSTOP']
+
+    n_intervals = int(np.ceil((tstop - tstart) / interval))
+
+    for i in range(n_intervals):
+
+        this_start = tstart + i * interval
+
+        cut_file(ft1, "%s_%s_ft1.fit" % (out_root, i), this_start, this_start + interval, index)
+
+    return n_intervals
+
+
+def setup_dedup(n_rows, workdir, seed):
+
+    regions = synthetic.make_triggers(n_rows, seed=seed)
+
+    return lambda: check_nearest(regions, 1.0)
+
+
+def setup_aggregation(n_rows, workdir, seed):
+
+    synthetic.make_detection_files(workdir, n_rows, n_days=min(365, max(1, n_rows)), seed=seed)
+
+    return lambda: flag_days(workdir, get_detection_files(workdir), 1)
+
+
+def setup_splitting(n_rows, workdir, seed):
+
+    ft1 = os.path.join(workdir, 'bench_ft1.fits')
+    ft2 = os.path.join(workdir, 'bench_ft2.fits')
+
+    synthetic.make_ft_pair(ft1, ft2, 0.0, 10 * 86400.0, n_events=n_rows, seed=seed)
+
+    return lambda: split_in_days(ft1, 86400.0, os.path.join(workdir, 'day'))
+
+
+def setup_validation(n_rows, workdir, seed):
+
+    ft1 = os.path.join(workdir, 'bench_ft1.fits')
+    ft2 = os.path.join(workdir, 'bench_ft2.fits')
+
+    # Keep the FT2 proportional to the FT1, with ~10 events per FT2 interval
+    synthetic.make_ft_pair(ft1, ft2, 0.0, 86400.0, n_events=n_rows, ft2_step=max(86400.0 / n_rows * 10, 1e-3),
+                           seed=seed)
+
+    return lambda: check_ft_pair(ft1, ft2)
+
+
+# name: (set-up function, default sizes). The deduplication is O(n^2) with SkyCoord: larger sizes take minutes to hours
+BENCHMARKS = {'dedup': (setup_dedup, [100, 300]),
+              'aggregation': (setup_aggregation, [100, 1000, 10000, 100000, 1000000]),
+              'splitting': (setup_splitting, [100, 1000, 10000, 100000, 1000000]),
+              'validation': (setup_validation, [100, 1000, 10000, 100000, 1000000])}
+
+
+def peak_memory_mb():
+    """
+    Return the peak resident memory of this process, in MB (or nan if it cannot be measured)
+    """
+
+    if resource is None:
+
+        return np.nan
+
+    # ru_maxrss is in kB on Linux and in bytes on Mac OS
+    factor = 1024.0 ** 2 if sys.platform == 'darwin' else 1024.0
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / factor
+
+
+def wait_for_result(process, queue, poll=1.0):
+    """
+    Wait for the result of a benchmark case, without blocking forever if its process dies without putting it in the
+    queue (for example, when it is killed because it ran out of memory)
+
+    :return: the result put in the queue by run_case, or None if the process died without it
+    """
+
+    while True:
+
+        try:
+
+            return queue.get(timeout=poll)
+
+        except Empty:
+
+            if not process.is_alive():
+
+                # The result might have arrived just before the process exited
+                try:
+
+                    return queue.get(timeout=poll)
+
+                except Empty:
+
+                    return None
+
+
+def run_case(name, n_rows, seed, repeat, queue):
+    """
+    Set up and execute one benchmark case. This is executed in a child process.
+
+    :return: none (the result is put in the queue as (best time, peak memory in MB))
+    """
+
+    workdir = tempfile.mkdtemp(prefix='suli_bench_')
+
+    try:
+
+        setup, _ = BENCHMARKS[name]
+
+        timed_function = setup(n_rows, workdir, seed)
+
+        # The function under test might print a lot (check_nearest does), and we do not want to time the terminal
+        sys.stdout.flush()
+        original_stdout = os.dup(1)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+
+        try:
+
+            memory_before = peak_memory_mb()
+
+            if tracemalloc is not None:
+
+                tracemalloc.start()
+
+            times = []
+
+            for i in range(repeat):
+
+                start = time.time()
+
+                timed_function()
+
+                times.append(time.time() - start)
+
+            if tracemalloc is not None:
+
+                peak_memory = tracemalloc.get_traced_memory()[1] / 1024.0 ** 2
+
+                tracemalloc.stop()
+
+            else:
+
+                # Only the increase with respect to the peak reached during the set-up can be seen
+                peak_memory = peak_memory_mb() - memory_before
+
+        finally:
+
+            sys.stdout.flush()
+            os.dup2(original_stdout, 1)
+            os.close(devnull)
+            os.close(original_stdout)
+
+        queue.put((min(times), peak_memory))
+
+    except Exception as e:
+
+        queue.put(("%s: %s" % (type(e).__name__, e), np.nan))
+
+    finally:
+
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# execute only if run from command line
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser('Benchmark the python stages of the pipeline on synthetic data')
+
+    parser.add_argument("--benchmarks", help="Comma-separated list of benchmarks to run (default: all of %s)"
+                                             % ",".join(sorted(BENCHMARKS.keys())),
+                        type=str, default=",".join(sorted(BENCHMARKS.keys())))
+    parser.add_argument("--sizes", help="Comma-separated list of numbers of rows to use for all the benchmarks "
+                                        "(default: a different list for each benchmark, up to 10^6 rows, or "
+                                        "300 for dedup)", type=str, default=None)
+    parser.add_argument("--dedup_sizes", help="Comma-separated list of numbers of triggers for the dedup benchmark "
+                                              "(overrides --sizes for it; default: 100,300, since its time grows as "
+                                              "n^2)", type=str, default=None)
+    parser.add_argument("--max_rows", help="Skip the cases with more rows than this", type=int, default=None)
+    parser.add_argument("--repeat", help="Number of executions for each case (the best time is kept)", type=int,
+                        default=3)
+    parser.add_argument("--seed", help="Seed for the generation of the synthetic data", type=int, default=0)
+    parser.add_argument("--out_file", help="If defined, name of the text file where to save the results", type=str,
+                        default='')
+
+    args = parser.parse_args()
+
+    results = []
+
+    failures = []
+
+    print("%-12s %10s %12s %14s" % ('benchmark', 'rows', 'time (s)', 'peak mem (MB)'))
+
+    for name in args.benchmarks.split(","):
+
+        if name not in BENCHMARKS:
+
+            raise RuntimeError("Unknown benchmark %s. Available: %s" % (name, ",".join(sorted(BENCHMARKS.keys()))))
+
+        if name == 'dedup' and args.dedup_sizes is not None:
+
+            sizes = [int(float(x)) for x in args.dedup_sizes.split(",")]
+
+        elif args.sizes is not None:
+
+            sizes = [int(float(x)) for x in args.sizes.split(",")]
+
+        else:
+
+            sizes = BENCHMARKS[name][1]
+
+        for n_rows in sizes:
+
+            if args.max_rows is not None and n_rows > args.max_rows:
+
+                continue
+
+            queue = multiprocessing.Queue()
+
+            process = multiprocessing.Process(target=run_case, args=(name, n_rows, args.seed, args.repeat, queue))
+            process.start()
+
+            result = wait_for_result(process, queue)
+
+            process.join()
+
+            if result is None:
+
+                result = ("the process died with exit code %s" % process.exitcode, np.nan)
+
+            elapsed, memory = result
+
+            if not isinstance(elapsed, float):
+
+                # Reported, and the other cases go on
+                print("%-12s %10s  FAILED: %s" % (name, n_rows, elapsed))
+
+                failures.append((name, n_rows))
+
+                elapsed = np.nan
+
+            else:
+
+                print("%-12s %10s %12.4f %14.2f" % (name, n_rows, elapsed, memory))
+
+            results.append((name, n_rows, elapsed, memory))
+
+    if args.out_file:
+
+        with open(args.out_file, 'w+') as f:
+
+            f.write("# benchmark rows time peak_memory_mb\n")
+
+            for result in results:
+
+                f.write("%s %s %s %s\n" % result)
+
+    if len(failures) > 0:
+
+        raise RuntimeError("%s benchmark cases failed: %s" % (len(failures), ", ".join("%s with %s rows" % failure
+                                                                                       for failure in failures)))
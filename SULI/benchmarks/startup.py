@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""This script measures the start-up time of the entry points of the pipeline: each script is run with --help in a
+    fresh interpreter, which executes all its module-level imports and nothing else. For each entry point it reports
+    the time and which of the slow-to-import modules got loaded, and it estimates the time saved by the slow modules
+    which the script (or the SULI modules it imports) imports only where they are needed. It also measures the
+    resolution of executables with SULI.which (PATH search and memoized)"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import SULI
+
+# Modules which are slow to import, and that the scripts import only where they need them
+HEAVY_MODULES = ['numpy', 'astropy.io.fits', 'astropy.coordinates', 'GtApp']
+
+ENTRY_POINTS = ['search_on_farm.py', 'search_for_transients.py', 'simulate_in_the_farm.py', 'sim_day_fits.py',
+                'get_day_fits.py', 'remove_redundant_triggers.py', 'flag_detections.py', 'group_search.py',
+                'submit_a_search.py', 'submit_a_range.py', 'check_sim_results.py', 'Realtime_BB_Search.py',
+                'submit_far_campaign.py', 'far_campaign_job.py', 'collect_results.py', 'cross_match.py',
+                'campaign_metrics.py']
+
+# Code executed in the child process: run the script with --help and report the time and the heavy modules loaded
+_RUN_SCRIPT = """
+import json, os, runpy, sys, time
+script = sys.argv[1]
+heavy = sys.argv[2].split(',')
+sys.argv = [script, '--help']
+start = time.time()
+stdout = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+try:
+    runpy.run_path(script, run_name='__main__')
+except SystemExit:
+    pass
+sys.stdout = stdout
+print(json.dumps({'time': time.time() - start, 'loaded': [m for m in heavy if m in sys.modules]}))
+"""
+
+_IMPORT_MODULE = """
+import json, sys, time
+start = time.time()
+try:
+    __import__(sys.argv[1])
+    print(json.dumps(time.time() - start))
+except ImportError:
+    print(json.dumps(None))
+"""
+
+
+def deferred_imports(path, seen=None):
+    """
+    Return the heavy modules imported inside functions or branches (indented import statements) by the given
+    source file or by the SULI modules it imports at module level
+
+    :param path: path of the python file
+    :return: a set of module names (from HEAVY_MODULES)
+    """
+
+    seen = set() if seen is None else seen
+
+    seen.add(path)
+
+    deferred = set()
+
+    with open(path) as f:
+
+        for line in f:
+
+            match = re.match(r'(\s*)(?:from\s+([\w.]+)\s+)?import\s+([\w.]+)', line)
+
+            if match is None:
+
+                continue
+
+            indented = len(match.group(1)) > 0
+
+            # "from astropy.io import fits" imports astropy.io.fits
+            module = match.group(3) if match.group(2) is None else match.group(2)
+            names = [module] if match.group(2) is None else [module, "%s.%s" % (module, match.group(3))]
+
+            if indented:
+
+                deferred.update(m for m in HEAVY_MODULES for name in names if name == m or name.startswith(m + '.'))
+
+            elif module.startswith('SULI.'):
+
+                other = os.path.join(os.path.dirname(os.path.abspath(SULI.__file__)),
+                                     *module.split('.')[1:]) + '.py'
+
+                if os.path.exists(other) and other not in seen:
+
+                    deferred.update(deferred_imports(other, seen))
+
+    return deferred
+
+
+def _child_env():
+
+    env = dict(os.environ)
+
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(SULI.__file__)))
+
+    env['PYTHONPATH'] = package_dir + os.pathsep + env.get('PYTHONPATH', '')
+
+    return env
+
+
+def _median(values):
+
+    values = sorted(values)
+
+    return values[len(values) // 2]
+
+
+def module_import_time(module, repeat):
+    """
+    Median time needed to import the given module in a fresh interpreter (None if it cannot be imported)
+    """
+
+    times = []
+
+    for i in range(repeat):
+
+        output = subprocess.check_output([sys.executable, '-c', _IMPORT_MODULE, module], env=_child_env())
+
+        times.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    if None in times:
+
+        return None
+
+    return _median(times)
+
+
+def entry_point_start_up(script, repeat):
+    """
+    Median start-up time of the given script, and the list of heavy modules it loads
+    """
+
+    times = []
+    loaded = []
+
+    for i in range(repeat):
+
+        output = subprocess.check_output([sys.executable, '-c', _RUN_SCRIPT, script, ",".join(HEAVY_MODULES)],
+                                         env=_child_env())
+
+        result = json.loads(output.decode().strip().splitlines()[-1])
+
+        times.append(result['time'])
+        loaded = result['loaded']
+
+    return _median(times), loaded
+
+
+def which_timings(program, repeat):
+    """
+    Time the resolution of program with a PATH search and with the memoized which
+    """
+
+    from SULI import which
+
+    # Make sure the program can be found, after all the other entries of the PATH
+    old_path = os.environ['PATH']
+
+    os.environ['PATH'] = old_path + os.pathsep + os.path.dirname(os.path.abspath(SULI.__file__))
+
+    try:
+
+        start = time.time()
+
+        for i in range(repeat):
+
+            which._search_path(program)
+
+        path_search = (time.time() - start) / repeat
+
+        which.which(program)
+
+        start = time.time()
+
+        for i in range(repeat):
+
+            which.which(program)
+
+        memoized = (time.time() - start) / repeat
+
+    finally:
+
+        os.environ['PATH'] = old_path
+
+    return path_search, memoized
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser('Measure the start-up time of the SULI entry points')
+
+    parser.add_argument("--scripts", help="Entry points to measure (default: all)", nargs='+', type=str,
+                        default=ENTRY_POINTS)
+    parser.add_argument("--repeat", help="Number of repetitions for each measurement (the median is reported)",
+                        type=int, default=5)
+    parser.add_argument("--out_file", help="If given, write the results to this file (JSON)", type=str, default=None)
+
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(SULI.__file__))
+
+    print("Import time of the heavy modules (fresh interpreter):")
+
+    import_times = {}
+
+    for module in HEAVY_MODULES:
+
+        import_times[module] = module_import_time(module, args.repeat)
+
+        print("    %-22s %s" % (module, "not available" if import_times[module] is None
+                                 else "%.3f s" % import_times[module]))
+
+    def cost(modules):
+
+        return sum(import_times[m] for m in modules if import_times[m] is not None)
+
+    eager_cost = max(cost(HEAVY_MODULES), 1e-9)
+
+    print("\n%-30s %10s %10s   %s" % ('entry point', 'start-up', 'saved', 'heavy modules loaded'))
+
+    results = []
+
+    for script in args.scripts:
+
+        elapsed, loaded = entry_point_start_up(os.path.join(script_dir, script), args.repeat)
+
+
+        # Rough estimate: what the deferred modules which were not loaded would have cost on their own (they share
+        # dependencies, so this is an upper bound)
+        path = os.path.join(script_dir, script)
+
+        saved = min(cost([m for m in deferred_imports(path) if m not in loaded]), eager_cost)
+
+        print("%-30s %9.3fs %9.3fs   %s" % (script, elapsed, saved, ", ".join(loaded) if loaded else '-'))
+
+        results.append({'script': script, 'start_up': elapsed, 'saved': saved, 'loaded': loaded})
+
+    path_search, memoized = which_timings('search_on_farm.py', args.repeat * 100)
+
+    print("\nResolution of an executable with SULI.which:")
+    print("    PATH search        %.1f us" % (path_search * 1e6))
+    print("    memoized           %.1f us" % (memoized * 1e6))
+
+    if args.out_file is not None:
+
+        with open(args.out_file, 'w+') as f:
+
+            json.dump({'import_times': import_times, 'entry_points': results,
+                       'which': {'path_search': path_search, 'memoized': memoized}},
+                      f, indent=1, sort_keys=True)
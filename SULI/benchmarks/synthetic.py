@@ -0,0 +1,315 @@
+"""Deterministic generators of synthetic inputs for the benchmarks: trigger lists in the ltfsearch format,
+    detection files like the ones produced by search_for_transients, and small FT1/FT2 pairs.
+    The same seed always produces the same data, so timings taken on different machines or commits
+    refer to identical inputs"""
+
+import os
+import numpy as np
+from astropy.io import fits
+
+from SULI.region_search import sky_lattice
+from SULI.remove_redundant_triggers import TRIGGER_DTYPE, write_triggers
+
+
+def isotropic_directions(n_points, rng):
+    """
+    Return n_points random directions drawn from an isotropic distribution
+
+    :param n_points: number of directions
+    :param rng: a np.random.RandomState instance
+    :return: (ra, dec) arrays in degrees
+    """
+
+    ra = rng.uniform(0.0, 360.0, n_points)
+    dec = np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, n_points)))
+
+    return ra, dec
+
+
+def scatter_directions(ra, dec, sigma, rng):
+    """
+    Displace the input directions by a gaussian offset with standard deviation sigma (degrees)
+
+    :param ra: R.A. of the input directions (degrees)
+    :param dec: Dec. of the input directions (degrees)
+    :param sigma: standard deviation of the offset, in degrees
+    :param rng: a np.random.RandomState instance
+    :return: (ra, dec) arrays in degrees
+    """
+
+    new_dec = np.clip(dec + rng.normal(0.0, sigma, len(dec)), -89.999, 89.999)
+    new_ra = np.mod(ra + rng.normal(0.0, sigma, len(ra)) / np.cos(np.radians(new_dec)), 360.0)
+
+    return new_ra, new_dec
+
+
+def make_triggers(n_triggers, n_clusters=None, cluster_radius=0.5, max_bins=5, tstart=0.0, duration=86400.0,
+                  seed=0):
+    """
+    Generate a trigger list in the format produced by ltfsearch
+
+    Triggers are grouped in clusters, which are placed on a regular lattice on the sky so that different clusters
+    never overlap (as long as n_clusters is not too large). All the triggers of a cluster share the same time bins
+    (each uses the first 1 to n_bins of them) and the same shape of the light curve, like multiple overlapping regions
+    of ltfsearch triggering on the same transient.
+
+    :param n_triggers: number of triggers (rows) to generate
+    :param n_clusters: number of clusters (default: one every 10 triggers)
+    :param cluster_radius: dispersion of the positions of the triggers around the center of their cluster (degrees)
+    :param max_bins: maximum number of time bins of a trigger
+    :param tstart: start of the time interval containing the triggers
+    :param duration: length of the time interval containing the triggers
+    :param seed: seed for the random number generator
+    :return: the trigger list (a np.recarray with dtype TRIGGER_DTYPE)
+    """
+
+    rng = np.random.RandomState(seed)
+
+    if n_clusters is None:
+
+        n_clusters = max(1, n_triggers // 10)
+
+    center_ra, center_dec = sky_lattice(n_clusters)
+
+    # For each cluster, pre-compute the strings describing the first 1, 2, ..., n_bins time bins
+
+    cluster_columns = []
+
+    for c in range(n_clusters):
+
+        n_bins = rng.randint(1, max_bins + 1)
+
+        widths = rng.uniform(10.0, 1000.0, n_bins)
+
+        t0 = tstart + rng.uniform(0.0, max(duration - widths.sum(), 0.0))
+
+        edges = t0 + np.concatenate(([0.0], np.cumsum(widths)))
+
+        counts = rng.randint(1, 100, n_bins)
+
+        probabilities = 10 ** rng.uniform(-9, -5, n_bins)
+
+        prefixes = []
+
+        for n in range(1, n_bins + 1):
+
+            prefixes.append((",".join(map(repr, edges[:n])),
+                             ",".join(map(repr, edges[1:n + 1])),
+                             counts[:n],
+                             ",".join(map(lambda x: "%.3g" % x, probabilities[:n]))))
+
+        cluster_columns.append(prefixes)
+
+    membership = rng.randint(0, n_clusters, n_triggers)
+
+    ra, dec = scatter_directions(center_ra[membership], center_dec[membership], cluster_radius, rng)
+
+    # An integer scale factor keeps the position of the brightest bin the same for all the members of a cluster
+    scales = rng.randint(1, 5, n_triggers)
+    bin_draws = rng.uniform(0.0, 1.0, n_triggers)
+
+    triggers = np.recarray((n_triggers,), dtype=TRIGGER_DTYPE)
+
+    triggers.ra = ra
+    triggers.dec = dec
+
+    for i in range(n_triggers):
+
+        prefixes = cluster_columns[membership[i]]
+
+        tstarts, tstops, counts, probabilities = prefixes[int(bin_draws[i] * len(prefixes))]
+
+        triggers.name[i] = "region_%s" % i
+        triggers.tstarts[i] = tstarts
+        triggers.tstops[i] = tstops
+        triggers.counts[i] = ",".join(map(str, counts * scales[i]))
+        triggers.probabilities[i] = probabilities
+
+    return triggers
+
+
+def make_detection_files(directory, n_detections, n_days=365, tstart=0.0, interval=86400.0, seed=0):
+    """
+    Write one detection file per day (like the output of search_for_transients), distributing n_detections
+    among them at random. Some days may have no detections, in which case the file only has the header.
+
+    :param directory: directory where the files will be written (it must exist)
+    :param n_detections: total number of detections
+    :param n_days: number of day files
+    :param tstart: start time of the first day
+    :param interval: length of a day
+    :param seed: seed for the random number generator
+    :return: list of the paths of the files written
+    """
+
+    rng = np.random.RandomState(seed)
+
+    days = np.sort(rng.randint(0, n_days, n_detections))
+
+    boundaries = np.searchsorted(days, np.arange(n_days + 1))
+
+    filenames = []
+
+    for d in range(n_days):
+
+        day_start = tstart + d * interval
+
+        n_today = boundaries[d + 1] - boundaries[d]
+
+        triggers = make_triggers(n_today, tstart=day_start, duration=interval, seed=seed + d + 1)
+
+        filename = os.path.join(directory, '%s_detections.txt' % day_start)
+
+        write_triggers(triggers, filename)
+
+        filenames.append(filename)
+
+    return filenames
+
+
+def make_ft1(ft1, tstart, duration, n_events=None, rate=1.0, sources=None, flares=None, proc_ver=302, seed=0):
+    """
+    Write a FT1 file with the columns used by the SULI scripts
+
+    The file contains isotropic events with a power-law spectrum, plus the events from the point sources and
+    from the flares (if any), sorted in time.
+
+    :param ft1: name of the output FT1 file
+    :param tstart: start time (MET) of the FT1 file
+    :param duration: length of the FT1 file, in seconds
+    :param n_events: number of background events (if None, it is drawn from a Poisson with mean rate * duration)
+    :param rate: rate of the background events (events/s), used only if n_events is None
+    :param sources: a list of (ra, dec, rate) tuples for steady point sources
+    :param flares: a list of (ra, dec, t0, length, n_events) tuples for transients
+    :param proc_ver: value of the PROC_VER keyword
+    :param seed: seed for the random number generator
+    :return: number of events in the FT1 file
+    """
+
+    rng = np.random.RandomState(seed)
+
+    tstop = tstart + duration
+
+    if n_events is None:
+
+        n_events = rng.poisson(rate * duration)
+
+    ra, dec = isotropic_directions(n_events, rng)
+
+    all_ra = [ra]
+    all_dec = [dec]
+    all_times = [rng.uniform(tstart, tstop, n_events)]
+
+    # Steady sources are spread over the whole interval, flares only over their own
+
+    components = []
+
+    if sources is not None:
+
+        for src_ra, src_dec, src_rate in sources:
+
+            components.append((src_ra, src_dec, tstart, duration, rng.poisson(src_rate * duration)))
+
+    if flares is not None:
+
+        components.extend(flares)
+
+    for src_ra, src_dec, t0, length, n_src in components:
+
+        this_ra, this_dec = scatter_directions(np.zeros(n_src) + src_ra, np.zeros(n_src) + src_dec, 0.5, rng)
+
+        all_ra.append(this_ra)
+        all_dec.append(this_dec)
+        all_times.append(rng.uniform(max(t0, tstart), min(t0 + length, tstop), n_src))
+
+    times = np.concatenate(all_times)
+
+    order = np.argsort(times)
+
+    times = times[order]
+    ra = np.concatenate(all_ra)[order]
+    dec = np.concatenate(all_dec)[order]
+
+    n_total = len(times)
+
+    # Power law with index -2 between 100 MeV and 100 GeV
+    energies = 100.0 / (1.0 - rng.uniform(0.0, 1.0, n_total) * (1.0 - 100.0 / 1e5))
+
+    events = fits.BinTableHDU.from_columns([fits.Column(name='ENERGY', format='E', unit='MeV', array=energies),
+                                            fits.Column(name='RA', format='E', unit='deg', array=ra),
+                                            fits.Column(name='DEC', format='E', unit='deg', array=dec),
+                                            fits.Column(name='TIME', format='D', unit='s', array=times),
+                                            fits.Column(name='ZENITH_ANGLE', format='E', unit='deg',
+                                                        array=rng.uniform(0.0, 100.0, n_total)),
+                                            fits.Column(name='EVENT_CLASS', format='J',
+                                                        array=np.zeros(n_total, dtype=int) + 128)])
+    events.name = 'EVENTS'
+
+    gti = fits.BinTableHDU.from_columns([fits.Column(name='START', format='D', unit='s', array=[tstart]),
+                                         fits.Column(name='STOP', format='D', unit='s', array=[tstop])])
+    gti.name = 'GTI'
+
+    primary = fits.PrimaryHDU()
+    primary.header.set('PROC_VER', proc_ver)
+
+    for hdu in (primary, events, gti):
+
+        hdu.header.set('TSTART', tstart)
+        hdu.header.set('TSTOP', tstop)
+
+    fits.HDUList([primary, events, gti]).writeto(ft1, overwrite=True)
+
+    return n_total
+
+
+def make_ft2(ft2, tstart, tstop, ft2_step=30.0):
+    """
+    Write a FT2 file covering the interval [tstart, tstop) with intervals of length ft2_step
+
+    :param ft2: name of the output FT2 file
+    :param tstart: start of the first interval
+    :param tstop: the last interval ends at or after tstop
+    :param ft2_step: length of the intervals, in seconds
+    :return: number of rows in the FT2 file
+    """
+
+    starts = np.arange(tstart, tstop, ft2_step)
+    stops = starts + ft2_step
+
+    sc_data = fits.BinTableHDU.from_columns([fits.Column(name='START', format='D', unit='s', array=starts),
+                                             fits.Column(name='STOP', format='D', unit='s', array=stops),
+                                             fits.Column(name='RA_SCZ', format='E', unit='deg',
+                                                         array=np.mod(starts / 5400.0 * 360.0, 360.0)),
+                                             fits.Column(name='DEC_SCZ', format='E', unit='deg',
+                                                         array=50.0 * np.sin(starts / 5400.0 * 2 * np.pi)),
+                                             fits.Column(name='LIVETIME', format='D', unit='s',
+                                                         array=np.zeros(len(starts)) + 0.9 * ft2_step)])
+    sc_data.name = 'SC_DATA'
+
+    primary = fits.PrimaryHDU()
+
+    for hdu in (primary, sc_data):
+
+        hdu.header.set('TSTART', starts[0])
+        hdu.header.set('TSTOP', stops[-1])
+
+    fits.HDUList([primary, sc_data]).writeto(ft2, overwrite=True)
+
+    return len(starts)
+
+
+def make_ft_pair(ft1, ft2, tstart, duration, n_events=None, rate=1.0, sources=None, flares=None, buffer=1000.0,
+                 ft2_step=30.0, proc_ver=302, seed=0):
+    """
+    Write a small FT1/FT2 pair (see make_ft1 and make_ft2). The FT2 file covers the FT1 interval expanded by
+    buffer on each side.
+
+    :return: number of events in the FT1 file
+    """
+
+    n_total = make_ft1(ft1, tstart, duration, n_events=n_events, rate=rate, sources=sources, flares=flares,
+                       proc_ver=proc_ver, seed=seed)
+
+    make_ft2(ft2, tstart - buffer, tstart + duration + buffer, ft2_step=ft2_step)
+
+    return n_total
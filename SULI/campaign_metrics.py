@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+
+"""Metrics of a running search campaign (submit_a_search.py), in the Prometheus text format. They are computed from
+    the files of the results directory: the log of the submissions (written by submit_a_search.py), the records
+    written by the farm jobs (search_on_farm.py, when the SULI_METRICS_DIR environment variable is set, which
+    submit_a_search.py does and qsub -V passes on to the jobs) and the result files in generated_data.
+
+    The records are reconciled with qstat: a submitted job which is not in the queue anymore and never recorded its
+    end (killed by the scheduler for walltime or memory, or failed before writing its record) is counted as lost, and
+    the days it did not finish as failed.
+
+    The metrics are rewritten periodically in metrics/metrics.prom (for the textfile collector of a node exporter, or
+    for humans), and can also be served over HTTP on a local port (/metrics). Run as a script, this watches a results
+    directory independently of the submission."""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+
+from SULI.farm_queue import read_job_ids, jobs_in_queue, short_id
+from SULI.profiling import profile_script
+
+try:
+
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+except ImportError:
+
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Directory of the metrics, in the results directory
+METRICS_DIR = 'metrics'
+
+# Log of the submissions (one line for each day: time, name, 1 if the results were taken from the cache)
+SUBMISSIONS_FILE = 'submissions.txt'
+
+# Records of the farm jobs (one JSON file for each job)
+JOB_PREFIX = 'job_'
+
+# Ids of the submitted jobs (see SULI.farm_queue.submit_job)
+JOB_IDS_FILE = 'job_ids.txt'
+
+METRICS_FILE = 'metrics.prom'
+
+# Environment variables read by the farm jobs
+METRICS_DIR_VARIABLE = 'SULI_METRICS_DIR'
+SUBMIT_TIME_VARIABLE = 'SULI_SUBMIT_TIME'
+
+# Stages of a day in a farm job
+STAGES = ('stage_in', 'search', 'stage_out')
+
+
+def _atomic_write(filename, text):
+
+    temp_file = "%s.%s.tmp" % (filename, os.getpid())
+
+    with open(temp_file, 'w+') as f:
+
+        f.write(text)
+
+    os.rename(temp_file, filename)
+
+
+def start_campaign(res_dir):
+    """
+    Prepare the metrics directory of a new submission, removing the records of a previous one
+
+    :param res_dir: the results directory of the campaign
+    :return: the path of the metrics directory
+    """
+
+    metrics_dir = os.path.join(res_dir, METRICS_DIR)
+
+    if not os.path.exists(metrics_dir):
+
+        os.mkdir(metrics_dir)
+
+    for filename in os.listdir(metrics_dir):
+
+        if filename in (SUBMISSIONS_FILE, JOB_IDS_FILE) or filename.startswith(JOB_PREFIX):
+
+            os.remove(os.path.join(metrics_dir, filename))
+
+    return metrics_dir
+
+
+def record_submission(metrics_dir, name, cached=False):
+    """
+    Add a day to the log of the submissions, and set the environment passed to its farm job (with qsub -V)
+
+    :param metrics_dir: the metrics directory (see start_campaign)
+    :param name: name of the day (or of the job)
+    :param cached: True if the results were taken from the cache instead of submitting a job
+    :return: none
+    """
+
+    now = time.time()
+
+    with open(os.path.join(metrics_dir, SUBMISSIONS_FILE), 'a') as f:
+
+        f.write("%r %s %i\n" % (now, name, int(cached)))
+
+    os.environ[METRICS_DIR_VARIABLE] = metrics_dir
+    os.environ[SUBMIT_TIME_VARIABLE] = repr(now)
+
+
+class JobRecord(object):
+    """
+    Record of a farm job (start, queue wait, time spent in each stage of each day), rewritten after each change
+    """
+
+    def __init__(self, metrics_dir, job_id, n_days=1):
+
+        self._filename = os.path.join(metrics_dir, "%s%s.json" % (JOB_PREFIX, job_id))
+
+        submit_time = os.environ.get(SUBMIT_TIME_VARIABLE)
+
+        self._record = {'host': socket.gethostname(), 'start': time.time(), 'end': None, 'n_days': n_days,
+                        'queue_wait': time.time() - float(submit_time) if submit_time else None,
+                        'stages': dict((stage, 0.0) for stage in STAGES), 'days_done': 0, 'days_failed': 0}
+
+        self.write()
+
+    @classmethod
+    def from_environment(cls, job_id, n_days=1):
+        """
+        Return the record of this job (which searches n_days days) if the metrics directory is set in the
+        environment, or None
+        """
+
+        metrics_dir = os.environ.get(METRICS_DIR_VARIABLE)
+
+        if not metrics_dir or not os.path.isdir(metrics_dir):
+
+            return None
+
+        return cls(metrics_dir, job_id, n_days)
+
+    def add_time(self, stage, seconds):
+
+        self._record['stages'][stage] += seconds
+
+    def day_done(self, ok):
+
+        self._record['days_done' if ok else 'days_failed'] += 1
+
+        self.write()
+
+    def end(self):
+
+        self._record['end'] = time.time()
+
+        self.write()
+
+    def write(self):
+
+        try:
+
+            _atomic_write(self._filename, json.dumps(self._record))
+
+        except (IOError, OSError) as e:
+
+            # The metrics must never make a job fail
+            print("Could not write the job record %s: %s" % (self._filename, e))
+
+
+def read_job_records(metrics_dir):
+    """
+    Return the records of the farm jobs, by job id
+    """
+
+    records = {}
+
+    for filename in os.listdir(metrics_dir):
+
+        if filename.startswith(JOB_PREFIX) and filename.endswith('.json'):
+
+            try:
+
+                with open(os.path.join(metrics_dir, filename)) as f:
+
+                    records[filename[len(JOB_PREFIX):-len('.json')]] = json.load(f)
+
+            except (IOError, OSError, ValueError):
+
+                # Being rewritten
+                continue
+
+    return records
+
+
+def submitted_job_ids(res_dir):
+
+    return read_job_ids(os.path.join(res_dir, METRICS_DIR, JOB_IDS_FILE))
+
+
+def campaign_status(res_dir, n_days, in_queue=None):
+    """
+    Compute the status of a campaign from the files in its results directory
+
+    :param res_dir: the results directory of the campaign
+    :param n_days: number of days of the campaign
+    :param in_queue: the submitted jobs still in the queue (see SULI.farm_queue.jobs_in_queue), or None if unknown
+    (the jobs are then not checked for being lost)
+    :return: a dictionary
+    """
+
+    metrics_dir = os.path.join(res_dir, METRICS_DIR)
+
+    submissions = []
+
+    if os.path.exists(os.path.join(metrics_dir, SUBMISSIONS_FILE)):
+
+        with open(os.path.join(metrics_dir, SUBMISSIONS_FILE)) as f:
+
+            submissions = [line.split() for line in f if len(line.split()) == 3]
+
+    now = time.time()
+
+    start = float(submissions[0][0]) if len(submissions) > 0 else now
+
+    records = read_job_records(metrics_dir) if os.path.isdir(metrics_dir) else {}
+
+    # Jobs which left the queue without recording their end. Their days which are not done are failed (a job
+    # without a record searched one day, as the ones of submit_a_search.py)
+    lost = []
+
+    days_lost = 0
+
+    # (the lost jobs which never started)
+    n_lost_queued = 0
+
+    if in_queue is not None:
+
+        for job_id in set(short_id(job_id) for job_id in submitted_job_ids(res_dir)):
+
+            record = records.get(job_id)
+
+            if job_id not in in_queue and (record is None or record['end'] is None):
+
+                lost.append(job_id)
+
+                if record is None:
+
+                    days_lost += 1
+
+                    n_lost_queued += 1
+
+                else:
+
+                    days_lost += max(0, record.get('n_days', 1) - record['days_done'] - record['days_failed'])
+
+    # Results written since the start of the campaign (including the ones taken from the cache)
+    data_dir = os.path.join(res_dir, 'generated_data')
+
+    finished = 0
+
+    if os.path.isdir(data_dir):
+
+        for filename in os.listdir(data_dir):
+
+            if filename.endswith('_detections.txt') and os.path.getmtime(os.path.join(data_dir, filename)) >= start:
+
+                finished += 1
+
+    n_cached = sum(int(submission[2]) for submission in submissions)
+
+    status = {'days': n_days,
+              'submitted': len(submissions) - n_cached,
+              'cached': n_cached,
+              'started': len(records),
+              'running': len([job_id for job_id, record in records.items()
+                              if record['end'] is None and job_id not in lost]),
+              'queued': max(0, len(submissions) - n_cached - len(records) - n_lost_queued),
+              'in_queue': len(in_queue) if in_queue is not None else None,
+              'lost': len(lost),
+              'finished': finished,
+              'failed': sum(record['days_failed'] for record in records.values()) + days_lost,
+              'elapsed': now - start,
+              'queue_waits': [record['queue_wait'] for record in records.values() if record['queue_wait'] is not None],
+              'stages': dict((stage, sum(record['stages'][stage] for record in records.values()))
+                             for stage in STAGES),
+              'days_in_jobs': sum(record['days_done'] + record['days_failed'] for record in records.values())}
+
+    status['days_per_hour'] = finished / (status['elapsed'] / 3600.0) if status['elapsed'] > 0 else 0.0
+
+    remaining = max(0, n_days - finished - status['failed'])
+
+    if remaining == 0:
+
+        status['remaining_time'] = 0.0
+
+    elif finished > 0:
+
+        status['remaining_time'] = remaining / (finished / status['elapsed'])
+
+    else:
+
+        status['remaining_time'] = None
+
+    return status
+
+
+def format_metrics(status):
+    """
+    Return the metrics in the Prometheus text format
+
+    :param status: the status of the campaign (see campaign_status)
+    :return: a string
+    """
+
+    lines = []
+
+    def metric(name, kind, description, values):
+
+        lines.append("# HELP suli_%s %s" % (name, description))
+        lines.append("# TYPE suli_%s %s" % (name, kind))
+
+        for labels, value in values:
+
+            lines.append("suli_%s%s %r" % (name, labels, float(value)))
+
+    metric('campaign_days', 'gauge', 'Days to search in the campaign', [('', status['days'])])
+    metric('jobs_submitted_total', 'counter', 'Jobs submitted to the farm', [('', status['submitted'])])
+    metric('days_cached_total', 'counter', 'Days taken from the result cache instead of being submitted',
+           [('', status['cached'])])
+    metric('jobs_started_total', 'counter', 'Jobs which started running on the farm', [('', status['started'])])
+    metric('jobs_running', 'gauge', 'Jobs running on the farm', [('', status['running'])])
+    metric('jobs_queued', 'gauge', 'Jobs submitted and not started yet', [('', status['queued'])])
+    metric('days_finished_total', 'counter', 'Days with results in generated_data', [('', status['finished'])])
+    metric('jobs_lost_total', 'counter', 'Jobs which left the queue without finishing (killed by the scheduler, '
+                                         'or failed before starting)', [('', status['lost'])])
+    metric('days_failed_total', 'counter', 'Days which failed in the farm jobs, or in jobs which were lost',
+           [('', status['failed'])])
+    metric('days_per_hour', 'gauge', 'Days finished per hour since the start of the campaign',
+           [('', status['days_per_hour'])])
+
+    waits = status['queue_waits']
+
+    metric('queue_wait_seconds', 'summary', 'Time between the submission and the start of the jobs',
+           [('{quantile="0.5"}', sorted(waits)[len(waits) // 2] if len(waits) > 0 else float('nan')),
+            ('{quantile="1"}', max(waits) if len(waits) > 0 else float('nan')),
+            ('_sum', sum(waits)), ('_count', len(waits))])
+
+    metric('stage_seconds_total', 'counter', 'Time spent by the farm jobs in each stage',
+           [('{stage="%s"}' % stage, status['stages'][stage]) for stage in STAGES])
+    metric('stage_days_total', 'counter', 'Days processed by the farm jobs (to average the stage times)',
+           [('', status['days_in_jobs'])])
+    metric('elapsed_seconds', 'gauge', 'Time since the start of the campaign', [('', status['elapsed'])])
+
+    if status['remaining_time'] is not None:
+
+        metric('estimated_remaining_seconds', 'gauge', 'Estimated time to the end of the campaign, at the current '
+                                                       'throughput', [('', status['remaining_time'])])
+        metric('estimated_completion_timestamp_seconds', 'gauge', 'Estimated end of the campaign (UNIX time)',
+               [('', time.time() + status['remaining_time'])])
+
+    return "\n".join(lines) + "\n"
+
+
+class CampaignMetrics(object):
+    """
+    Metrics of a campaign: the metrics file is rewritten by update() (which also checks the jobs in the queue), and
+    serve() starts a local HTTP endpoint
+
+    :param res_dir: the results directory of the campaign
+    :param n_days: number of days of the campaign (can be set later, through the n_days attribute)
+    :param new: if True, remove the records of a previous submission (see start_campaign)
+    """
+
+    def __init__(self, res_dir, n_days=0, new=False):
+
+        self.res_dir = res_dir
+        self.n_days = n_days
+
+        # Submitted jobs still in the queue, at the last update (qstat is not run for each HTTP request)
+        self.in_queue = None
+
+        if new:
+
+            self.metrics_dir = start_campaign(res_dir)
+
+        else:
+
+            self.metrics_dir = os.path.join(res_dir, METRICS_DIR)
+
+            if not os.path.exists(self.metrics_dir):
+
+                os.mkdir(self.metrics_dir)
+
+    def submitted(self, name, cached=False):
+        """
+        Record a submission (see record_submission) and update the metrics
+        """
+
+        record_submission(self.metrics_dir, name, cached)
+
+        self.update(check_queue=False)
+
+    @property
+    def job_ids_file(self):
+        """
+        The file of the ids of the submitted jobs (for SULI.farm_queue.submit_job)
+        """
+
+        return os.path.join(self.metrics_dir, JOB_IDS_FILE)
+
+    def finished(self, status):
+        """
+        Return True if the campaign is over: all the days are finished or failed, or none of its jobs is left in the
+        queue
+        """
+
+        return status['finished'] + status['failed'] >= self.n_days or status['in_queue'] == 0
+
+    def update(self, check_queue=True):
+        """
+        Rewrite the metrics file
+
+        :param check_queue: whether to check which jobs are still in the queue with qstat (otherwise the result of
+        the last check is used)
+        :return: the status of the campaign (see campaign_status)
+        """
+
+        if check_queue:
+
+            self.in_queue = jobs_in_queue(submitted_job_ids(self.res_dir))
+
+        status = campaign_status(self.res_dir, self.n_days, self.in_queue)
+
+        _atomic_write(os.path.join(self.metrics_dir, METRICS_FILE), format_metrics(status))
+
+        return status
+
+    def serve(self, port):
+        """
+        Serve the metrics on http://localhost:port/metrics, from a background thread
+
+        :return: the HTTP server
+        """
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+
+                    self.send_error(404)
+
+                    return
+
+                body = format_metrics(campaign_status(metrics.res_dir, metrics.n_days,
+                                                      metrics.in_queue)).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+
+                # Do not mix the requests with the output of the submission
+                pass
+
+        server = HTTPServer(('', port), Handler)
+
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        print("Serving the metrics of the campaign on http://%s:%s/metrics" % (socket.gethostname(), port))
+
+        return server
+
+
+# execute only if run from command line
+if __name__ == "__main__":
+
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
+    parser = argparse.ArgumentParser('Export the metrics of a running search campaign')
+
+    parser.add_argument("--res_dir", help="Results directory of the campaign (the --res_dir of submit_a_search.py)",
+                        type=str, required=True)
+    parser.add_argument("--n_days", help="Number of days of the campaign", type=int, required=True)
+    parser.add_argument("--port", help="If given, also serve the metrics over HTTP on this port", type=int,
+                        default=None)
+    parser.add_argument("--interval", help="Seconds between two updates of the metrics file (default: 30)",
+                        type=float, default=30.0)
+    parser.add_argument("--once", help="Write the metrics file once and exit", action='store_true')
+
+    args = parser.parse_args()
+
+    res_dir = os.path.abspath(os.path.expandvars(os.path.expanduser(args.res_dir)))
+
+    metrics = CampaignMetrics(res_dir, args.n_days)
+
+    if args.port is not None:
+
+        metrics.serve(args.port)
+
+    while True:
+
+        status = metrics.update()
+
+        print("%s of %s days finished (%s failed), %s jobs running, %s lost, %.1f days/hour"
+              % (status['finished'], status['days'], status['failed'], status['running'], status['lost'],
+                 status['days_per_hour']))
+
+        if args.once or metrics.finished(status):
+
+            break
+
+        time.sleep(args.interval)
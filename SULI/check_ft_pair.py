@@ -0,0 +1,28 @@
+def check_ft_pair(ft1, ft2):
+    """
+    Make sure that the time interval covered by a FT2 file contains the one covered by the FT1 file
+
+    :param ft1: path of the FT1 file
+    :param ft2: path of the FT2 file
+    :return: none (a RuntimeError is raised if the files do not match)
+    """
+
+    # Imported here because astropy is slow to import
+    from SULI.fits_access import gti_extent, time_extent
+
+    # Events are sorted in time, so only the first and the last one are read
+    gti_start, gti_stop = gti_extent(ft1)
+    first_event, last_event = time_extent(ft1, 'EVENTS', 'TIME')
+
+    ft1_start = gti_start if first_event is None else min(gti_start, first_event)
+    ft1_stop = gti_stop if last_event is None else max(gti_stop, last_event)
+
+    ft2_start, ft2_stop = time_extent(ft2, 'SC_DATA', 'START', 'STOP')
+
+    if ft2_start - ft1_start > 0:
+
+        raise RuntimeError("FT2 file starts after the start of the FT1 file")
+
+    if ft2_stop - ft1_stop < 0:
+
+        raise RuntimeError("FT2 file stops before the end of the FT1 file")
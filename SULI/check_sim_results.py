@@ -2,21 +2,48 @@
 
 import glob
 import argparse
+import multiprocessing
 import os
 
-import astropy.io.fits as pyfits
-from GtApp import GtApp
+from SULI.fits_access import time_extent
+from SULI.light_curve import light_curve, write_light_curve, compare_with_gtbin, light_curves, read_sources, \
+    write_light_curves
+from SULI.tool_layer import gt_app
+from SULI.profiling import profile_script
 
 ft2_file = 'ft2_simulated_283996770-315532800.fits'
 
+# Region and cuts used for the light curve of Vela
+VELA_RA = 128.837917
+VELA_DEC = -45.178333
+RADIUS = 2.0
+EMIN = 100
+EMAX = 100000
+ZMAX = 180
+EVCLASS = 128
+
 if __name__=="__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     parser = argparse.ArgumentParser('Wrapper around the simulation script')
 
     # Required parameters
 
     parser.add_argument("--in_ft2", help="Ft2 file containing data to be segmented", required=True, type=str)
     parser.add_argument("--binsize", help="Bin size for the light curve", required=False, default=21600.0, type=float)
+    parser.add_argument("--fast", help="Make the light curve (counts only, no exposure) in-process with "
+                                       "SULI.light_curve instead of gtselect/gtbin/gtexposure", action='store_true')
+    parser.add_argument("--compare", help="Make the light curve both ways and check that the counts are the same",
+                        action='store_true')
+    parser.add_argument("--n_processes", help="Number of ft1 files processed in parallel with --fast", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--sources", help="Batch mode: text file with one check source per line (name, ra, dec and "
+                                          "optionally the radius of the region). The light curves of all the sources "
+                                          "are made in-process (as with --fast) with a single pass over the ft1 files",
+                        type=str, default=None)
+    parser.add_argument("--out_file", help="Output file for the batch mode", type=str, default='light_curves.fits')
 
     args = parser.parse_args()
 
@@ -24,46 +51,86 @@ if __name__=="__main__":
 
     files = glob.glob("generated_data/*_ft1.fits")
 
-    print("\n\nMaking light curve...")
-
-    with open('ft1_list', 'w+') as f:
-        for filename in files:
-            f.write("%s\n" % filename)
-
-    gtselect = GtApp('gtselect')
-    gtselect['infile'] = '@ft1_list'
-    gtselect['outfile'] = 'vela.fits'
-    gtselect['ra'] = 128.837917
-    gtselect['dec'] = -45.178333
-    gtselect['rad'] = 2.0
-    gtselect['tmin'] = 'INDEF'
-    gtselect['tmax'] = 'INDEF'
-    gtselect['emin'] = 100
-    gtselect['emax'] = 100000
-    gtselect['zmax'] = 180
-    gtselect['evclass'] = 128
-    gtselect['evtype'] = 3
-
-    gtselect.run()
-
-    data = pyfits.getdata(ft2_file, 'SC_DATA')
-
-    gtbin = GtApp('gtbin')
-    gtbin['evfile'] = 'vela.fits'
-    gtbin['scfile'] = ft2_file
-    gtbin['outfile'] = 'vela_lc.fits'
-    gtbin['algorithm'] = 'LC'
-    gtbin['tbinalg'] = 'LIN'
-    gtbin['tstart'] = data.START.min()
-    gtbin['tstop'] = data.STOP.max()
-    gtbin['dtime'] = args.binsize
-    gtbin.run()
-
-    gtexposure = GtApp('gtexposure')
-    gtexposure['infile'] = 'vela_lc.fits'
-    gtexposure['scfile'] = ft2_file
-    gtexposure['irfs'] = 'CALDB'
-    gtexposure['srcmdl'] = 'bnVela_LAT_xmlmodel.xml'
-    gtexposure['target'] = "3FGL J0835.3-4510"
-
-    gtexposure.run()
+    ft2_start, ft2_stop = time_extent(ft2_file, 'SC_DATA', 'START', 'STOP')
+
+    if args.sources is not None:
+
+        names, ra, dec, radius = read_sources(args.sources, RADIUS)
+
+        print("\n\nMaking light curves of %s sources from %s files (%s processes)..." % (len(names), len(files),
+                                                                                      args.n_processes))
+
+        edges, counts = light_curves(files, ft2_start, ft2_stop, args.binsize, ra, dec, radius, emin=EMIN, emax=EMAX,
+                                     zmax=ZMAX, evclass=EVCLASS, n_processes=args.n_processes)
+
+        write_light_curves(edges, counts, names, ra, dec, radius, args.out_file)
+
+        print("\n%-20s %10s %10s %10s" % ('source', 'counts', 'mean', 'max'))
+
+        for name, source_counts in zip(names, counts):
+
+            print("%-20s %10i %10.1f %10i" % (name, source_counts.sum(), source_counts.mean(), source_counts.max()))
+
+        print("\nLight curves written to %s" % args.out_file)
+
+    elif not args.fast or args.compare:
+
+        print("\n\nMaking light curve...")
+
+        with open('ft1_list', 'w+') as f:
+            for filename in files:
+                f.write("%s\n" % filename)
+
+        gtselect = gt_app('gtselect')
+        gtselect['infile'] = '@ft1_list'
+        gtselect['outfile'] = 'vela.fits'
+        gtselect['ra'] = VELA_RA
+        gtselect['dec'] = VELA_DEC
+        gtselect['rad'] = RADIUS
+        gtselect['tmin'] = 'INDEF'
+        gtselect['tmax'] = 'INDEF'
+        gtselect['emin'] = EMIN
+        gtselect['emax'] = EMAX
+        gtselect['zmax'] = ZMAX
+        gtselect['evclass'] = EVCLASS
+        gtselect['evtype'] = 3
+
+        gtselect.run()
+
+        gtbin = gt_app('gtbin')
+        gtbin['evfile'] = 'vela.fits'
+        gtbin['scfile'] = ft2_file
+        gtbin['outfile'] = 'vela_lc.fits'
+        gtbin['algorithm'] = 'LC'
+        gtbin['tbinalg'] = 'LIN'
+        gtbin['tstart'] = ft2_start
+        gtbin['tstop'] = ft2_stop
+        gtbin['dtime'] = args.binsize
+        gtbin.run()
+
+        gtexposure = gt_app('gtexposure')
+        gtexposure['infile'] = 'vela_lc.fits'
+        gtexposure['scfile'] = ft2_file
+        gtexposure['irfs'] = 'CALDB'
+        gtexposure['srcmdl'] = 'bnVela_LAT_xmlmodel.xml'
+        gtexposure['target'] = "3FGL J0835.3-4510"
+
+        gtexposure.run()
+
+    if args.sources is None and (args.fast or args.compare):
+
+        print("\n\nMaking light curve in-process from %s files (%s processes)..." % (len(files), args.n_processes))
+
+        # evtype=3 (front + back) keeps all the events, so there is no cut on the event type
+        edges, counts = light_curve(files, ft2_start, ft2_stop, args.binsize, VELA_RA, VELA_DEC, RADIUS, emin=EMIN,
+                                    emax=EMAX, zmax=ZMAX, evclass=EVCLASS, n_processes=args.n_processes)
+
+        write_light_curve(edges, counts, 'vela_lc_fast.fits')
+
+        print("%s counts in %s bins, written to vela_lc_fast.fits" % (counts.sum(), len(counts)))
+
+        if args.compare:
+
+            compare_with_gtbin(edges, counts, 'vela_lc.fits')
+
+            print("The light curve is identical to the one made by gtbin (vela_lc.fits)")
@@ -0,0 +1,169 @@
+"""Single entry point for the pipeline (installed as the "suli" command): each subcommand runs one of the SULI scripts
+    in the current process, with the same command line options it accepts when run on its own. Several stages can be
+    chained in the same process by separating them with "+", so that numpy and astropy are imported only once:
+
+        suli search --inp_fts ft1.fits,ft2.fits ... + flag --directory . --out_file flagged
+
+    Use "suli <subcommand> --help" for the options of each subcommand. Any subcommand accepts --profile, to run it
+    under the profiler (see SULI.profiling)"""
+
+import os
+import runpy
+import sys
+
+from SULI.profiling import pop_profile_option, profile_directory, profile_call
+
+# Subcommand -> script (in the SULI package) which implements it
+SUBCOMMANDS = {'split': 'get_day_fits.py',
+               'simulate': 'sim_day_fits.py',
+               'search': 'search_for_transients.py',
+               'dedup': 'remove_redundant_triggers.py',
+               'flag': 'flag_detections.py',
+               'collect': 'collect_results.py',
+               'cross-match': 'cross_match.py',
+               'submit': 'submit_a_search.py',
+               'campaign-metrics': 'campaign_metrics.py',
+               'submit-simulation': 'submit_a_range.py',
+               'farm-search': 'search_on_farm.py',
+               'farm-simulate': 'simulate_in_the_farm.py',
+               'far-campaign': 'submit_far_campaign.py',
+               'farm-far': 'far_campaign_job.py',
+               'time-index': 'time_index.py',
+               'grb-dates': 'GRB_to_date.py',
+               'group-search': 'group_search.py',
+               'check-simulation': 'check_sim_results.py',
+               'realtime': 'Realtime_BB_Search.py',
+               'profile-merge': 'profiling.py'}
+
+# Separator between chained subcommands
+CHAIN_SEPARATOR = '+'
+
+
+def script_path(subcommand):
+    """
+    Return the path of the script implementing the given subcommand (or the given script name). This does not need a
+    search through the PATH, since the scripts live in the package directory.
+
+    :param subcommand: a subcommand (like 'search') or the name of a script (like 'search_for_transients.py')
+    :return: the absolute path of the script
+    """
+
+    script = SUBCOMMANDS.get(subcommand, subcommand)
+
+    if script not in SUBCOMMANDS.values():
+
+        raise RuntimeError("Unknown subcommand %s. Known subcommands: %s" % (subcommand,
+                                                                            ", ".join(sorted(SUBCOMMANDS.keys()))))
+
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+
+
+def run(subcommand, argv):
+    """
+    Run a subcommand in the current process, as if its script was run from the command line with the given arguments
+
+    :param subcommand: a subcommand (like 'search') or the name of a script (like 'search_for_transients.py')
+    :param argv: list of command line arguments (without the name of the script). With --profile, the script runs
+    under the profiler (see SULI.profiling)
+    :return: none. An exception is raised if the script fails (SystemExit with a non-zero code if it exits)
+    """
+
+    path = script_path(subcommand)
+
+    argv, profile = pop_profile_option(argv)
+
+    old_argv = sys.argv
+
+    sys.argv = [path] + list(argv)
+
+    try:
+
+        if profile:
+
+            profile_call(lambda: runpy.run_path(path, run_name='__main__'),
+                         os.path.splitext(os.path.basename(path))[0], profile_directory(argv))
+
+        else:
+
+            runpy.run_path(path, run_name='__main__')
+
+    except SystemExit as e:
+
+        # argparse exits with 0 for --help: that is not a failure
+        if e.code not in (None, 0):
+
+            raise
+
+    finally:
+
+        sys.argv = old_argv
+
+
+def _split_chain(argv):
+
+    chain = [[]]
+
+    for arg in argv:
+
+        if arg == CHAIN_SEPARATOR:
+
+            chain.append([])
+
+        else:
+
+            chain[-1].append(arg)
+
+    return [c for c in chain if len(c) > 0]
+
+
+def _usage():
+
+    return "Usage: suli <subcommand> [options] [+ <subcommand> [options] ...]\n\nSubcommands:\n%s" % \
+           "\n".join("    %-18s (%s)" % (name, script) for name, script in sorted(SUBCOMMANDS.items()))
+
+
+def main(argv=None):
+    """
+    Entry point of the "suli" command
+    """
+
+    argv = sys.argv[1:] if argv is None else argv
+
+    if len(argv) == 0 or argv[0] in ('-h', '--help'):
+
+        print(_usage())
+
+        return 0 if len(argv) > 0 else 1
+
+    chain = _split_chain(argv)
+
+    for stage in chain:
+
+        if stage[0] not in SUBCOMMANDS:
+
+            print("Unknown subcommand %s\n" % stage[0])
+            print(_usage())
+
+            return 1
+
+    # Each stage starts from the same directory, even if the previous one changed it
+    start_dir = os.getcwd()
+
+    for stage in chain:
+
+        print("\n[suli] Running %s" % " ".join(stage))
+
+        try:
+
+            run(stage[0], stage[1:])
+
+        finally:
+
+            os.chdir(start_dir)
+
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
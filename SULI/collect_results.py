@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+
+"""This script collects the trigger lists (*_detections.txt, from search_for_transients) as they land in a results
+    directory, and folds each one into running statistics: detections per day, mean rate, a histogram of the
+    positions on the sky and the most significant detections. Each file is read only once: the statistics are kept in
+    a small JSON state file and the names of the files already collected in an append-only list next to it, so the
+    collector can be stopped and restarted at any time, and the status of a campaign can be printed (--status)
+    without reading any trigger list. These two files are kept out of the results directory (by default they are in
+    its parent, the results directory of the campaign), because submit_a_search.py counts the files in generated_data
+    to know how many jobs have finished.
+
+        collect_results.py --directory generated_data --follow 60
+        collect_results.py --directory generated_data --status"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from SULI.far import trigger_significance, write_state
+from SULI.remove_redundant_triggers import read_triggers
+from SULI.profiling import profile_script
+
+# Size of the cells of the sky histogram (degrees)
+SKY_BIN = 10.0
+
+
+def state_file_name(state_dir):
+
+    return os.path.join(state_dir, 'collector_state.json')
+
+
+def collected_list_name(state_dir):
+
+    return os.path.join(state_dir, 'collector_files.txt')
+
+
+def default_state_dir(directory):
+    """
+    Return the directory of the state of the collector of a results directory: its parent
+    """
+
+    return os.path.dirname(os.path.abspath(directory))
+
+
+def new_state(n_top):
+
+    return {'n_files': 0,
+            'n_detections': 0,
+            'n_empty': 0,
+            'per_day': {},
+            'sky': np.zeros((int(180 / SKY_BIN), int(360 / SKY_BIN)), dtype=int).tolist(),
+            'n_top': n_top,
+            'top': [],
+            'last_update': None}
+
+
+def read_state(state_dir, n_top=20):
+    """
+    Read the state of the collector kept in state_dir, or return a new one if there is none
+    """
+
+    filename = state_file_name(state_dir)
+
+    if not os.path.exists(filename):
+
+        return new_state(n_top)
+
+    with open(filename) as f:
+
+        return json.load(f)
+
+
+def read_collected(state_dir, n_files):
+    """
+    Return the files already collected (paths relative to the directory). Only the first n_files entries of the list
+    are used: entries after those were appended by a collector which died before updating the state, so they were not
+    counted.
+
+    :param state_dir: directory of the state of the collector
+    :param n_files: number of files collected according to the state
+    :return: a list of paths
+    """
+
+    filename = collected_list_name(state_dir)
+
+    if not os.path.exists(filename):
+
+        return []
+
+    with open(filename) as f:
+
+        lines = f.read().split("\n")
+
+    # The last line is either empty or incomplete
+    collected = lines[:-1][:n_files]
+
+    if len(collected) < n_files:
+
+        raise RuntimeError("%s lists %s files, but %s were collected according to %s" %
+                           (filename, len(collected), n_files, state_file_name(state_dir)))
+
+    if len(lines) - 1 > n_files or lines[-1] != '':
+
+        # Drop the entries which were not counted
+        with open(filename, 'w+') as f:
+
+            f.write("".join("%s\n" % x for x in collected))
+
+    return collected
+
+
+def find_detection_files(directory):
+    """
+    Return the trigger lists in the directory, and in its replica_* subdirectories (paths relative to the directory)
+    """
+
+    files = glob.glob(os.path.join(directory, '*_detections.txt')) + \
+        glob.glob(os.path.join(directory, 'replica_*', '*_detections.txt'))
+
+    return sorted(os.path.relpath(f, directory) for f in files)
+
+
+def day_of(relative_path):
+    """
+    Return the day of a trigger list: the start of the day (MET) or the date, from the name of the file
+    """
+
+    return os.path.basename(relative_path).rsplit('_detections.txt', 1)[0]
+
+
+def add_file(state, filename, relative_path):
+    """
+    Fold one trigger list into the state (modified in place)
+
+    :param state: the state of the collector
+    :param filename: path of the trigger list
+    :param relative_path: name of the trigger list relative to the directory (used as identifier)
+    :return: the number of detections in the file
+    """
+
+    regions = read_triggers(filename)
+
+    n_detections = len(regions)
+
+    state['n_files'] += 1
+    state['n_detections'] += n_detections
+
+    if n_detections == 0:
+
+        state['n_empty'] += 1
+
+    day = day_of(relative_path)
+
+    state['per_day'][day] = state['per_day'].get(day, 0) + n_detections
+
+    if n_detections > 0:
+
+        sky = np.array(state['sky'])
+
+        ra = np.asarray(regions['ra'], dtype=float) % 360.0
+        dec = np.asarray(regions['dec'], dtype=float)
+
+        rows = np.clip(((dec + 90.0) / SKY_BIN).astype(int), 0, sky.shape[0] - 1)
+        columns = np.clip((ra / SKY_BIN).astype(int), 0, sky.shape[1] - 1)
+
+        np.add.at(sky, (rows, columns), 1)
+
+        state['sky'] = sky.tolist()
+
+        # Keep only the n_top most significant detections seen so far
+        significance = trigger_significance(regions)
+
+        for k in np.argsort(significance)[:state['n_top']]:
+
+            state['top'].append({'significance': float(significance[k]), 'name': str(regions['name'][k]),
+                                 'ra': float(ra[k]), 'dec': float(dec[k]), 'file': relative_path})
+
+        state['top'] = sorted(state['top'], key=lambda x: x['significance'])[:state['n_top']]
+
+    return n_detections
+
+
+def collect(directory, state_dir, n_top=20, settle=5.0):
+    """
+    Collect the trigger lists which landed in the directory since the last call
+
+    :param directory: directory containing the trigger lists
+    :param state_dir: directory of the state of the collector (not the directory of the trigger lists, see above)
+    :param n_top: number of most significant detections to keep
+    :param settle: files modified less than this many seconds ago are left for the next call (they might still be
+    being copied)
+    :return: (state, number of files collected in this call)
+    """
+
+    state = read_state(state_dir, n_top)
+
+    collected = set(read_collected(state_dir, state['n_files']))
+
+    now = time.time()
+
+    new_files = [f for f in find_detection_files(directory)
+                 if f not in collected and now - os.path.getmtime(os.path.join(directory, f)) >= settle]
+
+    if len(new_files) == 0:
+
+        return state, 0
+
+    for relative_path in new_files:
+
+        add_file(state, os.path.join(directory, relative_path), relative_path)
+
+    state['last_update'] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    # The list of collected files is updated before the state: if the collector dies in between, the new entries
+    # are ignored at the next call (see read_collected) and the files are collected again
+    with open(collected_list_name(state_dir), 'a') as f:
+
+        for relative_path in new_files:
+
+            f.write("%s\n" % relative_path)
+
+    write_state(state, state_file_name(state_dir))
+
+    return state, len(new_files)
+
+
+def print_status(state):
+
+    n_files = state['n_files']
+
+    print("Last update: %s" % state['last_update'])
+    print("Days collected: %s (%s without detections)" % (n_files, state['n_empty']))
+    print("Detections: %s" % state['n_detections'])
+
+    if n_files > 0:
+
+        print("Mean rate: %.3f detections per day" % (state['n_detections'] / float(n_files)))
+
+        busiest = sorted(state['per_day'].items(), key=lambda x: -x[1])[:5]
+
+        print("Days with most detections: %s" % ", ".join("%s (%s)" % x for x in busiest))
+
+        sky = np.array(state['sky'])
+
+        row, column = np.unravel_index(np.argmax(sky), sky.shape)
+
+        print("Busiest sky cell: R.A. %s-%s, Dec. %s-%s (%s detections)" % (column * SKY_BIN, (column + 1) * SKY_BIN,
+                                                                            row * SKY_BIN - 90, (row + 1) * SKY_BIN - 90,
+                                                                            sky[row, column]))
+
+    if len(state['top']) > 0:
+
+        print("\nMost significant detections:")
+        print("%-12s %-20s %10s %10s  %s" % ('prob.', 'name', 'ra', 'dec', 'file'))
+
+        for detection in state['top']:
+
+            print("%-12.3g %-20s %10.3f %10.3f  %s" % (detection['significance'], detection['name'], detection['ra'],
+                                                       detection['dec'], detection['file']))
+
+
+# execute only if run from command line
+if __name__ == "__main__":
+
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
+    parser = argparse.ArgumentParser('Collect the results of the searches as they arrive')
+
+    parser.add_argument("--directory", help="Directory where the trigger lists land (default: generated_data)",
+                        type=str, default='generated_data')
+    parser.add_argument("--state_dir", help="Directory for the state of the collector. It must not be the directory "
+                                            "of the trigger lists, whose files are counted by submit_a_search.py "
+                                            "(default: the parent of --directory)", type=str, default=None)
+    parser.add_argument("--status", help="Only print the status of the collection (no file is read)",
+                        action='store_true')
+    parser.add_argument("--follow", help="Keep collecting new files every this many seconds (default: 0, collect "
+                                         "once and exit)", type=float, default=0)
+    parser.add_argument("--expected", help="With --follow, stop when this many files have been collected",
+                        type=int, default=None)
+    parser.add_argument("--n_top", help="Number of most significant detections to keep (default: 20)", type=int,
+                        default=20)
+    parser.add_argument("--settle", help="Files modified less than this many seconds ago are collected later "
+                                         "(default: 5)", type=float, default=5.0)
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.directory):
+
+        raise IOError("Directory %s does not exist" % args.directory)
+
+    state_dir = args.state_dir if args.state_dir is not None else default_state_dir(args.directory)
+
+    if os.path.abspath(state_dir) == os.path.abspath(args.directory):
+
+        raise RuntimeError("The state of the collector cannot be kept in the directory of the trigger lists")
+
+    if not os.path.exists(state_dir):
+
+        os.makedirs(state_dir)
+
+    if args.status:
+
+        print_status(read_state(state_dir, args.n_top))
+
+    else:
+
+        while True:
+
+            this_state, n_new = collect(args.directory, state_dir, args.n_top, args.settle)
+
+            if n_new > 0:
+
+                print("%s: collected %s new files (%s in total, %s detections)" % (time.strftime("%H:%M:%S"), n_new,
+                                                                                   this_state['n_files'],
+                                                                                   this_state['n_detections']))
+
+            if args.follow <= 0 or (args.expected is not None and this_state['n_files'] >= args.expected):
+
+                break
+
+            time.sleep(args.follow)
+
+        print("")
+        print_status(this_state)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+"""This script matches the detections (the *_detections.txt files from search_for_transients, for example the ones
+    listed by flag_detections) with a catalog of known gamma-ray sources, like the 3FGL (FITS table) or a text file with
+    name, ra and dec columns. The catalog is put in a spatial index, and all the detections are matched at once: each
+    detection gets the closest source within the given radius, if any. Detections of sources known to be variable can
+    be dropped from the output."""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from SULI.flag_detections import get_detection_files
+from SULI.remove_redundant_triggers import read_triggers, TRIGGER_DTYPE
+from SULI.sky_index import SkyIndex
+from SULI.profiling import profile_script
+
+# Variability index above which a 3FGL source is variable with 99% confidence
+VARIABILITY_THRESHOLD = 72.44
+
+# Possible names of the columns of the catalog (the first one found is used)
+NAME_COLUMNS = ('Source_Name', 'NAME', 'name')
+RA_COLUMNS = ('RAJ2000', 'RA', 'ra')
+DEC_COLUMNS = ('DEJ2000', 'DEC', 'dec')
+VARIABILITY_COLUMNS = ('Variability_Index', 'variability')
+ASSOCIATION_COLUMNS = ('ASSOC1', 'association')
+
+CATALOG_DTYPE = [('name', 'S50'),
+                 ('ra', float),
+                 ('dec', float),
+                 ('variability', float),
+                 ('association', 'S50')]
+
+
+def _find_column(names, candidates):
+
+    for candidate in candidates:
+
+        for name in names:
+
+            if name.lower() == candidate.lower():
+
+                return name
+
+    return None
+
+
+def read_catalog(filename):
+    """
+    Read a catalog of sources, either a FITS table (like the 3FGL) or a text file with a header line naming the
+    columns. The name, ra and dec columns are required, the variability index and the association are optional.
+
+    :param filename: path of the catalog
+    :return: the sources (a np.recarray with dtype CATALOG_DTYPE; variability is nan and association is empty if
+    they are not in the catalog)
+    """
+
+    if filename.lower().endswith(('.fits', '.fit', '.fits.gz', '.fit.gz')):
+
+        # Imported here because astropy is slow to import, and not needed for text catalogs
+        from astropy.io import fits
+
+        with fits.open(filename) as f:
+
+            tables = [hdu for hdu in f if isinstance(hdu, fits.BinTableHDU)]
+
+            if len(tables) == 0:
+
+                raise IOError("No table in %s" % filename)
+
+            data = tables[0].data
+
+            columns = dict((name, np.array(data.field(name))) for name in data.columns.names)
+
+    else:
+
+        data = np.genfromtxt(filename, names=True, dtype=None, encoding=None)
+
+        columns = dict((name, np.atleast_1d(data[name])) for name in data.dtype.names)
+
+    fields = [_find_column(columns.keys(), candidates) for candidates in (NAME_COLUMNS, RA_COLUMNS, DEC_COLUMNS,
+                                                                           VARIABILITY_COLUMNS, ASSOCIATION_COLUMNS)]
+
+    if None in fields[:3]:
+
+        raise IOError("The catalog %s must have a name, a ra and a dec column (found: %s)"
+                      % (filename, ", ".join(sorted(columns.keys()))))
+
+    n_sources = len(columns[fields[0]])
+
+    catalog = np.zeros(n_sources, dtype=CATALOG_DTYPE).view(np.recarray)
+
+    catalog['name'] = [str(name).strip() for name in columns[fields[0]]]
+    catalog['ra'] = columns[fields[1]]
+    catalog['dec'] = columns[fields[2]]
+    catalog['variability'] = columns[fields[3]] if fields[3] is not None else np.nan
+    catalog['association'] = [str(name).strip() for name in columns[fields[4]]] if fields[4] is not None else ''
+
+    return catalog
+
+
+def read_detections(directory, files):
+    """
+    Read the detections contained in a list of detection files
+
+    :param directory: directory containing the files
+    :param files: names of the detection files
+    :return: (names of the files, one for each detection, detections as a np.recarray as returned by read_triggers)
+    """
+
+    detections = []
+    origins = []
+
+    for filename in files:
+
+        # A file with only the header line has no detections
+        with open(os.path.join(directory, filename)) as f:
+
+            if len([line for line in f if line.strip() != '' and not line.startswith('#')]) == 0:
+
+                continue
+
+        these_detections = read_triggers(os.path.join(directory, filename))
+
+        detections.append(these_detections)
+        origins.extend([filename] * len(these_detections))
+
+    if len(detections) == 0:
+
+        return [], np.zeros(0, dtype=TRIGGER_DTYPE).view(np.recarray)
+
+    return origins, np.concatenate(detections).view(np.recarray)
+
+
+def cross_match(ra, dec, catalog, radius):
+    """
+    Find the closest source of the catalog within radius of each position
+
+    :param ra: R.A. of the detections (degrees)
+    :param dec: Dec. of the detections (degrees)
+    :param catalog: the catalog (as returned by read_catalog)
+    :param radius: maximum distance (degrees) between a detection and its source
+    :return: two arrays (index of the source in the catalog, or -1 if none; distance in degrees, or nan)
+    """
+
+    return SkyIndex(catalog['ra'], catalog['dec']).nearest_within(ra, dec, radius)
+
+
+def _word(text):
+
+    # Names in the catalogs can contain spaces
+    return text.replace(' ', '_') if text != '' else '-'
+
+
+def write_matches(filename, origins, detections, catalog, index, distance):
+    """
+    Write the detections with the source they were matched to (one per line)
+
+    :return: none
+    """
+
+    with open(filename, 'w+') as f:
+
+        f.write("# file name ra dec source distance variability association\n")
+
+        for k in range(len(detections)):
+
+            if index[k] >= 0:
+
+                source = catalog[index[k]]
+
+                match = "%s %.3f %s %s" % (_word(source['name']), distance[k], source['variability'],
+                                           _word(source['association']))
+
+            else:
+
+                match = "- nan nan -"
+
+            f.write("%s %s %s %s %s\n" % (origins[k], detections['name'][k], detections['ra'][k],
+                                          detections['dec'][k], match))
+
+
+# execute only if run from command line
+if __name__ == "__main__":
+
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
+    # create parser for this script
+    parser = argparse.ArgumentParser('Match the detections with a catalog of known sources')
+
+    # add the arguments needed to the parser
+    parser.add_argument("--catalog", help="Catalog of sources: a FITS table (like the 3FGL) or a text file with a "
+                                          "header line naming the columns (name, ra, dec and optionally variability "
+                                          "and association)", type=str, required=True)
+    parser.add_argument("--radius", help="Maximum distance (degrees) between a detection and its source", type=float,
+                        required=True)
+    parser.add_argument("--directory", help="Location of the detection files", type=str, default=os.getcwd())
+    parser.add_argument("--in_list", help="Text file with the names of the detection files to match, as written by "
+                                          "flag_detections.py (default: all the detection files in --directory)",
+                        type=str, default=None)
+    parser.add_argument("--out_file", help="Name of the output file, with the detections and their sources",
+                        type=str, required=True)
+    parser.add_argument("--drop_variable", help="Do not write the detections matched to a source known to be "
+                                                "variable", action='store_true')
+    parser.add_argument("--variability_threshold", help="Variability index above which a source is variable "
+                                                        "(default: %s, as in the 3FGL)" % VARIABILITY_THRESHOLD,
+                        type=float, default=VARIABILITY_THRESHOLD)
+
+    # parse the arguments
+    args = parser.parse_args()
+
+    if args.in_list is not None:
+
+        with open(args.in_list) as f:
+
+            files = [line.strip() for line in f if line.strip() != '']
+
+    else:
+
+        files = get_detection_files(args.directory)
+
+    catalog = read_catalog(args.catalog)
+
+    origins, detections = read_detections(args.directory, files)
+
+    print("%s detections in %s files, %s sources in the catalog" % (len(detections), len(files), len(catalog)))
+
+    start = time.time()
+
+    index, distance = cross_match(detections['ra'], detections['dec'], catalog, args.radius)
+
+    print("Matched in %.3f s" % (time.time() - start))
+
+    matched = index >= 0
+
+    variable = np.zeros(len(detections), dtype=bool)
+    variable[matched] = catalog['variability'][index[matched]] > args.variability_threshold
+
+    print("%s detections matched to a known source (%s of them variable), %s not matched"
+          % (np.sum(matched), np.sum(variable), np.sum(~matched)))
+
+    keep = ~variable if args.drop_variable else np.ones(len(detections), dtype=bool)
+
+    write_matches(args.out_file, [origins[k] for k in np.nonzero(keep)[0]], detections[keep], catalog, index[keep],
+                  distance[keep])
@@ -1,9 +1,340 @@
+import collections
+import datetime
+import os
+import signal
 import subprocess
+import sys
+import threading
+import time
 
+# Result of a command run with run_commands: the command line, its exit code (negative if it was killed by a signal),
+# the wall-clock time it took, whether it was killed because of the timeout, the last lines of its output and the
+# name of its log file (None if no log directory was given)
+CommandResult = collections.namedtuple('CommandResult', ['cmd_line', 'exit_code', 'duration', 'timed_out', 'tail',
+                                                         'log_file'])
 
-def execute_command(cmd_line):
+
+def _timestamp():
+
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _descendants(pid):
+    """
+    Return the pids of the processes started (directly or not) by pid, from /proc (empty list if not available)
+    """
+
+    children = collections.defaultdict(list)
+
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+
+        if not entry.isdigit():
+
+            continue
+
+        try:
+
+            with open('/proc/%s/stat' % entry) as f:
+
+                # The command name (in parenthesis) can contain spaces: the parent pid is the second field after it
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+
+        except (IOError, OSError, IndexError, ValueError):
+
+            # The process ended in the meantime
+            continue
+
+        children[ppid].append(int(entry))
+
+    pids = []
+
+    to_visit = [pid]
+
+    while len(to_visit) > 0:
+
+        for child in children[to_visit.pop()]:
+
+            pids.append(child)
+            to_visit.append(child)
+
+    return pids
+
+
+def _kill(process, own_group):
+    """
+    Kill a command: the whole process group if it has its own, otherwise the shell and the processes it started
+    """
+
+    if own_group:
+
+        pids = []
+
+    else:
+
+        pids = _descendants(process.pid)
+
+    try:
+
+        if own_group:
+
+            os.killpg(process.pid, signal.SIGKILL)
+
+        else:
+
+            process.kill()
+
+    except OSError:
+
+        # Already gone
+        pass
+
+    for pid in pids:
+
+        try:
+
+            os.kill(pid, signal.SIGKILL)
+
+        except OSError:
+
+            pass
+
+
+def _run_one(index, cmd_line, cwd, log_dir, timeout, tail_lines, echo, lock, running=None):
+
+    log_file = None
+
+    if log_dir is not None:
+
+        log_file = os.path.join(log_dir, 'command_%03i.log' % index)
+
+    start = time.time()
+
+    # With a timeout the command gets its own process group, so that the whole tree started by the shell can be
+    # killed. Otherwise it stays in our group, and gets the CTRL-C of the terminal as we do
+    own_group = timeout is not None
+
+    process = subprocess.Popen(cmd_line, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               preexec_fn=os.setsid if own_group else None)
+
+    if running is not None:
+
+        with lock:
+
+            running.append((process, own_group))
+
+    timed_out = [False]
+
+    def kill():
+
+        timed_out[0] = True
+
+        _kill(process, own_group)
+
+    timer = None
+
+    if timeout is not None:
+
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+
+    tail = collections.deque(maxlen=tail_lines)
+
+    log = open(log_file, 'w+') if log_file is not None else None
+
+    try:
+
+        if log is not None:
+
+            log.write("[%s] Executing command: %s\n" % (_timestamp(), cmd_line))
+
+        # readline instead of iterating over the pipe, which in python 2 buffers the output
+        for line in iter(process.stdout.readline, b''):
+
+            if not isinstance(line, str):
+
+                # python 3
+                line = line.decode('utf-8', 'replace')
+
+            line = line.rstrip('\n')
+
+            tail.append(line)
+
+            if log is not None:
+
+                log.write("[%s] %s\n" % (_timestamp(), line))
+                log.flush()
+
+            if echo:
+
+                with lock:
+
+                    print(line)
+                    sys.stdout.flush()
+
+        exit_code = process.wait()
+
+        if log is not None:
+
+            log.write("[%s] Exit code %s after %.1f s%s\n" % (_timestamp(), exit_code, time.time() - start,
+                                                              " (timed out)" if timed_out[0] else ""))
+
+    except BaseException:
+
+        # KeyboardInterrupt or any other error in here: do not leave the command running as an orphan
+        _kill(process, own_group)
+
+        process.wait()
+
+        raise
+
+    finally:
+
+        if timer is not None:
+
+            timer.cancel()
+
+        if running is not None:
+
+            with lock:
+
+                running.remove((process, own_group))
+
+        if log is not None:
+
+            log.close()
+
+    return CommandResult(cmd_line, exit_code, time.time() - start, timed_out[0], list(tail), log_file)
+
+
+def run_commands(cmd_lines, max_workers=1, log_dir=None, timeout=None, cwds=None, tail_lines=20, echo=None):
+    """
+    Run shell commands with at most max_workers of them running at the same time. The output (stdout and stderr) of
+    each command is read line by line as it is produced, and written with a timestamp to its own log file in log_dir.
+
+    :param cmd_lines: list of command lines
+    :param max_workers: maximum number of commands running at the same time
+    :param log_dir: directory for the log files (command_000.log, command_001.log...). If None, no log is written
+    :param timeout: commands running longer than this (seconds) are killed (default: no timeout)
+    :param cwds: list with the working directory of each command (default: the current directory)
+    :param tail_lines: number of lines at the end of the output kept in the results
+    :param echo: whether to print the output as well (default: only if there is no log directory)
+    :return: a list of CommandResult, in the same order as cmd_lines (commands are not checked for failures)
+    """
+
+    cmd_lines = list(cmd_lines)
+
+    if cwds is None:
+
+        cwds = [None] * len(cmd_lines)
+
+    if len(cwds) != len(cmd_lines):
+
+        raise RuntimeError("You need to provide one working directory for each command")
+
+    if echo is None:
+
+        echo = log_dir is None
+
+    if log_dir is not None and not os.path.exists(log_dir):
+
+        os.makedirs(log_dir)
+
+    results = [None] * len(cmd_lines)
+
+    next_command = [0]
+
+    lock = threading.Lock()
+
+    # Commands currently running, killed if we are interrupted
+    running = []
+
+    def worker():
+
+        while True:
+
+            with lock:
+
+                index = next_command[0]
+                next_command[0] += 1
+
+            if index >= len(cmd_lines):
+
+                return
+
+            try:
+
+                results[index] = _run_one(index, cmd_lines[index], cwds[index], log_dir, timeout, tail_lines, echo,
+                                          lock, running)
+
+            except Exception as e:
+
+                # e.g., the working directory does not exist. Keep going with the other commands
+                results[index] = CommandResult(cmd_lines[index], None, 0.0, False, [str(e)], None)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(max_workers, len(cmd_lines))))]
+
+    for thread in threads:
+
+        thread.daemon = True
+        thread.start()
+
+    try:
+
+        for thread in threads:
+
+            # join with a timeout, so that the main thread can still be interrupted with CTRL-C
+            while thread.is_alive():
+
+                thread.join(1.0)
+
+    except BaseException:
+
+        # The workers are not interrupted (only the main thread is): kill their commands before leaving
+        with lock:
+
+            # No new commands
+            next_command[0] = len(cmd_lines)
+
+            for process, own_group in running:
+
+                _kill(process, own_group)
+
+        raise
+
+    return results
+
+
+def check_results(results):
+    """
+    Raise a RuntimeError listing the commands which failed (if any), with the tail of their output
+    """
+
+    failed = [r for r in results if r.exit_code != 0]
+
+    if len(failed) > 0:
+
+        messages = []
+
+        for r in failed:
+
+            status = "timed out" if r.timed_out else "exit code %s" % r.exit_code
+
+            messages.append("%s (%s, log: %s):\n    %s" % (r.cmd_line, status, r.log_file, "\n    ".join(r.tail)))
+
+        raise RuntimeError("%s of %s commands failed:\n%s" % (len(failed), len(results), "\n".join(messages)))
+
+
+def execute_command(cmd_line, timeout=None):
 
     print("\nExecuting command:")
     print(cmd_line)
 
-    subprocess.check_call(cmd_line, shell=True)
\ No newline at end of file
+    sys.stdout.flush()
+
+    # Run in this thread: errors starting the command (OSError) and KeyboardInterrupt reach the caller as they are
+    result = _run_one(0, cmd_line, None, None, timeout, 20, True, threading.Lock())
+
+    if result.exit_code != 0:
+
+        raise subprocess.CalledProcessError(result.exit_code, cmd_line)
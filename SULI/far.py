@@ -0,0 +1,136 @@
+"""False alarm rate (FAR) curves from searches of null simulations. The significance of a trigger is the smallest
+    probability among its blocks (see the probabilities column of the trigger lists): the FAR at a threshold p is the
+    number of triggers with significance <= p per simulated day. Trigger lists are folded into the curve one at a time,
+    as they are produced, and the state (a histogram of the significances and the list of files already counted) is
+    kept in a small JSON file, so that the curve can be updated at any time without reading again what was already
+    counted"""
+
+import json
+import os
+
+import numpy as np
+
+from SULI.remove_redundant_triggers import read_triggers
+
+# Bins in log10(significance). Triggers below the first edge go in the first bin
+LOG_P_EDGES = np.arange(-20.0, 0.0 + 1e-9, 0.25)
+
+
+def trigger_significance(regions):
+    """
+    Return the significance of each trigger: the smallest probability among its blocks
+
+    :param regions: list of triggers (a np.recarray, as returned by read_triggers)
+    :return: a np.array with one value for each trigger
+    """
+
+    return np.array([min(map(float, probabilities.split(","))) for probabilities in regions['probabilities']])
+
+
+def new_state(campaign=None):
+
+    return {'campaign': campaign,
+            'n_days': 0,
+            'n_triggers': 0,
+            'histogram': [0] * (len(LOG_P_EDGES) - 1),
+            'max_per_day': 0,
+            'files': []}
+
+
+def read_state(filename, campaign=None):
+    """
+    Read the state of a FAR curve, or return a new (empty) one if the file does not exist
+    """
+
+    if not os.path.exists(filename):
+
+        return new_state(campaign)
+
+    with open(filename) as f:
+
+        return json.load(f)
+
+
+def write_state(state, filename):
+
+    # Write to a temporary file first, so that a reader never sees half a file
+    temp_file = filename + '.tmp'
+
+    with open(temp_file, 'w+') as f:
+
+        json.dump(state, f)
+
+    os.rename(temp_file, filename)
+
+
+def add_trigger_list(state, filename, key=None):
+    """
+    Fold the triggers of one searched day into the state. Files already counted are skipped.
+
+    :param state: the state of the FAR curve (modified in place)
+    :param filename: trigger list of one day (output of search_for_transients)
+    :param key: name used to recognize the file (default: filename)
+    :return: True if the file was added, False if it was already counted
+    """
+
+    key = filename if key is None else key
+
+    if key in state['files']:
+
+        return False
+
+    regions = read_triggers(filename)
+
+    if len(regions) > 0:
+
+        log_p = np.log10(np.maximum(trigger_significance(regions), 1e-300))
+
+        # Clip to the first and last bin, so that no trigger is lost
+        log_p = np.clip(log_p, LOG_P_EDGES[0], LOG_P_EDGES[-1])
+
+        histogram = np.histogram(log_p, LOG_P_EDGES)[0]
+
+        state['histogram'] = list(np.array(state['histogram']) + histogram)
+
+    state['histogram'] = [int(x) for x in state['histogram']]
+    state['n_days'] += 1
+    state['n_triggers'] += len(regions)
+    state['max_per_day'] = max(state['max_per_day'], len(regions))
+    state['files'].append(key)
+
+    return True
+
+
+def far_curve(state, day_length=86400.0):
+    """
+    Return the FAR curve
+
+    :param state: the state of the FAR curve
+    :param day_length: length of the simulated days (seconds)
+    :return: (thresholds, n_triggers, far) where n_triggers is the number of triggers with significance <= threshold
+    and far is the corresponding rate (triggers per day)
+    """
+
+    thresholds = 10 ** LOG_P_EDGES[1:]
+
+    n_triggers = np.cumsum(state['histogram'])
+
+    if state['n_days'] == 0:
+
+        return thresholds, n_triggers, np.zeros(len(thresholds))
+
+    return thresholds, n_triggers, n_triggers / (state['n_days'] * day_length / 86400.0)
+
+
+def write_far_curve(state, filename):
+
+    thresholds, n_triggers, far = far_curve(state)
+
+    with open(filename, 'w+') as f:
+
+        f.write("# campaign: %s, days: %s, triggers: %s\n" % (state['campaign'], state['n_days'], state['n_triggers']))
+        f.write("# threshold n_triggers far_per_day far_per_year\n")
+
+        for threshold, n, rate in zip(thresholds, n_triggers, far):
+
+            f.write("%.3g %i %.6g %.6g\n" % (threshold, n, rate, rate * 365.25))
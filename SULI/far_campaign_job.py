@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+"""Farm job of a false alarm rate campaign (see submit_far_campaign.py): simulates, searches and cleans (removing the
+    redundant triggers) several days, one after the other, in the same process and in the same scheduler slot. The
+    input FT2 file and the simulation inputs are staged in once for all the days. The trigger list of each day is
+    copied to [out_dir]/replica_[replica]/[day]_detections.txt as soon as it is ready. A day which fails leaves
+    [out_dir]/replica_[replica]/[day]_failed.txt instead (with the error), so that the submitter knows it is over.
+
+    The days are given in a task file with one line per day: replica, start of the day (MET) and seed"""
+
+import argparse
+import glob
+import os
+import shutil
+import traceback
+
+from SULI.cli import run
+from SULI.profiling import profile_script
+from SULI.scratch import make_workdir, simulation_space, staged_copy
+
+
+def clean_up():
+
+    # First move out of the workdir
+    os.chdir(os.path.expanduser('~'))
+
+    # Now remove the directory
+    try:
+
+        shutil.rmtree(workdir)
+
+    except:
+
+        print("Could not remove workdir. Unfortunately I left behind some trash!!")
+        raise
+
+    else:
+
+        print("Clean up completed.")
+
+
+def read_tasks(filename):
+    """
+    Read a task file
+
+    :param filename: path of the task file
+    :return: a list of (replica, day start, seed)
+    """
+
+    tasks = []
+
+    with open(filename) as f:
+
+        for line in f:
+
+            tokens = line.split()
+
+            if len(tokens) == 0 or tokens[0].startswith('#'):
+
+                continue
+
+            tasks.append((int(tokens[0]), float(tokens[1]), int(tokens[2])))
+
+    return tasks
+
+
+def write_tasks(tasks, filename):
+
+    with open(filename, 'w+') as f:
+
+        f.write("# replica day_start seed\n")
+
+        for replica, day_start, seed in tasks:
+
+            f.write("%i %.1f %i\n" % (replica, day_start, seed))
+
+
+def detection_file_name(out_dir, replica, day_start):
+
+    return os.path.join(out_dir, 'replica_%03i' % replica, '%i_detections.txt' % int(day_start))
+
+
+def failed_file_name(out_dir, replica, day_start):
+
+    return os.path.join(out_dir, 'replica_%03i' % replica, '%i_failed.txt' % int(day_start))
+
+
+def make_replica_dir(out_dir, replica):
+
+    directory = os.path.join(out_dir, 'replica_%03i' % replica)
+
+    if not os.path.exists(directory):
+
+        try:
+
+            os.makedirs(directory)
+
+        except OSError:
+
+            # Another job created it in the meantime
+            pass
+
+
+if __name__ == "__main__":
+
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
+    parser = argparse.ArgumentParser('Simulate and search several days of a false alarm rate campaign')
+
+    parser.add_argument("--tasks", help="Task file (one line per day: replica, day start and seed)", required=True,
+                        type=str)
+    parser.add_argument("--in_ft2", help="Ft2 file used for the simulations", required=True, type=str)
+    parser.add_argument("--src_dir", help="Directory containing the input files for the simulation", required=True,
+                        type=str)
+    parser.add_argument("--out_dir", help="Directory which will contain the trigger lists", required=True, type=str)
+    parser.add_argument("--irf", help="Instrument response function name to be used", type=str, required=True)
+    parser.add_argument("--probability", help="Probability of null hypothesis", type=float, default=1e-5)
+    parser.add_argument("--min_dist", help="Distance above which regions are not considered to overlap", type=float,
+                        required=True)
+    parser.add_argument("--interval", help="Length of the simulated days (default 24 hours)", type=float,
+                        default=86400.0)
+    parser.add_argument("--scratch_size", help="Scratch space needed by the job (GB, default: estimated, see "
+                                               "SULI.scratch)", type=float, default=None)
+
+    args = parser.parse_args()
+
+    # Check that the output dir already exists
+    if not os.path.exists(args.out_dir):
+
+        raise IOError("You need to create the directory %s before running this script" % args.out_dir)
+
+    tasks = read_tasks(args.tasks)
+
+    out_dir = os.path.abspath(args.out_dir)
+
+    # Stage-in, once for all the days
+
+    # This is your unique job ID (a number like 546127)
+    unique_id = os.environ.get("PBS_JOBID").split(".")[0]
+
+    # The work directory goes in the fastest scratch space of the node with enough room (see SULI.scratch). The days
+    # are done one at a time, and each one is removed when its trigger list has been copied out
+    if args.scratch_size is not None:
+
+        needed = args.scratch_size * 1024 ** 3
+
+    else:
+
+        needed = simulation_space([args.in_ft2, args.src_dir], 1, args.interval)
+
+    workdir = make_workdir(needed, unique_id)
+
+    failed = []
+
+    try:
+
+        os.chdir(workdir)
+
+        local_ft2 = os.path.join(workdir, os.path.basename(args.in_ft2))
+
+        staged_copy(args.in_ft2, local_ft2)
+
+        local_src_dir = os.path.join(workdir, os.path.basename(os.path.normpath(args.src_dir)))
+
+        staged_copy(args.src_dir, local_src_dir)
+
+        for i, (replica, day_start, seed) in enumerate(tasks):
+
+            print("\n\nDay %s of %s: replica %s, start %s, seed %s" % (i + 1, len(tasks), replica, day_start, seed))
+
+            day_dir = os.path.join(workdir, 'day_%03i' % i)
+
+            os.mkdir(day_dir)
+            os.chdir(day_dir)
+
+            try:
+
+                # The FT2 file is cut with its time index, which is built once (next to local_ft2) for all the days
+                run('simulate', ['--tstart', str(day_start), '--in_ft2', local_ft2, '--src_dir', local_src_dir,
+                                 '--n_days', '1', '--interval', str(args.interval), '--seed', str(seed),
+                                 '--use_index'])
+
+                ft1 = glob.glob("simulated_*_ft1.fits")[0]
+                ft2 = glob.glob("simulated_*_ft2.fits")[0]
+
+                out_name = '%i_detections.txt' % int(day_start)
+
+                run('search', ['--inp_fts', '%s,%s' % (os.path.abspath(ft1), os.path.abspath(ft2)), '--irf', args.irf,
+                               '--probability', str(args.probability), '--min_dist', str(args.min_dist),
+                               '--out_file', out_name])
+
+                # Stage-out of this day
+                destination = detection_file_name(out_dir, replica, day_start)
+
+                make_replica_dir(out_dir, replica)
+
+                # Copy to a temporary name and rename, so that the collector never reads a partial file
+                shutil.copy(out_name, destination + '.part')
+                os.rename(destination + '.part', destination)
+
+            except (Exception, SystemExit):
+
+                # One bad day should not lose the other days of this job
+                traceback.print_exc()
+
+                failed.append((replica, day_start))
+
+                try:
+
+                    make_replica_dir(out_dir, replica)
+
+                    with open(failed_file_name(out_dir, replica, day_start), 'w+') as f:
+
+                        f.write(traceback.format_exc())
+
+                except (IOError, OSError):
+
+                    traceback.print_exc()
+
+            finally:
+
+                os.chdir(workdir)
+                shutil.rmtree(day_dir)
+
+    finally:
+
+        clean_up()
+
+    print("\n%s days done, %s failed" % (len(tasks) - len(failed), len(failed)))
+
+    for replica, day_start in failed:
+
+        print("Failed: replica %s, day %s" % (replica, day_start))
+
+    if len(failed) > 0:
+
+        raise RuntimeError("%s days of %s failed" % (len(failed), len(tasks)))
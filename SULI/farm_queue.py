@@ -0,0 +1,96 @@
+"""Submission of farm jobs and checks of which of them are still in the queue. The job ids printed by qsub are
+    appended to a file, so that a campaign (or a later run of its submitter) can tell the jobs which are still queued
+    or running from the ones which are gone (finished, failed or killed by the scheduler)"""
+
+import os
+import subprocess
+
+# Job states of qstat for jobs which are not going to run anymore (Completed, Exiting)
+ENDED_STATES = ('C', 'E')
+
+
+def short_id(job_id):
+    """
+    Return the number of a job id (546127 for 546127.server)
+    """
+
+    return job_id.strip().split('.')[0]
+
+
+def submit_job(cmd_line, ids_file=None):
+    """
+    Submit a job with qsub
+
+    :param cmd_line: the qsub command line
+    :param ids_file: if given, the id of the job is appended to this file
+    :return: the id of the job (as printed by qsub)
+    """
+
+    job_id = subprocess.check_output(cmd_line, shell=True).decode('utf-8', 'replace').strip()
+
+    print("Submitted job %s" % job_id)
+
+    if ids_file is not None:
+
+        with open(ids_file, 'a') as f:
+
+            f.write("%s\n" % job_id)
+
+    return job_id
+
+
+def read_job_ids(ids_file):
+    """
+    Return the ids in a file written by submit_job (an empty list if it does not exist)
+    """
+
+    if not os.path.exists(ids_file):
+
+        return []
+
+    with open(ids_file) as f:
+
+        return [line.strip() for line in f if line.strip() != '']
+
+
+def jobs_in_queue(job_ids):
+    """
+    Return the jobs (among job_ids) which are still queued or running according to qstat
+
+    :param job_ids: list of job ids
+    :return: the set of the short ids (see short_id) still in the queue, or None if qstat could not be run (the
+    state of the jobs is then unknown)
+    """
+
+    wanted = set(short_id(job_id) for job_id in job_ids)
+
+    if len(wanted) == 0:
+
+        return set()
+
+    try:
+
+        with open(os.devnull, 'w') as devnull:
+
+            lines = subprocess.check_output("qstat", shell=True, stderr=devnull).decode('utf-8', 'replace')
+
+    except (subprocess.CalledProcessError, OSError):
+
+        return None
+
+    in_queue = set()
+
+    for line in lines.split("\n"):
+
+        tokens = line.split()
+
+        # Job lines: id, name, user, time used, state, queue
+        if len(tokens) < 6 or short_id(tokens[0]) not in wanted:
+
+            continue
+
+        if tokens[4] not in ENDED_STATES:
+
+            in_queue.add(short_id(tokens[0]))
+
+    return in_queue
@@ -0,0 +1,130 @@
+"""Cheap access to the time extent of FT1/FT2 files. FT2 files can be several GB, and most of the scripts only need
+    the first START and the last STOP: these functions read the headers and the first and last rows of the sorted
+    time columns directly from the file, without loading the tables into memory"""
+
+import numpy as np
+from astropy.io import fits
+
+
+def header_extent(filename, extension=0):
+    """
+    Return the TSTART and TSTOP keywords of the given extension (only the headers are read)
+
+    :param filename: path of the FITS file
+    :param extension: name or number of the extension
+    :return: (tstart, tstop)
+    """
+
+    header = fits.getheader(filename, extension)
+
+    return header['TSTART'], header['TSTOP']
+
+
+def _column_layout(hdu, column):
+
+    # Offset of the column inside a row, and its type (FITS tables are always big-endian)
+    dtype, offset = hdu.columns.dtype.fields[column][:2]
+
+    dtype = dtype.newbyteorder('>')
+
+    col = hdu.columns[column]
+
+    scale = col.bscale if col.bscale is not None else 1.0
+    zero = col.bzero if col.bzero is not None else 0.0
+
+    return dtype, offset, scale, zero
+
+
+def read_rows(filename, extension, column, rows):
+    """
+    Read the values of a scalar column in the given rows of a binary table, reading only those rows from the file
+
+    :param filename: path of the FITS file
+    :param extension: name or number of the binary table extension
+    :param column: name of the column
+    :param rows: list of row numbers (negative numbers count from the end, as for python lists)
+    :return: a np.array with the values (empty if the table is empty)
+    """
+
+    with fits.open(filename, memmap=True) as f:
+
+        hdu = f[extension]
+
+        n_rows = hdu.header['NAXIS2']
+        row_length = hdu.header['NAXIS1']
+
+        if n_rows == 0:
+
+            return np.zeros(0)
+
+        dtype, offset, scale, zero = _column_layout(hdu, column)
+
+        data_start = hdu.fileinfo()['datLoc']
+
+    values = []
+
+    with open(filename, 'rb') as f:
+
+        for row in rows:
+
+            row = row if row >= 0 else n_rows + row
+
+            if row < 0 or row >= n_rows:
+
+                raise IndexError("Row %s does not exist in extension %s of %s" % (row, extension, filename))
+
+            f.seek(data_start + row * row_length + offset)
+
+            values.append(np.frombuffer(f.read(dtype.itemsize), dtype=dtype)[0])
+
+    return np.array(values, dtype=float) * scale + zero
+
+
+def column_endpoints(filename, extension, column):
+    """
+    Return the values of a column in the first and in the last row of a table. For a sorted column (like TIME in FT1
+    files and START/STOP in FT2 files) these are its minimum and its maximum.
+
+    :return: (first, last), or (None, None) if the table is empty
+    """
+
+    values = read_rows(filename, extension, column, [0, -1])
+
+    if len(values) == 0:
+
+        return None, None
+
+    return values[0], values[1]
+
+
+def time_extent(filename, extension, start_column, stop_column=None):
+    """
+    Return the time interval covered by a table with sorted time columns: the first value of start_column and the
+    last value of stop_column (or of start_column, if stop_column is None). For example
+    time_extent(ft2, 'SC_DATA', 'START', 'STOP') or time_extent(ft1, 'EVENTS', 'TIME').
+
+    :return: (tstart, tstop), or (None, None) if the table is empty
+    """
+
+    stop_column = start_column if stop_column is None else stop_column
+
+    tstart = column_endpoints(filename, extension, start_column)[0]
+    tstop = column_endpoints(filename, extension, stop_column)[1]
+
+    return tstart, tstop
+
+
+def gti_extent(filename):
+    """
+    Return the interval covered by the Good Time Intervals of a FT1 file (the GTI table is small, so it is read
+    entirely, and it is not assumed to be sorted)
+
+    :return: (start, stop)
+    """
+
+    with fits.open(filename, memmap=True) as f:
+
+        starts = f['GTI'].data.field('START')
+        stops = f['GTI'].data.field('STOP')
+
+        return float(starts.min()), float(stops.max())
@@ -10,11 +10,60 @@ import subprocess
 import os
 from os import listdir
 from os.path import join
+from SULI.profiling import profile_script
+
+
+def get_detection_files(directory):
+    """
+    Return the names of all the detection files (from search_for_transients) contained in a directory
+
+    :param directory: directory to be searched
+    :return: a list of file names (without the path)
+    """
+
+    return [f for f in listdir(directory) if (str(join(directory, f)).endswith('_detections.txt'))]
+
+
+def count_detections(filename):
+    """
+    Return the number of detections contained in a detection file
+
+    :param filename: path of the detection file
+    :return: the number of detections
+    """
+
+    return np.recfromtxt(filename, names=True, usemask=False).size
+
+
+def flag_days(directory, files, threshold):
+    """
+    Find the detection files which contain at least threshold detections
+
+    :param directory: directory containing the files
+    :param files: names of the detection files to check
+    :param threshold: number of detections required for a day to be flagged
+    :return: a list of (file name, number of detections) for the flagged files
+    """
+
+    flagged = []
+
+    for filename in files:
+
+        n_detections = count_detections(directory + '/' + filename)
+
+        if n_detections >= threshold:
+
+            flagged.append((filename, n_detections))
+
+    return flagged
 
 
 # execute only if run from command line
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     # create parser for this script
     parser = argparse.ArgumentParser('Search input folder')
 
@@ -32,24 +81,15 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     # get list of all .txt files in directory
-    files = [f for f in listdir(args.directory) if (str(join(args.directory, f)).endswith('_detections.txt'))]
+    files = get_detection_files(args.directory)
 
     # flag all files with events
-    interesting_files = []
+    interesting_files = flag_days(args.directory, files, args.threshold)
 
-    # for all day files
-    for i in range(len(files)):
+    # display file contents regardless, if specified
+    if args.display is True:
 
-        # get the contents of file
-        active_file_detections = np.recfromtxt(args.directory + '/' + files[i], names=True, usemask=False)
-
-        # if it is not empty, add to list of notable files
-        if active_file_detections.size >= args.threshold:
-
-            interesting_files.append(files[i])
-
-        # display file contents regardless, if specified
-        if args.display is True:
+        for i in range(len(files)):
 
             print '\n%s:' % files[i]
             cmd_line = 'cat %s' % files[i]
@@ -64,30 +104,21 @@ if __name__ == "__main__":
 
         n_detections = 0
 
-        # recarray for all detections
-        detections = np.recarray((0,), dtype=[('name', str), ('ra', float), ('dec', float), ('tstarts', str),
-                                              ('tstops', str), ('counts', str), ('probability', str)])
-
         print 'The following files have detections:\n'
 
         with open(args.out_file + '.txt', 'w+') as f:
 
-            for i in range(len(interesting_files)):
-
-                # get list of detections in interesting_files[i] and print its length
-
-                active_file_detections = np.recfromtxt(args.directory + '/' + interesting_files[i], names=True,
-                                                       usemask=False)
+            for filename, n_file_detections in interesting_files:
 
-                print '%s (%s detections)' % (interesting_files[i], active_file_detections.size)
+                # print the number of detections in this file
 
-                # and add its detections to master array in order of significance
+                print '%s (%s detections)' % (filename, n_file_detections)
 
-                n_detections += active_file_detections.size
+                n_detections += n_file_detections
 
                 # and write to out_file if specified
                 if args.out_file:
 
-                    f.write("%s\n" % (interesting_files[i]))
+                    f.write("%s\n" % filename)
 
         print '\n%s Total detections' % n_detections
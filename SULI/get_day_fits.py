@@ -8,13 +8,19 @@
 import argparse
 import os
 import numpy as np
-from GtApp import GtApp
 from astropy.io import fits
 from SULI.execute_command import execute_command
+from SULI.fits_access import header_extent, time_extent
+from SULI.time_index import cut_file
+from SULI.tool_layer import tool_command, gt_app
+from SULI.profiling import profile_script
 
 # execute only if run from command line
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     # create parser for this script
     parser = argparse.ArgumentParser(
         'Split Fermi data file (.fits) into multiple smaller files each spanning 24 hours by default')
@@ -32,16 +38,15 @@ if __name__ == "__main__":
                         type=float, default=180)
     parser.add_argument("--interval", help="Length of time interval covered by output files (default 24 hours)",
                         type=float, default=86400.0)
+    parser.add_argument("--use_index", help="Cut the input files using their time index (see SULI.time_index), "
+                                            "which is built if needed, instead of fcopy", action='store_true')
 
     # parse the arguments
     args = parser.parse_args()
 
     # get input ft1 file from parser and retrieve start and stop times
 
-    with fits.open(args.in_ft1) as ft1:
-
-        event_file_start = ft1[0].header['TSTART']
-        event_file_end = ft1[0].header['TSTOP']
+    event_file_start, event_file_end = header_extent(args.in_ft1)
 
     duration = event_file_end - event_file_start
 
@@ -66,16 +71,25 @@ if __name__ == "__main__":
         print "Intends to make ft1 cut beginning at %s, ending at %s (%sth cut)" % (this_ft1_start, this_ft1_stop, i)
 
         # Pre-cut the FT1 file for speed
-        cmd_line = "fcopy '%s[EVENTS][TIME >= %s && TIME =< %s]' '!%s'" % (args.in_ft1, this_ft1_start - 1000.0,
-                                                                           this_ft1_stop + 1000.0, temp_ft1)
+        if args.use_index:
+
+            n_rows = cut_file(args.in_ft1, temp_ft1, this_ft1_start - 1000.0, this_ft1_stop + 1000.0)
+
+            print("Copied %s events to %s using the time index" % (n_rows, temp_ft1))
+
+        else:
+
+            cmd_line = "%s '%s[EVENTS][TIME >= %s && TIME =< %s]' '!%s'" % (tool_command('fcopy'), args.in_ft1,
+                                                                            this_ft1_start - 1000.0,
+                                                                            this_ft1_stop + 1000.0, temp_ft1)
 
-        # execute cut
-        execute_command(cmd_line)
+            # execute cut
+            execute_command(cmd_line)
 
         # cut ft1
         out_ft1 = str(this_ft1_start) + '_ft1.fit'
 
-        gtselect = GtApp('gtselect')
+        gtselect = gt_app('gtselect')
 
         gtselect['infile'] = temp_ft1
 
@@ -131,29 +145,34 @@ if __name__ == "__main__":
         # prepare cut command
         out_name = str(this_ft2_start) + '_ft2.fit'
 
-        cmd_line = "fcopy '%s[SC_DATA][START >= %s && STOP =< %s]' '!%s'" % (args.in_ft2, this_ft2_start,
-                                                                             this_ft2_stop, out_name)
+        if args.use_index:
 
-        # execute cut
-        execute_command(cmd_line)
+            n_rows = cut_file(args.in_ft2, out_name, this_ft2_start, this_ft2_stop, stop_column='STOP')
 
-        # Verify that the command executed and update the header
+            print("Copied %s rows to %s using the time index" % (n_rows, out_name))
+
+        else:
+
+            cmd_line = "%s '%s[SC_DATA][START >= %s && STOP =< %s]' '!%s'" % (tool_command('fcopy'), args.in_ft2,
+                                                                              this_ft2_start, this_ft2_stop, out_name)
 
-        with fits.open(out_name) as out_ft2:
+            # execute cut
+            execute_command(cmd_line)
+
+        # Verify that the command executed and update the header
 
-            # Check the start and stop in the binary table
-            starts = out_ft2['SC_DATA'].data.field("START")
-            stops = out_ft2['SC_DATA'].data.field("STOP")
+        # Check the start and stop in the binary table
+        ft2_start, ft2_stop = time_extent(out_name, 'SC_DATA', 'START', 'STOP')
 
-            print '\nFt2 begins at %s, ends at %s \n' % (starts.min(), stops.max())
+        print '\nFt2 begins at %s, ends at %s \n' % (ft2_start, ft2_stop)
 
-            if starts.min() - this_ft1_start > 0:
+        if ft2_start - this_ft1_start > 0:
 
-                raise RuntimeError("FT2 file starts after the FT1 file")
+            raise RuntimeError("FT2 file starts after the FT1 file")
 
-            if stops.max() - this_ft1_stop < 0:
+        if ft2_stop - this_ft1_stop < 0:
 
-                raise RuntimeError("FT2 file stops before the end of the FT1 file")
+            raise RuntimeError("FT2 file stops before the end of the FT1 file")
 
         print "Removing temporary file"
         os.remove(temp_ft1)
@@ -161,10 +180,10 @@ if __name__ == "__main__":
         # Update the header
         with fits.open(out_name, mode='update') as out_ft2:
 
-            out_ft2['SC_DATA'].header.set("TSTART", starts.min())
-            out_ft2['SC_DATA'].header.set("TSTOP", stops.max())
+            out_ft2['SC_DATA'].header.set("TSTART", ft2_start)
+            out_ft2['SC_DATA'].header.set("TSTOP", ft2_stop)
 
-            out_ft2[0].header.set("TSTART", starts.min())
-            out_ft2[0].header.set("TSTOP", stops.max())
+            out_ft2[0].header.set("TSTART", ft2_start)
+            out_ft2[0].header.set("TSTOP", ft2_stop)
 
     print "Finished"
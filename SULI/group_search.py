@@ -4,16 +4,19 @@
     This is obviously only appropriately used for simulated data"""
 
 import argparse
-from astropy.io import fits
 import os
 from os import listdir
 from os.path import join
 
-from SULI.execute_command import execute_command
+from SULI.execute_command import run_commands, check_results
+from SULI.profiling import profile_script
 
 # execute only if run from command line
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     # create parser for this script
     parser = argparse.ArgumentParser('Search input folder')
 
@@ -28,6 +31,10 @@ if __name__ == "__main__":
     parser.add_argument("--loglevel", help="Level of log detail (DEBUG, INFO)", default='info')
     parser.add_argument("--logfile", help="Name of logfile for the ltfsearch.py script", default='ltfsearch.log')
     parser.add_argument("--workdir", help="Path of work directory", default=os.getcwd())
+    parser.add_argument("--jobs", help="Number of searches running at the same time (default: 1)", type=int,
+                        default=1)
+    parser.add_argument("--timeout", help="Kill searches running longer than this (seconds, default: no limit)",
+                        type=float, default=None)
 
     # parse the arguments
     args = parser.parse_args()
@@ -63,6 +70,14 @@ if __name__ == "__main__":
 
         print 'Found ' + str(len(ft1_files)) + ' fits pairs\n'
 
+        # Imported here because astropy is slow to import, and only needed when there are files to search
+        from astropy.io import fits
+
+        workdir = os.path.abspath(os.path.expandvars(os.path.expanduser(args.workdir)))
+
+        cmd_lines = []
+        cwds = []
+
         for i in range(len(ft1_files)):
 
             # use start time of ft1 for outfile name, since ft2 starts early due to buffer
@@ -70,12 +85,33 @@ if __name__ == "__main__":
 
                 file_start = ft1[0].header['TSTART']
 
-            out_name = str(file_start) + '_detections.txt'
+            out_name = os.path.abspath(str(file_start) + '_detections.txt')
+
+            # Each search needs its own directory, because search_for_transients.py writes temporary files
+            # in the current directory
+            this_workdir = os.path.join(workdir, 'search_%s' % file_start)
+
+            if not os.path.exists(this_workdir):
 
-            print 'Preparing Bayesian blocks analysis on fits pair %s of %s...\n' % (i + 1, str(len(ft1_files)))
+                os.makedirs(this_workdir)
 
             cmd_line = 'search_for_transients.py --inp_fts %s,%s --irf %s --probability %s --min_dist %s ' \
-                       '--out_file %s' % (args.directory + '/' + ft1_files[i], args.directory + '/' + ft2_files[i],
-                                          args.irf, args.probability, args.min_dist, out_name)
+                       '--out_file %s --loglevel %s --logfile %s --workdir %s' % \
+                       (os.path.abspath(join(args.directory, ft1_files[i])),
+                        os.path.abspath(join(args.directory, ft2_files[i])), args.irf, args.probability,
+                        args.min_dist, out_name, args.loglevel, args.logfile, this_workdir)
+
+            cmd_lines.append(cmd_line)
+            cwds.append(this_workdir)
+
+        print 'Running Bayesian blocks analysis on %s fits pairs, %s at a time...\n' % (len(cmd_lines), args.jobs)
+
+        results = run_commands(cmd_lines, max_workers=args.jobs, log_dir=join(workdir, 'logs'), timeout=args.timeout,
+                               cwds=cwds)
+
+        for ft1_file, result in zip(ft1_files, results):
+
+            print '%s: exit code %s after %.1f s (log: %s)' % (ft1_file, result.exit_code, result.duration,
+                                                              result.log_file)
 
-            execute_command(cmd_line)
+        check_results(results)
@@ -0,0 +1,345 @@
+"""In-process light curves of a region of the sky: events are read from the FT1 files in chunks (with memmap, reading
+    only the columns needed), selected with the same cuts used by gtselect (cone, energy, zenith angle and event class)
+    and binned in time with np.histogram. Files are processed in parallel. Contrary to gtbin + gtexposure, this only
+    gives counts (no exposure). Many regions can be done with a single pass over the files (see light_curves)"""
+
+import multiprocessing
+
+import numpy as np
+from astropy.io import fits
+
+from SULI.sky_index import SkyIndex
+
+# Rows read at a time from each file
+CHUNK_SIZE = 1000000
+
+
+def linear_time_bins(tstart, tstop, dtime):
+    """
+    Return the edges of the time bins of a light curve with linear binning (like gtbin with tbinalg=LIN)
+    """
+
+    n_bins = int(np.ceil((tstop - tstart) / dtime - 1e-9))
+
+    return tstart + dtime * np.arange(n_bins + 1)
+
+
+def event_class_mask(event_class, evclass):
+    """
+    Return which events belong to the given event class (a bit mask, like 128 for SOURCE)
+
+    :param event_class: the EVENT_CLASS column, either an integer column or a bit array (32X column, where the
+    first element is the most significant bit)
+    :param evclass: the event class
+    :return: a boolean array
+    """
+
+    event_class = np.asarray(event_class)
+
+    if event_class.ndim == 1:
+
+        return (event_class.astype(np.int64) & int(evclass)) != 0
+
+    else:
+
+        # Bit array: convert to the integer it represents
+        n_bits = event_class.shape[1]
+
+        weights = 2 ** np.arange(n_bits - 1, -1, -1, dtype=np.int64)
+
+        return (np.dot(event_class.astype(np.int64), weights) & int(evclass)) != 0
+
+
+def _cos_distance(ra, dec, center_ra, center_dec):
+
+    ra_rad, dec_rad = np.radians(ra), np.radians(dec)
+    center_ra_rad, center_dec_rad = np.radians(center_ra), np.radians(center_dec)
+
+    return np.sin(dec_rad) * np.sin(center_dec_rad) + \
+        np.cos(dec_rad) * np.cos(center_dec_rad) * np.cos(ra_rad - center_ra_rad)
+
+
+def _selected_chunks(data, edges, emin, emax, zmax, evclass):
+
+    # Yield (times, ra, dec) of the events passing the time, energy, zenith and event class cuts, chunk by chunk
+
+    names = [name.upper() for name in data.columns.names]
+
+    for start in range(0, len(data), CHUNK_SIZE):
+
+        chunk = data[start:start + CHUNK_SIZE]
+
+        times = chunk.field('TIME')
+
+        mask = (times >= edges[0]) & (times <= edges[-1])
+
+        energy = chunk.field('ENERGY')
+
+        mask &= (energy >= emin) & (energy <= emax)
+
+        if 'ZENITH_ANGLE' in names and zmax < 180.0:
+
+            mask &= chunk.field('ZENITH_ANGLE') <= zmax
+
+        if evclass is not None and 'EVENT_CLASS' in names:
+
+            mask &= event_class_mask(chunk.field('EVENT_CLASS'), evclass)
+
+        yield times[mask], chunk.field('RA')[mask], chunk.field('DEC')[mask]
+
+
+def file_counts(filename, edges, ra, dec, radius, emin=100.0, emax=100000.0, zmax=180.0, evclass=None):
+    """
+    Return the counts in the given time bins of the events of one FT1 file within radius degrees from (ra, dec)
+
+    :param filename: path of the FT1 file
+    :param edges: edges of the time bins
+    :param ra: R.A. of the center of the region (degrees)
+    :param dec: Dec. of the center of the region (degrees)
+    :param radius: radius of the region (degrees)
+    :param emin: minimum energy (MeV)
+    :param emax: maximum energy (MeV)
+    :param zmax: maximum zenith angle (degrees)
+    :param evclass: event class (None to keep all the events)
+    :return: a np.array with the counts in each bin
+    """
+
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+
+    cos_radius = np.cos(np.radians(radius))
+
+    with fits.open(filename, memmap=True) as f:
+
+        for times, events_ra, events_dec in _selected_chunks(f['EVENTS'].data, edges, emin, emax, zmax, evclass):
+
+            in_region = _cos_distance(events_ra, events_dec, ra, dec) >= cos_radius
+
+            counts += np.histogram(times[in_region], edges)[0]
+
+    return counts
+
+
+def file_counts_many(filename, edges, sources_ra, sources_dec, radius, emin=100.0, emax=100000.0, zmax=180.0,
+                     evclass=None):
+    """
+    Same as file_counts, for many regions at once: the file is read once, and the events of each chunk are put in a
+    SkyIndex, so that each region only looks at the events in its band of declinations
+
+    :param sources_ra: R.A. of the centers of the regions (degrees)
+    :param sources_dec: Dec. of the centers of the regions (degrees)
+    :param radius: radius of the regions (degrees), one value or one for each region
+    :return: a (n_regions, n_bins) np.array with the counts
+    """
+
+    radius = np.broadcast_to(np.asarray(radius, dtype=float), np.shape(sources_ra))
+
+    counts = np.zeros((len(sources_ra), len(edges) - 1), dtype=np.int64)
+
+    with fits.open(filename, memmap=True) as f:
+
+        for times, events_ra, events_dec in _selected_chunks(f['EVENTS'].data, edges, emin, emax, zmax, evclass):
+
+            index = SkyIndex(events_ra, events_dec)
+
+            for i, idx in enumerate(index.query_many(sources_ra, sources_dec, radius)):
+
+                counts[i] += np.histogram(times[idx], edges)[0]
+
+    return counts
+
+
+def _file_counts_star(args):
+
+    return file_counts(*args)
+
+
+def _file_counts_many_star(args):
+
+    return file_counts_many(*args)
+
+
+def _map(function, tasks, n_processes):
+
+    if n_processes > 1 and len(tasks) > 1:
+
+        pool = multiprocessing.Pool(min(n_processes, len(tasks)))
+
+        try:
+
+            return pool.map(function, tasks)
+
+        finally:
+
+            pool.close()
+            pool.join()
+
+    else:
+
+        return [function(task) for task in tasks]
+
+
+def light_curve(files, tstart, tstop, dtime, ra, dec, radius, emin=100.0, emax=100000.0, zmax=180.0, evclass=None,
+                n_processes=1):
+    """
+    Light curve (counts only) of a region of the sky from a list of FT1 files, with linear binning
+
+    :param files: list of FT1 files
+    :param tstart: start of the light curve
+    :param tstop: end of the light curve
+    :param dtime: size of the bins
+    :param n_processes: number of files processed in parallel
+    :return: (edges, counts)
+    """
+
+    edges = linear_time_bins(tstart, tstop, dtime)
+
+    tasks = [(filename, edges, ra, dec, radius, emin, emax, zmax, evclass) for filename in files]
+
+    results = _map(_file_counts_star, tasks, n_processes)
+
+    counts = np.sum(results, axis=0) if len(results) > 0 else np.zeros(len(edges) - 1, dtype=np.int64)
+
+    return edges, counts
+
+
+def light_curves(files, tstart, tstop, dtime, sources_ra, sources_dec, radius, emin=100.0, emax=100000.0, zmax=180.0,
+                 evclass=None, n_processes=1):
+    """
+    Light curves (counts only) of many regions of the sky, with a single pass over the FT1 files
+
+    :param sources_ra: R.A. of the centers of the regions (degrees)
+    :param sources_dec: Dec. of the centers of the regions (degrees)
+    :param radius: radius of the regions (degrees), one value or one for each region
+    :return: (edges, counts), where counts is a (n_regions, n_bins) np.array
+    """
+
+    edges = linear_time_bins(tstart, tstop, dtime)
+
+    sources_ra = np.atleast_1d(np.asarray(sources_ra, dtype=float))
+    sources_dec = np.atleast_1d(np.asarray(sources_dec, dtype=float))
+
+    tasks = [(filename, edges, sources_ra, sources_dec, radius, emin, emax, zmax, evclass) for filename in files]
+
+    results = _map(_file_counts_many_star, tasks, n_processes)
+
+    counts = np.sum(results, axis=0) if len(results) > 0 else np.zeros((len(sources_ra), len(edges) - 1),
+                                                                        dtype=np.int64)
+
+    return edges, counts
+
+
+def read_sources(filename, default_radius):
+    """
+    Read a list of sources from a text file with one source per line: name, R.A., Dec. (degrees) and optionally the
+    radius of the region (degrees). Lines starting with # are ignored.
+
+    :return: (names, ra, dec, radius)
+    """
+
+    names, ra, dec, radius = [], [], [], []
+
+    with open(filename) as f:
+
+        for line in f:
+
+            tokens = line.split()
+
+            if len(tokens) == 0 or tokens[0].startswith('#'):
+
+                continue
+
+            if len(tokens) not in (3, 4):
+
+                raise RuntimeError("Cannot understand line '%s' of %s (expected: name ra dec [radius])"
+                                   % (line.strip(), filename))
+
+            names.append(tokens[0])
+            ra.append(float(tokens[1]))
+            dec.append(float(tokens[2]))
+            radius.append(float(tokens[3]) if len(tokens) == 4 else default_radius)
+
+    return names, np.array(ra), np.array(dec), np.array(radius)
+
+
+def write_light_curves(edges, counts, names, ra, dec, radius, out_file):
+    """
+    Write the light curves of many sources: a RATE extension as the one written by gtbin, where COUNTS and ERROR
+    have one element for each source, and a SOURCES extension with the names and the regions of the sources
+    """
+
+    n_sources = len(names)
+
+    rate = fits.BinTableHDU.from_columns([fits.Column(name='TIME', format='D', unit='s',
+                                                      array=0.5 * (edges[1:] + edges[:-1])),
+                                          fits.Column(name='TIMEDEL', format='D', unit='s', array=np.diff(edges)),
+                                          fits.Column(name='COUNTS', format='%sJ' % n_sources, unit='count',
+                                                      array=counts.T),
+                                          fits.Column(name='ERROR', format='%sE' % n_sources, unit='count',
+                                                      array=np.sqrt(counts.T))])
+    rate.name = 'RATE'
+
+    sources = fits.BinTableHDU.from_columns([fits.Column(name='NAME', format='30A', array=names),
+                                             fits.Column(name='RA', format='D', unit='deg', array=ra),
+                                             fits.Column(name='DEC', format='D', unit='deg', array=dec),
+                                             fits.Column(name='RADIUS', format='D', unit='deg', array=radius)])
+    sources.name = 'SOURCES'
+
+    primary = fits.PrimaryHDU()
+
+    for hdu in (primary, rate, sources):
+
+        hdu.header.set('TSTART', edges[0])
+        hdu.header.set('TSTOP', edges[-1])
+
+    fits.HDUList([primary, rate, sources]).writeto(out_file, overwrite=True)
+
+
+def write_light_curve(edges, counts, out_file):
+    """
+    Write a light curve in the same format as gtbin (RATE extension with TIME, TIMEDEL, COUNTS and ERROR)
+    """
+
+    rate = fits.BinTableHDU.from_columns([fits.Column(name='TIME', format='D', unit='s',
+                                                      array=0.5 * (edges[1:] + edges[:-1])),
+                                          fits.Column(name='TIMEDEL', format='D', unit='s', array=np.diff(edges)),
+                                          fits.Column(name='COUNTS', format='J', unit='count', array=counts),
+                                          fits.Column(name='ERROR', format='E', unit='count',
+                                                      array=np.sqrt(counts))])
+    rate.name = 'RATE'
+
+    primary = fits.PrimaryHDU()
+
+    for hdu in (primary, rate):
+
+        hdu.header.set('TSTART', edges[0])
+        hdu.header.set('TSTOP', edges[-1])
+
+    fits.HDUList([primary, rate]).writeto(out_file, overwrite=True)
+
+
+def compare_with_gtbin(edges, counts, gtbin_file):
+    """
+    Check a light curve against the one produced by gtbin. A RuntimeError is raised if the bins or the counts differ.
+
+    :return: the total number of counts
+    """
+
+    rate = fits.getdata(gtbin_file, 'RATE')
+
+    gtbin_counts = rate.field('COUNTS')
+
+    if len(gtbin_counts) != len(counts) or not np.allclose(rate.field('TIME'), 0.5 * (edges[1:] + edges[:-1])):
+
+        raise RuntimeError("The light curve in %s has different bins (%s instead of %s)" % (gtbin_file,
+                                                                                          len(gtbin_counts),
+                                                                                          len(counts)))
+
+    different = np.nonzero(gtbin_counts != counts)[0]
+
+    if len(different) > 0:
+
+        raise RuntimeError("%s bins out of %s have different counts than in %s (first one: bin %s, %s instead of %s)"
+                           % (len(different), len(counts), gtbin_file, different[0], counts[different[0]],
+                              gtbin_counts[different[0]]))
+
+    return int(np.sum(counts))
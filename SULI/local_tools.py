@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+
+"""Pure python stand-ins for the external tools used by the pipeline (fcopy, gtselect, gtbin, gtexposure, gtobssim,
+    ltfsearch.py and mdcget). They accept the same command lines (or GtApp parameters) used by the SULI scripts and
+    produce files with the same structure, so that the pipeline can run on a machine without the Fermi software.
+    They are selected with SULI_TOOLS=local (see SULI.tool_layer).
+
+    Usage: local_tools.py [tool] [arguments of the tool]
+
+    The simulated sky of the gtobssim stand-in is isotropic, with a rate (events/s) given by the environment
+    variable SULI_LOCAL_RATE (default: 0.5), plus SULI_LOCAL_FLARES (default: 0) transients per simulated day"""
+
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+from astropy.io import fits
+
+from SULI.benchmarks.synthetic import make_ft1, make_ft2
+from SULI.light_curve import linear_time_bins, write_light_curve
+from SULI.region_search import search_events, unit_vectors
+from SULI.remove_redundant_triggers import write_triggers
+
+# Effective area (cm2) assumed by the gtexposure stand-in
+EFFECTIVE_AREA = 8000.0
+
+_comparisons = {'>=': np.greater_equal, '=>': np.greater_equal,
+                '<=': np.less_equal, '=<': np.less_equal,
+                '>': np.greater, '<': np.less, '==': np.equal}
+
+
+def _value(pars, key, default=None):
+    """
+    Return a parameter as a float, treating missing values and INDEF as the default
+    """
+
+    value = pars.get(key, default)
+
+    if value is None or str(value).upper() == 'INDEF':
+
+        return default
+
+    return float(value)
+
+
+def _input_files(infile):
+    """
+    Expand an infile parameter, which can be a file name or @list_file
+    """
+
+    infile = str(infile)
+
+    if infile.startswith('@'):
+
+        return [line.strip() for line in open(infile[1:]) if line.strip()]
+
+    else:
+
+        return [infile]
+
+
+def fcopy(in_spec, out_spec):
+    """
+    Copy a FITS file keeping only the rows of one extension satisfying a filter, like
+    fcopy 'file.fits[EVENTS][TIME >= 10 && TIME =< 20]' '!out.fits'
+    Only conjunctions (&&) of comparisons between a column and a number are supported.
+    """
+
+    match = re.match(r"^(.+?)\[(\w+)\](?:\[(.*)\])?$", in_spec.strip())
+
+    if match is None:
+
+        raise RuntimeError("Cannot understand the input file specification %s" % in_spec)
+
+    filename, extension, expression = match.groups()
+
+    terms = []
+
+    if expression:
+
+        for term in expression.split('&&'):
+
+            term_match = re.match(r"^\s*(\w+)\s*(>=|=>|<=|=<|==|>|<)\s*([-+0-9.eE]+)\s*$", term)
+
+            if term_match is None:
+
+                raise RuntimeError("Cannot understand the filter %s" % term)
+
+            terms.append(term_match.groups())
+
+    overwrite = out_spec.startswith('!')
+
+    out_file = out_spec[1:] if overwrite else out_spec
+
+    with fits.open(filename) as f:
+
+        data = f[extension].data
+
+        mask = np.ones(len(data), dtype=bool)
+
+        for column, operator, value in terms:
+
+            mask &= _comparisons[operator](data.field(column), float(value))
+
+        hdus = [hdu.copy() for hdu in f]
+
+        hdus[f.index_of(extension)] = fits.BinTableHDU(data=data[mask], header=f[extension].header)
+
+        fits.HDUList(hdus).writeto(out_file, overwrite=overwrite)
+
+
+def gtselect(pars):
+    """
+    Select events in time, energy, zenith angle, event class and within a cone, like gtselect
+    """
+
+    events = []
+    gtis = []
+
+    for filename in _input_files(pars['infile']):
+
+        with fits.open(filename) as f:
+
+            primary_header = f[0].header.copy()
+            events_header = f['EVENTS'].header.copy()
+
+            events.append(np.array(f['EVENTS'].data))
+            gtis.append(np.array(f['GTI'].data))
+
+    events = np.concatenate(events)
+    gtis = np.concatenate(gtis)
+
+    tmin = _value(pars, 'tmin', -np.inf)
+    tmax = _value(pars, 'tmax', np.inf)
+
+    mask = (events['TIME'] >= tmin) & (events['TIME'] <= tmax)
+
+    mask &= (events['ENERGY'] >= _value(pars, 'emin', 0.0)) & (events['ENERGY'] <= _value(pars, 'emax', np.inf))
+
+    if 'ZENITH_ANGLE' in events.dtype.names:
+
+        mask &= events['ZENITH_ANGLE'] <= _value(pars, 'zmax', 180.0)
+
+    evclass = _value(pars, 'evclass', None)
+
+    if evclass is not None and 'EVENT_CLASS' in events.dtype.names:
+
+        mask &= (events['EVENT_CLASS'] & int(evclass)) != 0
+
+    radius = _value(pars, 'rad', 180.0)
+
+    if radius < 180.0:
+
+        center = unit_vectors([_value(pars, 'ra')], [_value(pars, 'dec')])[0]
+
+        mask &= np.dot(unit_vectors(events['RA'], events['DEC']), center) >= np.cos(np.radians(radius))
+
+    # Restrict the good time intervals to the selected time range
+    gtis['START'] = np.maximum(gtis['START'], tmin)
+    gtis['STOP'] = np.minimum(gtis['STOP'], tmax)
+    gtis = gtis[gtis['STOP'] > gtis['START']]
+
+    tstart = max(primary_header['TSTART'], tmin)
+    tstop = min(primary_header['TSTOP'], tmax)
+
+    events_hdu = fits.BinTableHDU(data=events[mask], header=events_header)
+    gti_hdu = fits.BinTableHDU(data=gtis, name='GTI')
+
+    for header in (primary_header, events_hdu.header, gti_hdu.header):
+
+        header.set('TSTART', tstart)
+        header.set('TSTOP', tstop)
+
+    fits.HDUList([fits.PrimaryHDU(header=primary_header), events_hdu, gti_hdu]).writeto(str(pars['outfile']),
+                                                                                       overwrite=True)
+
+
+def gtbin(pars):
+    """
+    Make a light curve with linear binning (gtbin with algorithm=LC and tbinalg=LIN)
+    """
+
+    if str(pars.get('algorithm', 'LC')).upper() != 'LC' or str(pars.get('tbinalg', 'LIN')).upper() != 'LIN':
+
+        raise NotImplementedError("The gtbin stand-in only supports algorithm=LC and tbinalg=LIN")
+
+    edges = linear_time_bins(_value(pars, 'tstart'), _value(pars, 'tstop'), _value(pars, 'dtime'))
+
+    times = np.concatenate([fits.getdata(filename, 'EVENTS').field('TIME')
+                            for filename in _input_files(pars['evfile'])])
+
+    counts = np.histogram(times, edges)[0]
+
+    write_light_curve(edges, counts, str(pars['outfile']))
+
+
+def gtexposure(pars):
+    """
+    Add an EXPOSURE column to a light curve, assuming a constant effective area (EFFECTIVE_AREA)
+    """
+
+    sc_data = fits.getdata(str(pars['scfile']), 'SC_DATA')
+
+    starts = sc_data.field('START')
+    stops = sc_data.field('STOP')
+    livetime = sc_data.field('LIVETIME')
+
+    with fits.open(str(pars['infile']), mode='update') as f:
+
+        rate = f['RATE']
+
+        bin_starts = rate.data.field('TIME') - 0.5 * rate.data.field('TIMEDEL')
+        bin_stops = rate.data.field('TIME') + 0.5 * rate.data.field('TIMEDEL')
+
+        exposure = np.zeros(len(bin_starts))
+
+        for i in range(len(bin_starts)):
+
+            # Livetime of the FT2 intervals overlapping this bin, weighted by the overlap fraction
+            overlap = np.clip(np.minimum(stops, bin_stops[i]) - np.maximum(starts, bin_starts[i]), 0, None)
+
+            exposure[i] = np.sum(livetime * overlap / (stops - starts)) * EFFECTIVE_AREA
+
+        columns = [c for c in rate.columns if c.name != 'EXPOSURE']
+        columns.append(fits.Column(name='EXPOSURE', format='D', unit='cm**2 s', array=exposure))
+
+        new_rate = fits.BinTableHDU.from_columns(columns, header=rate.header)
+
+        f['RATE'] = new_rate
+
+
+def gtobssim(pars):
+    """
+    Simulate a FT1 file with isotropic events (and optional random flares), like gtobssim. The output is
+    [evroot]_events_0000.fits
+    """
+
+    tstart = _value(pars, 'tstart')
+    simtime = _value(pars, 'simtime')
+
+    rng = np.random.RandomState(int(_value(pars, 'seed', 0)) % 2 ** 32)
+
+    n_flares = int(np.round(float(os.environ.get('SULI_LOCAL_FLARES', 0)) * simtime / 86400.0))
+
+    flares = []
+
+    for i in range(n_flares):
+
+        flares.append((rng.uniform(0, 360), np.degrees(np.arcsin(rng.uniform(-1, 1))),
+                       rng.uniform(tstart, tstart + simtime), rng.uniform(100, 2000), rng.randint(30, 100)))
+
+    out_ft1 = "%s_events_0000.fits" % pars['evroot']
+
+    make_ft1(out_ft1, tstart, simtime, rate=float(os.environ.get('SULI_LOCAL_RATE', 0.5)), flares=flares,
+             proc_ver=0, seed=rng.randint(0, 2 ** 31))
+
+    print("Simulated %s (%s flares)" % (out_ft1, n_flares))
+
+
+def ltfsearch(argv):
+    """
+    Search a FT1 file for transients with Bayesian blocks (see SULI.region_search), like ltfsearch.py
+    """
+
+    parser = argparse.ArgumentParser('Local stand-in for ltfsearch.py')
+
+    parser.add_argument('--date', help='Start of the interval to search (MET)', required=True, type=float)
+    parser.add_argument('--duration', help='Length of the interval to search', required=True, type=float)
+    parser.add_argument('--irfs', help='Ignored', default=None)
+    parser.add_argument('--probability', help='Probability of null hypothesis', type=float, default=1e-5)
+    parser.add_argument('--loglevel', help='Ignored', default='info')
+    parser.add_argument('--logfile', help='Ignored', default=None)
+    parser.add_argument('--workdir', help='Ignored', default=None)
+    parser.add_argument('--outfile', help='Name of the output trigger list', required=True)
+    parser.add_argument('--ft1', help='FT1 file to search', default=None)
+    parser.add_argument('--ft2', help='Ignored', default=None)
+
+    args = parser.parse_args(argv)
+
+    if args.ft1 is None:
+
+        raise IOError("The local stand-in of ltfsearch.py cannot download data: the FT1 file must be given with --ft1")
+
+    tstart = args.date
+    tstop = args.date + args.duration
+
+    with fits.open(args.ft1) as f:
+
+        data = f['EVENTS'].data
+
+        idx = (data.field('TIME') >= tstart) & (data.field('TIME') < tstop)
+
+        times = np.array(data.field('TIME')[idx], dtype=float)
+        ra = np.array(data.field('RA')[idx], dtype=float)
+        dec = np.array(data.field('DEC')[idx], dtype=float)
+
+    order = np.argsort(times)
+
+    triggers = search_events(times[order], ra[order], dec[order], tstart, tstop, args.probability)
+
+    write_triggers(triggers, args.outfile)
+
+    print("Found %s triggers in %s events" % (len(triggers), len(times)))
+
+
+def mdcget(argv):
+    """
+    Deliver the data taken in [met_start, met_stop) as a FT1/FT2 pair in the current directory, like mdcget. The
+    data are simulated (see gtobssim), and the same interval always gives the same events.
+    """
+
+    parser = argparse.ArgumentParser('Local stand-in for mdcget')
+
+    parser.add_argument('--met_start', help='Start of the interval', required=True, type=float)
+    parser.add_argument('--met_stop', help='End of the interval', required=True, type=float)
+
+    args = parser.parse_args(argv)
+
+    duration = args.met_stop - args.met_start
+
+    rng = np.random.RandomState(int(args.met_start) % 2 ** 32)
+
+    n_flares = rng.poisson(float(os.environ.get('SULI_LOCAL_FLARES', 0)) * duration / 86400.0)
+
+    flares = []
+
+    for i in range(n_flares):
+
+        flares.append((rng.uniform(0, 360), np.degrees(np.arcsin(rng.uniform(-1, 1))),
+                       rng.uniform(args.met_start, args.met_stop), rng.uniform(100, 2000), rng.randint(30, 100)))
+
+    root = "segment_%s_%s" % (args.met_start, args.met_stop)
+
+    make_ft1(root + "_ft1.fits", args.met_start, duration, rate=float(os.environ.get('SULI_LOCAL_RATE', 0.5)),
+             flares=flares, seed=rng.randint(0, 2 ** 31))
+
+    make_ft2(root + "_ft2.fits", args.met_start - 30.0, args.met_stop + 30.0)
+
+    print("Delivered %s_ft1.fits and %s_ft2.fits" % (root, root))
+
+
+def parse_key_values(argv):
+    """
+    Parse a ScienceTools-style command line (key=value key=value ...) into a dictionary
+    """
+
+    pars = {}
+
+    for token in argv:
+
+        key, value = token.split('=', 1)
+
+        pars[key] = value
+
+    return pars
+
+
+GT_TOOLS = {'gtselect': gtselect, 'gtbin': gtbin, 'gtexposure': gtexposure, 'gtobssim': gtobssim}
+
+
+class LocalGtApp(object):
+    """
+    Drop-in replacement for GtApp, executing the local stand-in of the tool
+    """
+
+    def __init__(self, name):
+
+        if name not in GT_TOOLS:
+
+            raise NotImplementedError("There is no local stand-in for %s" % name)
+
+        self.name = name
+        self.pars = {}
+
+    def __setitem__(self, key, value):
+
+        self.pars[key] = value
+
+    def __getitem__(self, key):
+
+        return self.pars[key]
+
+    def run(self):
+
+        print("%s (local stand-in) %s" % (self.name, " ".join("%s=%s" % item for item in sorted(self.pars.items()))))
+
+        GT_TOOLS[self.name](self.pars)
+
+
+# execute only if run from command line
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+
+        raise RuntimeError("Usage: local_tools.py [tool] [arguments]")
+
+    tool = sys.argv[1]
+
+    if tool == 'fcopy':
+
+        fcopy(sys.argv[2], sys.argv[3])
+
+    elif tool in ('ltfsearch', 'ltfsearch.py'):
+
+        ltfsearch(sys.argv[2:])
+
+    elif tool == 'mdcget':
+
+        mdcget(sys.argv[2:])
+
+    elif tool in GT_TOOLS:
+
+        GT_TOOLS[tool](parse_key_values(sys.argv[2:]))
+
+    else:
+
+        raise NotImplementedError("There is no local stand-in for %s" % tool)
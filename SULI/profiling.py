@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+"""Profiling of the stages of the pipeline. Every SULI script (and every "suli" subcommand) accepts --profile: the
+    stage then runs under cProfile, and the statistics are written in a .pstats file next to its results (in the
+    directory of --out_file, --out_list, --out_dir or --res_dir, or in the current directory). The file name contains
+    the stage, the host and the process id, so that the farm jobs of a campaign can write in the same directory.
+    The submitters (submit_a_search.py, submit_a_range.py, submit_far_campaign.py) pass --profile on to their farm
+    jobs with --profile_jobs: the jobs then write their profiles in [res_dir]/profiles (through the SULI_PROFILE_DIR
+    environment variable, which qsub -V passes on to the jobs).
+
+    Run as a script, this merges many .pstats files (for example all the ones of a campaign) into one report of the
+    functions where most of the time is spent."""
+
+import argparse
+import cProfile
+import glob
+import os
+import pstats
+import socket
+import sys
+import time
+
+PROFILE_OPTION = '--profile'
+
+# Options giving the location of the results of a stage, in order of preference (the first one found is used)
+OUTPUT_OPTIONS = ('--out_file', '--out_list', '--out_dir', '--res_dir')
+
+PSTATS_EXTENSION = '.pstats'
+
+# Environment variable overriding the directory of the profiles (set by profile_jobs)
+PROFILE_DIR_VARIABLE = 'SULI_PROFILE_DIR'
+
+# Directory of the profiles of the farm jobs, in the results directory of a campaign
+JOBS_PROFILE_DIR = 'profiles'
+
+
+def pop_profile_option(argv):
+    """
+    Remove --profile from a list of command line arguments
+
+    :param argv: the command line arguments (without the name of the script)
+    :return: (the other arguments, True if --profile was there)
+    """
+
+    other_args = [arg for arg in argv if arg != PROFILE_OPTION]
+
+    return other_args, len(other_args) != len(argv)
+
+
+def profile_directory(argv):
+    """
+    Return the directory of the profile of a stage: the one in the SULI_PROFILE_DIR environment variable if set,
+    otherwise the directory of the results of the stage, from its command line arguments (see OUTPUT_OPTIONS), or the
+    current directory
+    """
+
+    if os.environ.get(PROFILE_DIR_VARIABLE):
+
+        return os.environ[PROFILE_DIR_VARIABLE]
+
+    values = {}
+
+    for k, arg in enumerate(argv):
+
+        if '=' in arg and arg.split('=', 1)[0] in OUTPUT_OPTIONS:
+
+            values[arg.split('=', 1)[0]] = arg.split('=', 1)[1]
+
+        elif arg in OUTPUT_OPTIONS and k + 1 < len(argv):
+
+            values[arg] = argv[k + 1]
+
+    for option in OUTPUT_OPTIONS:
+
+        if option in values:
+
+            path = os.path.abspath(os.path.expandvars(os.path.expanduser(values[option])))
+
+            # Files are written in a directory, and directories might not exist yet
+            if option in ('--out_file', '--out_list') or not os.path.isdir(path):
+
+                path = os.path.dirname(path)
+
+            return path
+
+    return os.getcwd()
+
+
+def profile_call(function, name, directory):
+    """
+    Call function() under cProfile and write the statistics in directory, even if the function fails
+
+    :param function: a function without arguments
+    :param name: name of the stage (used in the name of the file)
+    :param directory: directory for the .pstats file
+    :return: the value returned by function
+    """
+
+    filename = os.path.join(directory, "%s.%s.%s.%s%s" % (name, socket.gethostname().split('.')[0], os.getpid(),
+                                                          time.strftime("%Y%m%d%H%M%S"), PSTATS_EXTENSION))
+
+    profiler = cProfile.Profile()
+
+    profiler.enable()
+
+    try:
+
+        return function()
+
+    finally:
+
+        profiler.disable()
+
+        try:
+
+            profiler.dump_stats(filename)
+
+        except (IOError, OSError) as e:
+
+            print("Could not write the profile in %s: %s" % (filename, e))
+
+        else:
+
+            print("\nProfile written in %s" % filename)
+
+
+def profile_script(path):
+    """
+    Called at the start of the __main__ block of each script: if --profile is in the command line, run the script
+    under the profiler (through SULI.cli.run, which removes the option) and exit. Otherwise do nothing.
+
+    :param path: the path of the script (__file__)
+    :return: none
+    """
+
+    if PROFILE_OPTION not in sys.argv[1:]:
+
+        return
+
+    # Imported here to avoid a circular import (SULI.cli imports this module)
+    from SULI.cli import run
+
+    run(os.path.basename(path), sys.argv[1:])
+
+    sys.exit(0)
+
+
+def profile_jobs(res_dir):
+    """
+    Used by the submitters for --profile_jobs: prepare the directory of the profiles of the farm jobs and pass it to
+    them through the environment (with qsub -V)
+
+    :param res_dir: the results directory of the campaign
+    :return: the option to add to the command line of the jobs
+    """
+
+    directory = os.path.join(res_dir, JOBS_PROFILE_DIR)
+
+    if not os.path.exists(directory):
+
+        os.mkdir(directory)
+
+    os.environ[PROFILE_DIR_VARIABLE] = directory
+
+    print("The farm jobs will write their profiles in %s" % directory)
+
+    return ' %s' % PROFILE_OPTION
+
+
+def merge_profiles(filenames, out_file=None):
+    """
+    Merge the statistics of many .pstats files
+
+    :param filenames: list of .pstats files
+    :param out_file: if given, the merged statistics are also written in this .pstats file
+    :return: a pstats.Stats instance
+    """
+
+    if len(filenames) == 0:
+
+        raise IOError("No profiles to merge")
+
+    stats = pstats.Stats(filenames[0])
+
+    for filename in filenames[1:]:
+
+        stats.add(filename)
+
+    if out_file is not None:
+
+        stats.dump_stats(out_file)
+
+    return stats
+
+
+def write_report(stats, n_files, filename, sort, n_top):
+    """
+    Write the functions where most of the time is spent
+
+    :param stats: a pstats.Stats instance (see merge_profiles)
+    :param n_files: number of profiles merged (written in the report)
+    :param filename: name of the text file
+    :param sort: sort key of pstats ('cumulative', 'tottime'...)
+    :param n_top: number of functions in the report
+    :return: none
+    """
+
+    with open(filename, 'w+') as f:
+
+        f.write("# %s profiles merged\n" % n_files)
+
+        stats.stream = f
+
+        stats.sort_stats(sort).print_stats(n_top)
+
+
+# execute only if run from command line
+if __name__ == "__main__":
+
+    # create parser for this script
+    parser = argparse.ArgumentParser('Merge the profiles (written with --profile) of many stages into one report')
+
+    # add the arguments needed to the parser
+    parser.add_argument("--in_dir", help="Directory containing the .pstats files (searched recursively)", type=str,
+                        default=os.getcwd())
+    parser.add_argument("--stage", help="Merge only the profiles of this stage (like search_for_transients)",
+                        type=str, default=None)
+    parser.add_argument("--out_file", help="Name of the text report", type=str, required=True)
+    parser.add_argument("--merged", help="If given, also write the merged statistics in this .pstats file", type=str,
+                        default=None)
+    parser.add_argument("--sort", help="Sort the functions by this key (cumulative, tottime, ncalls...)", type=str,
+                        default='cumulative')
+    parser.add_argument("--n_top", help="Number of functions in the report (default: 40)", type=int, default=40)
+
+    # parse the arguments
+    args = parser.parse_args()
+
+    in_dir = os.path.abspath(os.path.expandvars(os.path.expanduser(args.in_dir)))
+
+    filenames = []
+
+    for root, _, files in os.walk(in_dir):
+
+        pattern = '%s.*%s' % (args.stage, PSTATS_EXTENSION) if args.stage is not None else '*%s' % PSTATS_EXTENSION
+
+        filenames.extend(glob.glob(os.path.join(root, pattern)))
+
+    # Do not merge the output of a previous merge
+    if args.merged is not None:
+
+        filenames = [f for f in filenames if os.path.abspath(f) != os.path.abspath(args.merged)]
+
+    stats = merge_profiles(sorted(filenames), args.merged)
+
+    write_report(stats, len(filenames), args.out_file, args.sort, args.n_top)
+
+    print("%s profiles merged into %s" % (len(filenames), args.out_file))
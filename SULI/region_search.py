@@ -0,0 +1,361 @@
+"""In-process search for transients: the sky is covered with overlapping circular regions, the events of each region
+    are segmented with Bayesian blocks and the regions where a change of rate is found are reported in the same
+    format used by ltfsearch, so that the output can go through remove_redundant_triggers and flag_detections"""
+
+import math
+import os
+import numpy as np
+
+from SULI.bayesian_blocks import bayesian_blocks, update_bayesian_blocks, ncp_prior_from_probability
+from SULI.remove_redundant_triggers import TRIGGER_DTYPE
+
+
+def sky_lattice(n_points):
+    """
+    Return n_points directions spread uniformly over the sphere (Fibonacci lattice)
+
+    :param n_points: number of directions
+    :return: (ra, dec) arrays in degrees
+    """
+
+    k = np.arange(n_points) + 0.5
+
+    dec = np.degrees(np.arcsin(1.0 - 2.0 * k / n_points))
+    ra = np.mod(np.degrees(np.pi * (1.0 + 5 ** 0.5) * k), 360.0)
+
+    return ra, dec
+
+
+def region_centers(spacing):
+    """
+    Return the centers of the search regions, spaced by approximately spacing degrees
+
+    :param spacing: typical distance between neighbouring centers, in degrees
+    :return: (ra, dec) arrays in degrees
+    """
+
+    n_regions = int(np.ceil(4 * np.pi / np.radians(spacing) ** 2))
+
+    return sky_lattice(n_regions)
+
+
+def unit_vectors(ra, dec):
+    """
+    Convert equatorial coordinates (degrees) to cartesian unit vectors
+
+    :return: a (n, 3) array
+    """
+
+    ra_rad = np.radians(ra)
+    dec_rad = np.radians(dec)
+
+    return np.column_stack((np.cos(dec_rad) * np.cos(ra_rad), np.cos(dec_rad) * np.sin(ra_rad), np.sin(dec_rad)))
+
+
+def poisson_upper_tail(k, mu):
+    """
+    Probability of observing k or more counts when mu are expected (regularized lower incomplete gamma function)
+
+    :param k: observed counts
+    :param mu: expected counts
+    :return: P(n >= k | mu)
+    """
+
+    if k <= 0:
+
+        return 1.0
+
+    if mu <= 0:
+
+        return 0.0
+
+    log_prefactor = k * math.log(mu) - mu - math.lgamma(k)
+
+    if mu < k + 1:
+
+        # Series expansion
+        term = 1.0 / k
+        total = term
+
+        for n in range(1, 1000):
+
+            term *= mu / (k + n)
+            total += term
+
+            if term < total * 1e-12:
+
+                break
+
+        return min(1.0, math.exp(log_prefactor) * total)
+
+    else:
+
+        # Continued fraction for the complement (Lentz's method)
+        tiny = 1e-300
+        b = mu + 1.0 - k
+        c = 1.0 / tiny
+        d = 1.0 / b
+        h = d
+
+        for n in range(1, 1000):
+
+            an = -n * (n - k)
+            b += 2.0
+            d = an * d + b
+            d = tiny if abs(d) < tiny else d
+            c = b + an / c
+            c = tiny if abs(c) < tiny else c
+            d = 1.0 / d
+            delta = d * c
+            h *= delta
+
+            if abs(delta - 1.0) < 1e-12:
+
+                break
+
+        return max(0.0, 1.0 - math.exp(log_prefactor) * h)
+
+
+def describe_blocks(times, edges):
+    """
+    Return the counts of each block and the probability of observing them if the rate were constant
+
+    :param times: arrival times of the events
+    :param edges: edges of the blocks
+    :return: (tstarts, tstops, counts, probabilities) of the blocks
+    """
+
+    counts = np.histogram(times, edges)[0]
+
+    mean_rate = len(times) / (edges[-1] - edges[0])
+
+    probabilities = [poisson_upper_tail(int(n), mean_rate * dt) for n, dt in zip(counts, np.diff(edges))]
+
+    return edges[:-1], edges[1:], counts, probabilities
+
+
+def search_region(times, tstart, tstop, probability):
+    """
+    Run Bayesian blocks on the events of one region
+
+    :param times: sorted arrival times of the events in the region
+    :param tstart: start of the interval searched
+    :param tstop: end of the interval searched
+    :param probability: false positive probability for the Bayesian blocks
+    :return: None if the light curve is constant, otherwise (tstarts, tstops, counts, probabilities) of the blocks
+    """
+
+    edges = bayesian_blocks(times, tstart, tstop, p0=probability)
+
+    if len(edges) <= 2:
+
+        return None
+
+    return describe_blocks(times, edges)
+
+
+def _trigger_row(name, ra, dec, blocks):
+
+    tstarts, tstops, counts, probabilities = blocks
+
+    return (name, ra, dec,
+            ",".join(map(repr, tstarts)),
+            ",".join(map(repr, tstops)),
+            ",".join(map(str, counts)),
+            ",".join(map(lambda x: "%.3g" % x, probabilities)))
+
+
+def _to_recarray(rows):
+
+    return np.rec.array(rows, dtype=TRIGGER_DTYPE) if len(rows) > 0 else np.recarray((0,), dtype=TRIGGER_DTYPE)
+
+
+def search_events(times, ra, dec, tstart, tstop, probability, spacing=5.0, radius=10.0, regions=None):
+    """
+    Search a list of events for transients
+
+    :param times: arrival times of the events (sorted)
+    :param ra: R.A. of the events (degrees)
+    :param dec: Dec. of the events (degrees)
+    :param tstart: start of the interval searched
+    :param tstop: end of the interval searched
+    :param probability: false positive probability for the Bayesian blocks
+    :param spacing: distance between the centers of the search regions (degrees)
+    :param radius: radius of the search regions (degrees)
+    :param regions: indices of the regions to search (default: all of them)
+    :return: the triggers (a np.recarray with dtype TRIGGER_DTYPE)
+    """
+
+    centers_ra, centers_dec = region_centers(spacing)
+
+    centers = unit_vectors(centers_ra, centers_dec)
+
+    events = unit_vectors(ra, dec)
+
+    cos_radius = np.cos(np.radians(radius))
+
+    rows = []
+
+    for i in (range(len(centers_ra)) if regions is None else regions):
+
+        in_region = np.dot(events, centers[i]) >= cos_radius
+
+        result = search_region(times[in_region], tstart, tstop, probability)
+
+        if result is not None:
+
+            rows.append(_trigger_row("region_%s" % i, centers_ra[i], centers_dec[i], result))
+
+    return _to_recarray(rows)
+
+
+def _split(concatenated, offsets):
+
+    return [concatenated[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def _join(arrays, dtype):
+
+    offsets = np.concatenate(([0], np.cumsum([len(a) for a in arrays]))).astype(int)
+
+    return np.concatenate([np.asarray(a, dtype=dtype) for a in arrays] + [np.zeros(0, dtype=dtype)]), offsets
+
+
+def load_search_cache(cache_file, tstart, probability, spacing, radius, n_regions):
+    """
+    Read the cache of an incremental search. None is returned if the file does not exist or if it was produced
+    with different settings.
+    """
+
+    if not os.path.exists(cache_file):
+
+        return None
+
+    cache = np.load(cache_file)
+
+    if not np.allclose(cache['settings'], [tstart, probability, spacing, radius]) or \
+            len(cache['priors']) != n_regions:
+
+        print("Ignoring the cache %s, which was made with different settings" % cache_file)
+
+        return None
+
+    return {'last_time': float(cache['last_time']),
+            'times': _split(cache['times'], cache['times_offsets']),
+            'best': _split(cache['best'], cache['best_offsets']),
+            'last': _split(cache['last'], cache['best_offsets']),
+            'priors': list(cache['priors']),
+            'prior_events': list(cache['prior_events'])}
+
+
+def save_search_cache(cache, cache_file, tstart, probability, spacing, radius):
+    """
+    Write the cache of an incremental search (see search_events_incremental)
+    """
+
+    times, times_offsets = _join(cache['times'], float)
+    best, best_offsets = _join(cache['best'], float)
+    last, _ = _join(cache['last'], int)
+
+    # np.savez would add .npz to names without it
+    with open(cache_file, 'wb') as f:
+
+        np.savez(f, settings=[tstart, probability, spacing, radius], last_time=cache['last_time'],
+                 times=times, times_offsets=times_offsets, best=best, best_offsets=best_offsets, last=last,
+                 priors=cache['priors'], prior_events=cache['prior_events'])
+
+
+def search_events_incremental(times, ra, dec, tstart, tstop, probability, cache_file, spacing=5.0, radius=10.0):
+    """
+    Same as search_events, for a window which keeps growing as new data arrive. The events assigned to each region
+    and the partial results of the Bayesian blocks are kept in cache_file, so that each call only assigns the events
+    arrived after the previous call to the regions and only optimizes the new cells (see update_bayesian_blocks).
+
+    The prior on the number of change points of a region is computed from the number of events it had when it was
+    first searched, and it is updated (restarting that region from scratch) every time its events double, because
+    a prior which changes at every call would make the cached results useless. Between two updates the prior is
+    therefore not the one a full search of the same window would use, and the edges of the blocks (and so the
+    triggers) can differ from those of search_events.
+
+    :param times: arrival times of the events (sorted); the events already processed by the previous call (those
+    up to the latest time it has seen) are skipped
+    :param ra: R.A. of the events (degrees)
+    :param dec: Dec. of the events (degrees)
+    :param tstart: start of the window (it must not change between calls)
+    :param tstop: current end of the window
+    :param probability: false positive probability for the Bayesian blocks
+    :param cache_file: name of the file containing the cache (it is created if it does not exist)
+    :param spacing: distance between the centers of the search regions (degrees)
+    :param radius: radius of the search regions (degrees)
+    :return: the triggers (a np.recarray with dtype TRIGGER_DTYPE)
+    """
+
+    centers_ra, centers_dec = region_centers(spacing)
+
+    n_regions = len(centers_ra)
+
+    cache = load_search_cache(cache_file, tstart, probability, spacing, radius, n_regions)
+
+    if cache is None:
+
+        cache = {'last_time': -np.inf,
+                 'times': [np.zeros(0)] * n_regions,
+                 'best': [None] * n_regions,
+                 'last': [None] * n_regions,
+                 'priors': [0.0] * n_regions,
+                 'prior_events': [0] * n_regions}
+
+    # Only the events which arrived after the previous call need to be assigned to the regions
+    first_new = np.searchsorted(times, cache['last_time'], side='right')
+
+    new_events = unit_vectors(ra[first_new:], dec[first_new:])
+    new_times = times[first_new:]
+
+    print("Incremental search: %s new events (%s already processed)" % (len(new_times), first_new))
+
+    centers = unit_vectors(centers_ra, centers_dec)
+
+    cos_radius = np.cos(np.radians(radius))
+
+    rows = []
+
+    for i in range(n_regions):
+
+        in_region = np.dot(new_events, centers[i]) >= cos_radius
+
+        region_times = np.concatenate((cache['times'][i], new_times[in_region]))
+
+        n_events = len(region_times)
+
+        cache['times'][i] = region_times
+
+        if n_events == 0:
+
+            continue
+
+        if n_events > 2 * cache['prior_events'][i]:
+
+            cache['priors'][i] = ncp_prior_from_probability(n_events, probability)
+            cache['prior_events'][i] = n_events
+            cache['best'][i] = None
+            cache['last'][i] = None
+
+        edges, cache['best'][i], cache['last'][i] = update_bayesian_blocks(region_times, tstart, tstop,
+                                                                           cache['priors'][i],
+                                                                           cache['best'][i], cache['last'][i])
+
+        if len(edges) > 2:
+
+            rows.append(_trigger_row("region_%s" % i, centers_ra[i], centers_dec[i],
+                                     describe_blocks(region_times, edges)))
+
+    if len(times) > 0:
+
+        cache['last_time'] = max(cache['last_time'], float(times[-1]))
+
+    cache['best'] = [b if b is not None else np.zeros(0) for b in cache['best']]
+    cache['last'] = [l if l is not None else np.zeros(0, dtype=int) for l in cache['last']]
+
+    save_search_cache(cache, cache_file, tstart, probability, spacing, radius)
+
+    return _to_recarray(rows)
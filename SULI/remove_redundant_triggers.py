@@ -13,8 +13,16 @@
 import numpy as np
 # from math import *
 import argparse
-from astropy.coordinates import SkyCoord
-import astropy.units as u
+from SULI.profiling import profile_script
+
+# Format of the trigger lists produced by ltfsearch (one region per line, lists of intervals are comma-separated)
+TRIGGER_DTYPE = [('name', 'S50'),
+                 ('ra', float),
+                 ('dec', float),
+                 ('tstarts', 'S1000'),
+                 ('tstops', 'S1000'),
+                 ('counts', 'S1000'),
+                 ('probabilities', 'S1000')]
 
 
 def dist(region1, region2):
@@ -25,6 +33,11 @@ def dist(region1, region2):
     :param region2: input region 2 (an object with a 'ra' and 'dec' items, typically a np.recarray)
     :return: the angular distance in degrees
     """
+
+    # Imported here because astropy.coordinates is slow to import, and most users of this module do not need it
+    from astropy.coordinates import SkyCoord
+    import astropy.units as u
+
     region1_center = SkyCoord(ra=region1['ra'] * u.degree, dec=region1['dec'] * u.degree, frame='icrs')
 
     region2_center = SkyCoord(ra=region2['ra'] * u.degree, dec=region2['dec'] * u.degree, frame='icrs')
@@ -209,9 +222,201 @@ def check_nearest(regions, min_dist):
     # return pruned list
     return regions
 
+
+def sweep_check_nearest(regions, min_dists):
+    """
+    Same as check_nearest, for several values of min_dist at once. The distances between the regions are computed
+    only once, for the pairs closer than the largest min_dist, and sorted: for each min_dist the overlapping pairs are
+    then the closest ones. The significance of each region is also computed once. Each pruned list is the same that
+    check_nearest would return with that min_dist.
+
+    :param regions: a list of intervals (typically a np.recarray, as returned by read_triggers)
+    :param min_dists: a list of values of min_dist
+    :return: a list with the pruned list for each value of min_dist (np.recarray)
+    """
+
+    n_regions = len(regions)
+
+    if n_regions == 0 or len(min_dists) == 0:
+
+        return [regions for _ in min_dists]
+
+    # Imported here because most users of this module do not need it
+    from SULI.sky_index import SkyIndex, angular_distance
+
+    # Candidate pairs (i < j) with a small tolerance, then their exact distance (the same formula used by dist)
+    first, second = SkyIndex(regions['ra'], regions['dec']).pairs_within(max(min_dists) + 1e-6)
+
+    distances = angular_distance(regions['ra'][first], regions['dec'][first],
+                                 regions['ra'][second], regions['dec'][second])
+
+    order = np.argsort(distances, kind='mergesort')
+
+    first, second, distances = first[order], second[order], distances[order]
+
+    n_bins = [bins(region) for region in regions]
+    peaks = [find_most_significant_bin(region) for region in regions]
+
+    results = []
+
+    for min_dist in min_dists:
+
+        n_pairs = np.searchsorted(distances, min_dist, side='right')
+
+        # The regions overlapping each region and coming after it in the list
+        neighbours = [[] for _ in range(n_regions)]
+
+        for i, j in zip(first[:n_pairs], second[:n_pairs]):
+
+            neighbours[i].append(j)
+
+        removed = np.zeros(n_regions, dtype=bool)
+
+        # check_nearest compares each region still in the list with the following ones: the ones not overlapping
+        # are skipped, and the comparison stops when the region itself is removed
+        for i in range(n_regions):
+
+            if removed[i]:
+
+                continue
+
+            for j in sorted(neighbours[i]):
+
+                if removed[j]:
+
+                    continue
+
+                if n_bins[i] != n_bins[j]:
+
+                    i_wins = n_bins[i] > n_bins[j]
+
+                else:
+
+                    if peaks[i][1] != peaks[j][1]:
+
+                        raise RuntimeError("Bin %s and bin %s are overlapping in space, but their maximum rate is not "
+                                           "overlapping in time. This should never happen." % (regions['name'][i],
+                                                                                               regions['name'][j]))
+
+                    i_wins = peaks[i][0] >= peaks[j][0]
+
+                if i_wins:
+
+                    removed[j] = True
+
+                else:
+
+                    removed[i] = True
+
+                    break
+
+        results.append(regions[~removed])
+
+    return results
+
+
+def write_sweep(regions, min_dists, results, filename):
+    """
+    Write the result of sweep_check_nearest: for each min_dist, a comment line with the value and the number of
+    triggers kept, followed by the triggers kept (one section per value, in the format of write_triggers)
+
+    :param regions: the input list of triggers (a np.recarray)
+    :param min_dists: the list of values of min_dist
+    :param results: the list of pruned lists returned by sweep_check_nearest
+    :param filename: name of the output text file
+    :return: none
+    """
+
+    with open(filename, 'w+') as f:
+
+        f.write("# %s triggers in input\n" % len(regions))
+        f.write("# %s\n" % (" ".join(regions.dtype.names)))
+
+        for min_dist, result in zip(min_dists, results):
+
+            f.write("# min_dist %s: %s triggers\n" % (min_dist, len(result)))
+
+            for row in result:
+
+                f.write("%s\n" % " ".join(map(str, row)))
+
+
+def read_sweep(filename):
+    """
+    Read a file written by write_sweep
+
+    :param filename: name of the text file
+    :return: a list of (min_dist, list of triggers as a np.recarray with dtype TRIGGER_DTYPE)
+    """
+
+    sections = []
+
+    with open(filename) as f:
+
+        for line in f:
+
+            if line.startswith("# min_dist "):
+
+                sections.append((float(line.split()[2].rstrip(":")), []))
+
+            elif not line.startswith("#") and line.strip() != '':
+
+                sections[-1][1].append(tuple(line.split()))
+
+    return [(min_dist, np.array([(row[0], float(row[1]), float(row[2])) + row[3:] for row in rows],
+                                dtype=TRIGGER_DTYPE).view(np.recarray))
+            for min_dist, rows in sections]
+
+
+def read_triggers(filename):
+    """
+    Read a trigger list in the ltfsearch format
+
+    :param filename: name of the text file containing the list
+    :return: the list of triggers (a np.recarray with dtype TRIGGER_DTYPE)
+    """
+
+    data = np.recfromtxt(filename, dtype=TRIGGER_DTYPE)
+
+    if len(data.shape) == 0:
+
+        # The file contains only one line. In that case, unfortunately, recfromtxt does not produce
+        # an array of lines, but just one line. Fix that
+        data = np.array([data])
+
+    return data.view(np.recarray)
+
+
+def write_triggers(regions, filename):
+    """
+    Write a trigger list in the same format read by read_triggers
+
+    :param regions: the list of triggers (a np.recarray)
+    :param filename: name of the output text file
+    :return: none
+    """
+
+    with open(filename, 'w+') as f:
+
+        # write column headers
+        f.write("# %s\n" % (" ".join(regions.dtype.names)))
+
+        # write each row of array to file, followed by line break
+        for row in regions:
+
+            out = " ".join(map(str, row))
+
+            f.write("%s" % out)
+
+            f.write("\n")
+
+
 # execute only if run from command line
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     # create parser for this script
     parser = argparse.ArgumentParser('Remove redundant triggers which overlap spatially and temporally. For each group '
                                      'of overlapping triggers, keep only the most significant one.')
@@ -219,45 +424,52 @@ if __name__ == "__main__":
     # add the arguments needed to the parser
     parser.add_argument("--in_list", help="Text file containing the output list from the BB code", required=True,
                         type=str)
-    parser.add_argument("--min_dist", help="distance above which regions are not considered to overlap",
-                        type=float, required=True)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--min_dist", help="distance above which regions are not considered to overlap",
+                       type=float)
+    group.add_argument("--sweep", help="Comma-separated list of values of min_dist (ex: 2,5,10): the pruned list for "
+                                       "each value is written in the output file, one after the other", type=str)
     parser.add_argument("--out_list", help="Name for the output file, which will contained the pruned list",
                         required=True, type=str)
+    parser.add_argument("--tiles", help="Divide the sky in about this many tiles, cleaned in parallel (see "
+                                        "SULI.sky_tiles). Default: 1 (no tiles)", type=int, default=1)
+    parser.add_argument("--n_processes", help="Number of tiles cleaned at the same time (default: 1)", type=int,
+                        default=1)
 
     # parse the arguments
     args = parser.parse_args()
 
     # get input data file from parser and convert to record array
-    data = np.recfromtxt(args.in_list, dtype=[('name', 'S50'),
-                                              ('ra', float),
-                                              ('dec', float),
-                                              ('tstarts', 'S1000'),
-                                              ('tstops', 'S1000'),
-                                              ('counts', 'S1000'),
-                                              ('probabilities', 'S1000')])
+    data = read_triggers(args.in_list)
 
-    if len(data.shape) == 0:
+    # check for multiple triggers by same event,
+    if args.sweep:
 
-        # The file contains only one line. In that case, unfortunately, recfromtxt does not produce
-        # an array of lines, but just one line. Fix that
-        data = np.array([data])
+        min_dists = sorted(set(map(float, args.sweep.split(","))))
 
-    # check for multiple triggers by same event,
-    result = check_nearest(data, args.min_dist)
+        results = sweep_check_nearest(data, min_dists)
 
-    # import pdb;pdb.set_trace()
+        print("%s triggers in input" % len(data))
 
-    # create output file
-    with open(args.out_list, 'w+') as f:
+        for min_dist, result in zip(min_dists, results):
 
-        # write column headers
-        f.write("# %s\n" % (" ".join(result.dtype.names)))
+            print("min_dist %s: %s triggers" % (min_dist, len(result)))
 
-        # write each row of array to file, followed by line break
-        for row in result:
+        write_sweep(data, min_dists, results, args.out_list)
 
-            out = " ".join(map(str, row))
+    elif args.tiles > 1:
 
-            f.write("%s" % out)
+        from SULI.sky_tiles import tiled_check_nearest
 
-            f.write("\n")
+        result = tiled_check_nearest(data, args.min_dist, args.tiles, args.n_processes)
+
+    else:
+
+        result = check_nearest(data, args.min_dist)
+
+    # import pdb;pdb.set_trace()
+
+    # create output file
+    if not args.sweep:
+
+        write_triggers(result, args.out_list)
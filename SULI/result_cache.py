@@ -0,0 +1,276 @@
+"""Cache of the results of the searches. A search is identified by a hash of its inputs (the content of the ft1 and ft2
+    files, or the date for real data), of the parameters of the Bayesian blocks (irf and probability) and of the
+    version of the search tool: for each search the cache keeps the raw output of the search (the triggers before
+    removing the redundant ones: for the windowed search the lists of all the windows, for the tiled search the
+    triggers of all the tiles) and the final list of triggers for each min_dist used, so that a search already done is
+    not done again, and a change of min_dist only removes the redundant triggers from the raw output again.
+
+    Hashing the input files means reading them: the submitter hashes them once and passes the digests to the farm job
+    (--input_digests), which passes them on to the search, so that the files are not read again for this.
+
+    The cache is a directory with one subdirectory for each search. Its size is kept below a maximum by removing the
+    searches used least recently. Files are added with a rename, so several jobs can share the same cache."""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from SULI.tool_layer import tool_version
+
+# Name of the raw output of the search in a cache entry
+RAW = 'raw.txt'
+
+# Default maximum size of the cache (bytes)
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+
+def default_cache_dir():
+    """
+    Return the cache directory set through the SULI_RESULT_CACHE environment variable, or None (no cache)
+    """
+
+    return os.environ.get('SULI_RESULT_CACHE') or None
+
+
+def file_digest(filename, block_size=2 ** 20):
+    """
+    Return the sha256 of the content of a file
+    """
+
+    digest = hashlib.sha256()
+
+    with open(filename, 'rb') as f:
+
+        for block in iter(lambda: f.read(block_size), b''):
+
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def input_digests(filenames):
+    """
+    Return the digests of the input files of a search (see file_digest)
+    """
+
+    return [file_digest(filename) for filename in filenames]
+
+
+def search_key(inputs, irf, probability, mode='', tool='ltfsearch.py', digests=None):
+    """
+    Return the key of a search
+
+    :param inputs: the date (for real data) or the list of the input files (ft1 and ft2)
+    :param irf: the instrument response function
+    :param probability: the probability of the null hypothesis
+    :param mode: a string describing any other option changing the raw output (windows, shards...)
+    :param tool: name of the search tool, or tool_layer.IN_PROCESS_SEARCH for the search done in-process
+    :param digests: the digests of the input files (see input_digests), if already known: the files are then not read
+    :return: a string (hexadecimal hash)
+    """
+
+    if isinstance(inputs, (list, tuple)):
+
+        inputs = list(digests) if digests is not None else input_digests(inputs)
+
+    description = {'inputs': inputs, 'irf': irf, 'probability': repr(float(probability)), 'mode': mode,
+                   'tool': tool_version(tool)}
+
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def interval_mode(start=None, duration=None):
+    """
+    Return the mode (see search_key) of a search restricted to a part of its input (--start and --duration of
+    search_for_transients.py), or an empty string for the default interval
+    """
+
+    if start is None and duration is None:
+
+        return ''
+
+    return "start=%r,duration=%r" % (start, duration)
+
+
+def final_name(min_dist):
+    """
+    Return the name of the final list of triggers obtained with the given min_dist in a cache entry
+    """
+
+    return 'final_%s.txt' % repr(float(min_dist))
+
+
+class ResultCache(object):
+    """
+    A cache of search results in a directory, with a maximum size
+    """
+
+    def __init__(self, directory, max_size=None):
+
+        self._directory = os.path.abspath(os.path.expandvars(os.path.expanduser(directory)))
+
+        if max_size is None:
+
+            max_size = int(os.environ.get('SULI_RESULT_CACHE_SIZE', DEFAULT_MAX_SIZE))
+
+        self._max_size = max_size
+
+        if not os.path.exists(self._directory):
+
+            try:
+
+                os.makedirs(self._directory)
+
+            except OSError:
+
+                # Created by another job in the meantime
+                if not os.path.isdir(self._directory):
+
+                    raise
+
+    @property
+    def directory(self):
+
+        return self._directory
+
+    def _entry(self, key):
+
+        return os.path.join(self._directory, key)
+
+    def _touch(self, key):
+
+        # The modification time of the entry is the time of its last use
+        try:
+
+            os.utime(self._entry(key), None)
+
+        except OSError:
+
+            pass
+
+    def has(self, key, name):
+
+        return os.path.exists(os.path.join(self._entry(key), name))
+
+    def get(self, key, name, destination):
+        """
+        Copy a file of a cache entry to destination
+
+        :param key: the key of the search (see search_key)
+        :param name: name of the file (RAW or final_name(min_dist))
+        :param destination: path of the copy
+        :return: True if the file was in the cache, False otherwise
+        """
+
+        filename = os.path.join(self._entry(key), name)
+
+        try:
+
+            shutil.copy(filename, destination)
+
+        except (IOError, OSError):
+
+            # Not there (or removed in the meantime by another job)
+            return False
+
+        self._touch(key)
+
+        return True
+
+    def put(self, key, name, source, description=None):
+        """
+        Add a file to a cache entry, then remove the least recently used entries if the cache is too large
+
+        :param key: the key of the search (see search_key)
+        :param name: name of the file (RAW or final_name(min_dist))
+        :param source: path of the file to add
+        :param description: a dictionary describing the search (written in the entry, for humans)
+        :return: none
+        """
+
+        entry = self._entry(key)
+
+        if not os.path.exists(entry):
+
+            try:
+
+                os.mkdir(entry)
+
+            except OSError:
+
+                if not os.path.isdir(entry):
+
+                    raise
+
+        if description is not None:
+
+            with open(os.path.join(entry, 'description.json'), 'w+') as f:
+
+                json.dump(description, f, indent=1, sort_keys=True)
+
+        temp_file = os.path.join(entry, "%s.%s.tmp" % (name, os.getpid()))
+
+        shutil.copy(source, temp_file)
+
+        os.rename(temp_file, os.path.join(entry, name))
+
+        self._touch(key)
+
+        self.evict()
+
+    def entries(self):
+        """
+        Return the entries of the cache, least recently used first
+
+        :return: a list of (key, time of last use, size in bytes)
+        """
+
+        entries = []
+
+        for key in os.listdir(self._directory):
+
+            entry = self._entry(key)
+
+            try:
+
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+
+                entries.append((key, os.path.getmtime(entry), size))
+
+            except OSError:
+
+                # Removed in the meantime by another job
+                continue
+
+        return sorted(entries, key=lambda x: x[1])
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is smaller than its maximum size
+
+        :return: the number of entries removed
+        """
+
+        entries = self.entries()
+
+        total = sum(size for _, _, size in entries)
+
+        n_removed = 0
+
+        for key, last_use, size in entries:
+
+            if total <= self._max_size:
+
+                break
+
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+
+            total -= size
+            n_removed += 1
+
+            print("Removed the search results %s from the cache (last used on %s)" %
+                  (key[:12], time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_use))))
+
+        return n_removed
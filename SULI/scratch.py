@@ -0,0 +1,271 @@
+"""Choice of the scratch directory of a farm job. The candidate locations are, from the fastest: the RAM-backed tmpfs
+    (/dev/shm), the scratch directory given by the batch system ($TMPDIR) and the local disk. The first one with enough
+    free space for the files of the job is used (see search_space and simulation_space for the estimates, or give the
+    size with the --scratch_size option of the jobs). A RAM-backed location must also leave enough memory to the job
+    itself (and to the other jobs on the node), since the files there take memory. The list of candidates can be
+    changed with the SULI_SCRATCH environment variable (directories separated by ':', fastest first).
+
+    The copies to and from the scratch directory are logged with their throughput."""
+
+import os
+import shutil
+import time
+
+# Candidate locations, fastest first (directories which do not exist are skipped)
+DEFAULT_LOCATIONS = ('/dev/shm', '$TMPDIR', '/scratch', '/tmp')
+
+# The outputs and the temporary files of a search are assumed to take at most as much space as its inputs
+SPACE_FACTOR = 2.0
+
+# Rough size of the files of a simulated day: the FT1 file written by gtobssim (a few events per second, a few hundred
+# bytes each) and the FT2 file cut for the day. The outputs of a simulation are much larger than its inputs
+SIMULATED_DAY_SIZE = 200 * 1024 ** 2
+
+# Fraction of the available memory that a job can use for its files in a RAM-backed location
+RAM_FRACTION = 0.5
+
+# File systems which keep the files in memory
+RAM_FILE_SYSTEMS = ('tmpfs', 'ramfs')
+
+
+def path_size(paths):
+    """
+    Return the total size (bytes) of a list of files and directories
+    """
+
+    size = 0
+
+    for path in paths:
+
+        if os.path.isdir(path):
+
+            for root, _, files in os.walk(path):
+
+                size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+
+        else:
+
+            size += os.path.getsize(path)
+
+    return size
+
+
+def simulation_space(inputs, n_days, interval=86400.0):
+    """
+    Estimate the scratch space needed by a simulation job
+
+    :param inputs: the input files and directories (FT2 file, simulation inputs), copied to the scratch directory
+    :param n_days: number of days simulated in the scratch directory
+    :param interval: length of the days (seconds)
+    :return: the space (bytes)
+    """
+
+    return SPACE_FACTOR * path_size(inputs) + n_days * SIMULATED_DAY_SIZE * interval / 86400.0
+
+
+def free_space(path):
+    """
+    Return the space (bytes) available to a non-privileged user in the file system containing path
+    """
+
+    stat = os.statvfs(path)
+
+    return stat.f_bavail * stat.f_frsize
+
+
+def file_system_type(path):
+    """
+    Return the type of the file system containing path (from /proc/mounts), or None if it cannot be found
+    """
+
+    path = os.path.realpath(path)
+
+    best = (None, None)
+
+    try:
+
+        with open('/proc/mounts') as f:
+
+            for line in f:
+
+                fields = line.split()
+
+                if len(fields) < 3:
+
+                    continue
+
+                mount_point = fields[1]
+
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and \
+                        (best[0] is None or len(mount_point) > len(best[0])):
+
+                    best = (mount_point, fields[2])
+
+    except IOError:
+
+        pass
+
+    return best[1]
+
+
+def available_memory():
+    """
+    Return the memory (bytes) available for new processes (MemAvailable in /proc/meminfo), or None if unknown
+    """
+
+    try:
+
+        with open('/proc/meminfo') as f:
+
+            for line in f:
+
+                if line.startswith('MemAvailable:'):
+
+                    return int(line.split()[1]) * 1024
+
+    except IOError:
+
+        pass
+
+    return None
+
+
+def configured_locations():
+    """
+    Return the candidate locations (from SULI_SCRATCH if set, otherwise DEFAULT_LOCATIONS), fastest first
+    """
+
+    if os.environ.get('SULI_SCRATCH'):
+
+        return os.environ['SULI_SCRATCH'].split(':')
+
+    return list(DEFAULT_LOCATIONS)
+
+
+def candidate_locations():
+    """
+    Return the existing candidate locations, fastest first
+
+    :return: a list of directories
+    """
+
+    candidates = []
+
+    for location in configured_locations():
+
+        location = os.path.expandvars(location)
+
+        # An unset variable is left as it is by expandvars
+        if '$' in location or not os.path.isdir(location) or not os.access(location, os.W_OK | os.X_OK):
+
+            continue
+
+        if os.path.realpath(location) not in [os.path.realpath(c) for c in candidates]:
+
+            candidates.append(location)
+
+    return candidates
+
+
+def choose_scratch(needed):
+    """
+    Choose the fastest candidate location with at least needed bytes free
+
+    :param needed: space needed (bytes)
+    :return: the chosen location. If none is large enough, the one with the most free space is returned (with a
+    warning in the log)
+    """
+
+    candidates = candidate_locations()
+
+    if len(candidates) == 0:
+
+        raise IOError("None of the scratch locations exists or is writable (%s)" % ", ".join(configured_locations()))
+
+    print("Scratch space needed: %.2f GB" % (needed / 1024.0 ** 3))
+
+    spaces = []
+
+    for location in candidates:
+
+        space = free_space(location)
+
+        fs_type = file_system_type(location)
+
+        reason = None
+
+        if fs_type in RAM_FILE_SYSTEMS:
+
+            memory = available_memory()
+
+            # The files take memory: leave enough of it to the job
+            if memory is not None:
+
+                space = min(space, int(memory * RAM_FRACTION))
+
+                reason = "RAM-backed, %.2f GB of memory available" % (memory / 1024.0 ** 3)
+
+        spaces.append(space)
+
+        print("    %s (%s): %.2f GB usable%s" % (location, fs_type, space / 1024.0 ** 3,
+                                                  " (%s)" % reason if reason is not None else ""))
+
+    for location, space in zip(candidates, spaces):
+
+        if space >= needed:
+
+            print("Scratch: using %s" % location)
+
+            return location
+
+    location = candidates[spaces.index(max(spaces))]
+
+    print("WARNING: no scratch location has enough free space. Using %s, which has the most" % location)
+
+    return location
+
+
+def make_workdir(needed, job_id):
+    """
+    Create the work directory of a job in the scratch location chosen by choose_scratch
+
+    :param needed: space needed (bytes)
+    :param job_id: the unique id of the job (the name of the directory)
+    :return: the path of the work directory
+    """
+
+    workdir = os.path.join(choose_scratch(needed), job_id)
+
+    print("About to create %s..." % workdir)
+
+    os.makedirs(workdir)
+
+    print("Successfully created %s" % workdir)
+
+    return workdir
+
+
+def staged_copy(source, destination):
+    """
+    Copy a file (or a directory tree) and log the throughput
+
+    :param source: file or directory to copy
+    :param destination: destination (as for shutil.copy, or the new directory for a tree)
+    :return: none
+    """
+
+    start = time.time()
+
+    if os.path.isdir(source):
+
+        shutil.copytree(source, destination)
+
+    else:
+
+        shutil.copy(source, destination)
+
+    elapsed = max(time.time() - start, 1e-6)
+
+    size = path_size([source]) / 1024.0 ** 2
+
+    print("Copied %s to %s: %.1f MB in %.2f s (%.1f MB/s)" % (source, destination, size, elapsed, size / elapsed))
@@ -4,14 +4,143 @@
     Actual data is specified by a date, simulated is given by a specific ft1 and ft2 file"""
 
 import argparse
-from astropy.io import fits
 import os
+import shutil
 
 from SULI.execute_command import execute_command
+from SULI.tool_layer import tool_command
+from SULI.profiling import profile_script
+
+
+def remove_redundant_triggers(in_list, min_dist, out_list):
+    """
+    Same as remove_redundant_triggers.py, but in this process (to avoid starting a new interpreter and importing
+    numpy and astropy again)
+    """
+
+    from SULI.remove_redundant_triggers import read_triggers, check_nearest, write_triggers
+
+    print("\nRemoving redundant triggers from %s (min_dist = %s)" % (in_list, min_dist))
+
+    write_triggers(check_nearest(read_triggers(in_list), min_dist), out_list)
+
+
+def remove_redundant_raw(raw_file, args):
+    """
+    Remove the redundant triggers from the raw output of a search (as written by the search, or as found in the
+    result cache), in the way required by the mode of the search, and write the result to args.out_file
+
+    :param raw_file: the raw output (for the windowed search, written by time_windows.write_window_triggers)
+    :param args: the command line options (for min_dist, out_file, window, tiles and jobs)
+    :return: none
+    """
+
+    if args.window is not None:
+
+        from SULI.remove_redundant_triggers import write_triggers
+        from SULI.time_windows import read_window_triggers, clean_window_triggers
+
+        # Remove the redundant triggers of each window, then the triggers found in more than one window
+        triggers, n_triggers = clean_window_triggers(read_window_triggers(raw_file), args.min_dist)
+
+        print("%s triggers in the windows, %s after merging" % (n_triggers, len(triggers)))
+
+        write_triggers(triggers, args.out_file)
+
+    elif args.tiles > 1:
+
+        from SULI.remove_redundant_triggers import read_triggers, write_triggers
+        from SULI.sky_tiles import tiled_check_nearest
+
+        print("\nRemoving redundant triggers from %s (min_dist = %s, %s tiles)" % (raw_file, args.min_dist,
+                                                                                  args.tiles))
+
+        write_triggers(tiled_check_nearest(read_triggers(raw_file), args.min_dist, args.tiles, args.jobs),
+                       args.out_file)
+
+    else:
+
+        remove_redundant_triggers(raw_file, args.min_dist, args.out_file)
+
+
+def search_intervals(intervals, ft1_name, ft2_name, args, out_name):
+    """
+    Search the given time intervals of a ft1 file with ltfsearch, args.jobs at a time, each one in its own directory
+    under args.workdir
+
+    :param intervals: list of (start, stop)
+    :param ft1_name: path of the ft1 file
+    :param ft2_name: path of the ft2 file
+    :param args: the command line options (for irf, probability, loglevel, logfile, workdir and jobs)
+    :param out_name: name of the output of ltfsearch in each directory
+    :return: a list with the trigger list of each interval (np.recarray, before removing the redundant triggers)
+    """
+
+    from SULI.execute_command import run_commands, check_results
+    from SULI.remove_redundant_triggers import read_triggers
+
+    interval_dirs = [os.path.join(args.workdir, 'interval_%03i' % k) for k in range(len(intervals))]
+
+    cmd_lines = []
+
+    for (start, stop), interval_dir in zip(intervals, interval_dirs):
+
+        if not os.path.exists(interval_dir):
+
+            os.makedirs(interval_dir)
+
+        cmd_lines.append('%s --date %s --duration %s --irfs %s --probability %s --loglevel %s --logfile %s '
+                         '--workdir %s --outfile %s --ft1 %s --ft2 %s' % (tool_command('ltfsearch.py'), start,
+                                                                          stop - start, args.irf, args.probability,
+                                                                          args.loglevel, args.logfile, interval_dir,
+                                                                          out_name, ft1_name, ft2_name))
+
+    log_dir = os.path.join(args.workdir, 'interval_logs')
+
+    check_results(run_commands(cmd_lines, max_workers=args.jobs, cwds=interval_dirs, log_dir=log_dir))
+
+    trigger_lists = [read_triggers(os.path.join(interval_dir, out_name)) for interval_dir in interval_dirs]
+
+    # The logs are kept only if something failed (check_results raised an exception)
+    for directory in interval_dirs + [log_dir]:
+
+        shutil.rmtree(directory)
+
+    return trigger_lists
+
+
+def search_mode(args):
+    """
+    Return a string describing the options which change the raw output of the search (used in the key of the result
+    cache, see SULI.result_cache)
+    """
+
+    from SULI.result_cache import interval_mode
+
+    modes = [interval_mode(args.start, args.duration)]
+
+    if args.window is not None:
+
+        modes.append("window=%r,stride=%r" % (args.window, args.stride))
+
+    elif args.shards > 1:
+
+        modes.append("shards=%r,overlap=%r" % (args.shards, args.overlap))
+
+    elif args.tiles > 1:
+
+        # The tiled search gives the same results for any number of tiles
+        modes.append("in-process")
+
+    return ";".join(mode for mode in modes if mode != '')
+
 
 # execute only if run from command line
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     # create parser for this script
     parser = argparse.ArgumentParser('Search input data for Transients')
 
@@ -30,9 +159,45 @@ if __name__ == "__main__":
                         required=True)
 
     # optional
+    parser.add_argument("--duration", help="Length of the interval to search (seconds): with --date, from the given "
+                                           "date or MET (default: 86400, a full day); with --inp_fts, from --start "
+                                           "(default: up to the end of the ft1 file). For a targeted search around a "
+                                           "trigger time, see GRB_to_date.py and submit_a_search.py --grbs",
+                        type=float, default=None)
+    parser.add_argument("--start", help="Start (MET) of the interval to search, with --inp_fts (default: the start of "
+                                        "the ft1 file)", type=float, default=None)
     parser.add_argument("--loglevel", help="Level of log detail (DEBUG, INFO)", default='info')
     parser.add_argument("--logfile", help="Name of logfile for the ltfsearch.py script", default='ltfsearch.log')
     parser.add_argument("--workdir", help="Path of work directory", default=os.getcwd())
+    parser.add_argument("--incremental", help="Search in-process (with SULI.region_search instead of ltfsearch), "
+                                              "reusing the results cached by a previous search of the same window "
+                                              "with less data. Only for --inp_fts", action='store_true')
+    parser.add_argument("--cache_file", help="Name of the cache file for --incremental (in the work directory)",
+                        default='search_cache.npz')
+    parser.add_argument("--window", help="Search overlapping windows of this length (seconds, for example 43200) "
+                                         "instead of the whole interval at once, and merge the triggers found twice "
+                                         "in the overlaps (see SULI.time_windows). Only for --inp_fts", type=float,
+                        default=None)
+    parser.add_argument("--stride", help="Time between the start of two consecutive windows (default: half the "
+                                         "window)", type=float, default=None)
+    parser.add_argument("--shards", help="Divide the interval in this many shards, searched in parallel and "
+                                         "stitched together before removing the redundant triggers (see "
+                                         "SULI.time_windows). Only for --inp_fts (default: 1, no sharding)", type=int,
+                        default=1)
+    parser.add_argument("--overlap", help="Each shard is extended by this many seconds on both sides (default: 3600)",
+                        type=float, default=3600.0)
+    parser.add_argument("--tiles", help="Search in-process (with SULI.region_search), with the sky divided in about "
+                                        "this many tiles searched and cleaned in parallel (see SULI.sky_tiles). Only "
+                                        "for --inp_fts (default: 1, no tiles)", type=int, default=1)
+    parser.add_argument("--jobs", help="Number of windows, shards or tiles searched at the same time (default: 1)",
+                        type=int, default=1)
+    parser.add_argument("--cache_dir", help="Directory of the cache of the search results (see SULI.result_cache). "
+                                            "Default: the value of the SULI_RESULT_CACHE environment variable, or no "
+                                            "cache if it is not set", type=str, default=None)
+    parser.add_argument("--input_digests", help="Digests of the ft1 and ft2 files separated by a comma, if already "
+                                                "computed (see SULI.result_cache): the files are then not read again "
+                                                "to find the results in the cache. Only for --inp_fts", type=str,
+                        default=None)
 
     # (The Zenith cut is defined in the configuration.txt file of ltfsearch)
 
@@ -41,30 +206,92 @@ if __name__ == "__main__":
     # parse the arguments
     args = parser.parse_args()
 
+    if args.start is not None and args.date:
+
+        raise RuntimeError("--start can only be used with --inp_fts (with --date, the date is the start)")
+
+    if args.incremental and args.date:
+
+        raise RuntimeError("The incremental search can only be used with --inp_fts")
+
+    if (args.window is not None or args.shards > 1) and (args.date or args.incremental):
+
+        raise RuntimeError("The windowed and the sharded searches can only be used with --inp_fts, and not with "
+                           "--incremental")
+
+    if [args.incremental, args.window is not None, args.shards > 1, args.tiles > 1].count(True) > 1:
+
+        raise RuntimeError("Use only one of --incremental, --window, --shards and --tiles")
+
+    if args.tiles > 1 and args.date:
+
+        raise RuntimeError("The tiled search can only be used with --inp_fts")
+
     temp_file = 'active_file.txt'
 
+    # Search results already in the cache (not for the incremental search, which has its own cache)
+
+    cache = None
+
+    if not args.incremental:
+
+        from SULI.result_cache import ResultCache, default_cache_dir, search_key, final_name, RAW
+        from SULI.tool_layer import IN_PROCESS_SEARCH
+
+        cache_dir = args.cache_dir if args.cache_dir is not None else default_cache_dir()
+
+        if cache_dir:
+
+            cache = ResultCache(cache_dir)
+
+            cache_inputs = args.date if args.date else \
+                [os.path.abspath(os.path.expandvars(os.path.expanduser(f))) for f in args.inp_fts.rsplit(",", 1)]
+
+            digests = args.input_digests.split(',') if args.input_digests and not args.date else None
+
+            # The tiled search runs in this process (SULI.region_search), not ltfsearch
+            cache_key = search_key(cache_inputs, args.irf, args.probability, search_mode(args),
+                                   tool=IN_PROCESS_SEARCH if args.tiles > 1 else 'ltfsearch.py', digests=digests)
+
+    if cache is not None and cache.get(cache_key, final_name(args.min_dist), args.out_file):
+
+        print("\nFound the results of this search in the cache (%s)" % cache_key[:12])
+
+    elif cache is not None and cache.get(cache_key, RAW, temp_file):
+
+        print("\nFound the output of this search in the cache (%s), with a different min_dist" % cache_key[:12])
+
+        remove_redundant_raw(temp_file, args)
+
     # if using real data
 
-    if args.date:
+    elif args.date:
 
         # bayesian blocks
 
-        cmd_line = 'ltfsearch.py --date %s --duration 86400.0 --irfs %s --probability %s --loglevel %s --logfile %s ' \
-                   '--workdir %s --outfile %s' % (args.date, args.irf, args.probability, args.loglevel, args.logfile,
-                                                  args.workdir, temp_file)
+        duration = args.duration if args.duration is not None else 86400.0
+
+        cmd_line = '%s --date %s --duration %s --irfs %s --probability %s --loglevel %s --logfile %s ' \
+                   '--workdir %s --outfile %s' % (tool_command('ltfsearch.py'), args.date, duration, args.irf,
+                                                  args.probability, args.loglevel, args.logfile, args.workdir,
+                                                  temp_file)
 
         execute_command(cmd_line)
 
         # remove redundant triggers
 
-        cmd_line = 'remove_redundant_triggers.py --in_list %s --min_dist %s --out_list %s' % (temp_file, args.min_dist,
-                                                                                              args.out_file)
-
-        execute_command(cmd_line)
+        remove_redundant_triggers(temp_file, args.min_dist, args.out_file)
 
     # else using simulated data
     else:
 
+        # Imported here, because they are slow to import and not needed for real data
+        from astropy.io import fits
+        import numpy as np
+
+        from SULI.region_search import search_events_incremental
+        from SULI.remove_redundant_triggers import write_triggers
+
         # get names of ft1 and ft2 files
         ft1_name = os.path.abspath(os.path.expandvars(os.path.expanduser(args.inp_fts.rsplit(",", 1)[0])))
         ft2_name = os.path.abspath(os.path.expandvars(os.path.expanduser(args.inp_fts.rsplit(",", 1)[1])))
@@ -74,24 +301,117 @@ if __name__ == "__main__":
             sim_start = ft1[0].header['TSTART']
             sim_end = ft1[0].header['TSTOP']
 
+        # Search only a part of the file (for example a window around a trigger time)
+        if args.start is not None:
+
+            sim_start = max(sim_start, args.start)
+
+        if args.duration is not None:
+
+            sim_end = min(sim_end, sim_start + args.duration)
+
+        if sim_end <= sim_start:
+
+            raise RuntimeError("The interval to search is outside of %s" % ft1_name)
+
         dur = sim_end - sim_start
 
         # bayesian blocks
 
-        cmd_line = 'ltfsearch.py --date %s --duration %s --irfs %s --probability %s --loglevel %s --logfile %s ' \
-                   '--workdir %s --outfile %s --ft1 %s --ft2 %s' % (sim_start, dur, args.irf, args.probability,
-                                                                    args.loglevel, args.logfile, args.workdir,
-                                                                    temp_file, ft1_name, ft2_name)
+        if args.incremental or args.tiles > 1:
 
-        execute_command(cmd_line)
+            with fits.open(str(ft1_name)) as ft1:
 
-        # remove redundant triggers
+                events = ft1['EVENTS'].data
 
-        cmd_line = 'remove_redundant_triggers.py --in_list active_file.txt --min_dist %s --out_list %s' %(args.min_dist,
-                                                                                                          args.out_file)
+                idx = (events.field('TIME') >= sim_start) & (events.field('TIME') < sim_end)
 
-        execute_command(cmd_line)
+                times = np.array(events.field('TIME')[idx], dtype=float)
+                ra = np.array(events.field('RA')[idx], dtype=float)
+                dec = np.array(events.field('DEC')[idx], dtype=float)
+
+            order = np.argsort(times)
+
+            if args.incremental:
+
+                # Search in-process, reusing what was done on the previous (shorter) version of this window
+                triggers = search_events_incremental(times[order], ra[order], dec[order], sim_start, sim_end,
+                                                     args.probability, os.path.join(args.workdir, args.cache_file))
+
+                write_triggers(triggers, temp_file)
+
+            else:
+
+                from SULI.sky_tiles import tiled_search
+
+                # Search in-process, tile by tile (the redundant triggers are removed as well). The triggers before
+                # the cleaning are the raw output kept in the cache
+                triggers, raw_triggers = tiled_search(times[order], ra[order], dec[order], sim_start, sim_end,
+                                                      args.probability, args.min_dist, args.tiles, args.jobs,
+                                                      return_raw=True)
+
+                write_triggers(triggers, args.out_file)
+
+                if cache is not None:
+
+                    write_triggers(raw_triggers, temp_file)
+
+        elif args.window is not None:
+
+            from SULI.time_windows import sliding_windows, write_window_triggers
+
+            stride = args.stride if args.stride is not None else args.window / 2.0
+
+            windows = sliding_windows(sim_start, sim_end, args.window, stride)
+
+            print("\nSearching %s windows of %s s every %s s (%s at a time)" % (len(windows), args.window, stride,
+                                                                              args.jobs))
+
+            # The trigger lists of the windows are the raw output (the redundant triggers are removed below)
+            write_window_triggers(search_intervals(windows, ft1_name, ft2_name, args, temp_file), temp_file)
+
+        elif args.shards > 1:
+
+            from SULI.time_windows import time_shards, stitch_shard_triggers
+
+            shards, cores = time_shards(sim_start, sim_end, args.shards, args.overlap)
+
+            print("\nSearching %s shards with %s s of overlap (%s at a time)" % (len(shards), args.overlap, args.jobs))
+
+            # The redundant triggers are removed below, from the stitched list
+            triggers = stitch_shard_triggers(search_intervals(shards, ft1_name, ft2_name, args, temp_file), cores)
+
+            write_triggers(triggers, temp_file)
+
+        else:
+
+            cmd_line = '%s --date %s --duration %s --irfs %s --probability %s --loglevel %s --logfile %s ' \
+                       '--workdir %s --outfile %s --ft1 %s --ft2 %s' % (tool_command('ltfsearch.py'), sim_start, dur,
+                                                                        args.irf, args.probability, args.loglevel,
+                                                                        args.logfile, args.workdir, temp_file,
+                                                                        ft1_name, ft2_name)
+
+            execute_command(cmd_line)
+
+        # remove redundant triggers (already done in the tiled search)
+
+        if args.tiles == 1:
+
+            remove_redundant_raw(temp_file, args)
+
+    if cache is not None:
+
+        if os.path.exists(temp_file) and not cache.has(cache_key, RAW):
+
+            cache.put(cache_key, RAW, temp_file, {'inputs': cache_inputs, 'irf': args.irf,
+                                                  'probability': args.probability, 'mode': search_mode(args)})
+
+        if not cache.has(cache_key, final_name(args.min_dist)):
+
+            cache.put(cache_key, final_name(args.min_dist), args.out_file)
+
+    if os.path.exists(temp_file):
 
-    os.remove(temp_file)
+        os.remove(temp_file)
 
     print "\nSearch complete. Results in %s" % args.out_file
@@ -1,12 +1,28 @@
 #!/usr/bin/env python
 
+"""Farm job running search_for_transients on one day (--date or --inp_fts) or on several days (--days). With --days,
+    the days are searched one after the other in the same job: the input files of the next day are staged in while
+    the current one is searched, and the trigger list of each day is staged out as soon as it is ready, so that a
+    failure loses only that day"""
+
 import argparse
 import os
 import shutil
 import glob
+import multiprocessing
+import threading
+import time
 
+from SULI.campaign_metrics import JobRecord
+from SULI.cli import run
 from SULI.execute_command import execute_command
-from astropy.io import fits
+from SULI.result_cache import ResultCache, default_cache_dir, search_key, final_name, interval_mode, input_digests
+from SULI.scratch import SPACE_FACTOR, make_workdir, path_size, staged_copy
+from SULI.profiling import profile_script
+
+
+# Rough size of a day of real data (downloaded by the search itself, so its size is not known in advance)
+REAL_DAY_SIZE = 1024 ** 3
 
 
 def clean_up():
@@ -29,8 +45,170 @@ def clean_up():
         print("Clean up completed.")
 
 
+def day_size(day):
+    """
+    Return the size (bytes) of the input files of a day, or REAL_DAY_SIZE for real data
+    """
+
+    if ',' in day:
+
+        # Missing files are reported by the stage-in of the day
+        files = [os.path.expandvars(os.path.expanduser(f)) for f in day.rsplit(",", 1)]
+
+        return path_size([f for f in files if os.path.exists(f)])
+
+    return REAL_DAY_SIZE
+
+
+def read_days(filename):
+    """
+    Read a list of days: one per line, either a date or the ft1 and ft2 files separated by a comma
+
+    :param filename: path of the text file
+    :return: a list of strings
+    """
+
+    with open(filename) as f:
+
+        return [line.strip() for line in f if line.strip() != '' and not line.strip().startswith('#')]
+
+
+def stage_in(day, day_dir):
+    """
+    Prepare the search of a day in its own directory, copying in the input files (for simulated data)
+
+    :param day: a date or the ft1 and ft2 files separated by a comma
+    :param day_dir: directory for this day (created here)
+    :return: (arguments for search_for_transients without --out_file, name of the output file). The arguments are
+    None if the results were found in the cache (and copied to the output file)
+    """
+
+    os.mkdir(day_dir)
+
+    common_args = ['--irf', args.irf, '--probability', str(args.probability), '--min_dist', str(args.min_dist)]
+
+    if cache is not None:
+
+        common_args += ['--cache_dir', cache_dir]
+
+    # if using simulated data
+    if ',' in day:
+
+        # Imported here because it is not needed for real data
+        from SULI.fits_access import header_extent
+
+        # get names of input files
+        ft1_name = os.path.abspath(os.path.expandvars(os.path.expanduser(day.rsplit(",", 1)[0])))
+        ft2_name = os.path.abspath(os.path.expandvars(os.path.expanduser(day.rsplit(",", 1)[1])))
+
+        digests = None
+
+        if cache is not None:
+
+            # The input files are hashed only once: by the submitter if it passed the digests, or here (and the
+            # digests are passed on to the search, which does not hash the staged copies again)
+            if args.input_digests is not None and day == args.inp_fts:
+
+                digests = args.input_digests.split(',')
+
+            else:
+
+                digests = input_digests([ft1_name, ft2_name])
+
+            common_args += ['--input_digests', ','.join(digests)]
+
+        if cache is not None and args.shards == 1:
+
+            out_name = str(header_extent(ft1_name)[0]) + '_detections.txt'
+
+            # Nothing to stage in if the results are already in the cache
+            if cache.get(search_key([ft1_name, ft2_name], args.irf, args.probability, digests=digests),
+                         final_name(args.min_dist), os.path.join(day_dir, out_name)):
+
+                print("Found the results for %s in the cache" % day)
+
+                return None, out_name
+
+        # create local files
+        local_ft1 = os.path.join(day_dir, os.path.basename(ft1_name))
+        local_ft2 = os.path.join(day_dir, os.path.basename(ft2_name))
+
+        staged_copy(ft1_name, local_ft1)
+        staged_copy(ft2_name, local_ft2)
+
+        # use start time of ft1 for outfile name, since ft2 starts early due to buffer
+        file_start = header_extent(local_ft1)[0]
+
+        out_name = str(file_start) + '_detections.txt'
+
+        if args.shards > 1:
+
+            # The shards of the day are searched on all the cores of the node
+            common_args += ['--shards', str(args.shards), '--overlap', str(args.overlap),
+                            '--jobs', str(multiprocessing.cpu_count())]
+
+        return ['--inp_fts', '%s,%s' % (local_ft1, local_ft2)] + common_args, out_name
+
+    # else using real data (downloaded by the search itself)
+    else:
+
+        out_name = str(day) + '_detections.txt'
+
+        if cache is not None and cache.get(search_key(day, args.irf, args.probability,
+                                                      interval_mode(duration=args.duration)),
+                                           final_name(args.min_dist), os.path.join(day_dir, out_name)):
+
+            print("Found the results for %s in the cache" % day)
+
+            return None, out_name
+
+        if args.duration is not None:
+
+            common_args += ['--duration', str(args.duration)]
+
+        return ['--date', day] + common_args, out_name
+
+
+class Prefetch(object):
+    """
+    Run stage_in in a separate thread. The result (or the exception) is returned by get()
+    """
+
+    def __init__(self, day, day_dir):
+
+        self._result = None
+        self._error = None
+
+        self._thread = threading.Thread(target=self._stage_in, args=(day, day_dir))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _stage_in(self, day, day_dir):
+
+        try:
+
+            self._result = stage_in(day, day_dir)
+
+        except Exception as e:
+
+            self._error = e
+
+    def get(self):
+
+        self._thread.join()
+
+        if self._error is not None:
+
+            raise self._error
+
+        return self._result
+
+
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     parser = argparse.ArgumentParser('Wrapper around the search script')
 
     # Required parameters
@@ -38,6 +216,8 @@ if __name__ == "__main__":
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--date', help='date specifying file to load')
     group.add_argument('--inp_fts', help='filenames of ft1 and ft2 input, separated by a comma (ex: foo.ft1,bar.ft2)')
+    group.add_argument('--days', help='text file with one day per line, given either as a date or as the ft1 and ft2 '
+                                      'files separated by a comma. All the days are searched in this job')
 
     parser.add_argument("--irf", help="Instrument response function name to be used", type=str, required=True)
     parser.add_argument("--probability", help="Probability of null hypothesis", type=float, default=1e-5)
@@ -45,6 +225,20 @@ if __name__ == "__main__":
                         required=True)
     parser.add_argument("--out_dir", help="Directory which will contain the search results txt file)",
                         required=True, type=str)
+    parser.add_argument("--duration", help="Length (seconds) of the interval searched from each date, for real data "
+                                           "(default: a full day)", type=float, default=None)
+    parser.add_argument("--shards", help="Divide each day of simulated data in this many shards, searched in "
+                                         "parallel on the cores of the node (see search_for_transients.py)", type=int,
+                        default=1)
+    parser.add_argument("--overlap", help="Overlap between the shards (seconds, default: 3600)", type=float,
+                        default=3600.0)
+    parser.add_argument("--cache_dir", help="Directory of the cache of the search results: days already in the "
+                                            "cache are not searched again (see SULI.result_cache). Default: the value "
+                                            "of the SULI_RESULT_CACHE environment variable, or no cache", type=str,
+                        default=None)
+    parser.add_argument("--input_digests", help="With --inp_fts, digests of the ft1 and ft2 files separated by a "
+                                                "comma, as computed by the submitter (see SULI.result_cache): the "
+                                                "files are then not read again for the cache", type=str, default=None)
 
     args = parser.parse_args()
 
@@ -53,108 +247,163 @@ if __name__ == "__main__":
 
         raise IOError("You need to create the directory %s before running this script" % args.out_dir)
 
+    out_dir = os.path.abspath(args.out_dir)
+
+    cache_dir = args.cache_dir if args.cache_dir is not None else default_cache_dir()
+
+    cache = ResultCache(cache_dir) if cache_dir else None
+
+    if args.days:
+
+        days = read_days(args.days)
+
+        if len(days) == 0:
+
+            raise RuntimeError("No days in %s" % args.days)
+
+    else:
+
+        days = [args.date if args.date else args.inp_fts]
+
     # First step of a farm job: Stage-in
 
-    # Create a work directory in the local disk on the node
+    # Create a work directory in the fastest scratch space of the node with enough room (see SULI.scratch)
 
     # This is your unique job ID (a number like 546127)
     unique_id = os.environ.get("PBS_JOBID").split(".")[0]
 
-    workdir = os.path.join('/dev/shm', unique_id)
-    print("About to create %s..." % (workdir))
+    # Two days can be in the work directory at the same time (the next one is staged in during the search)
+    needed = SPACE_FACTOR * sum(sorted(day_size(day) for day in days)[-2:])
 
     try:
-        os.makedirs(workdir)
+        workdir = make_workdir(needed, unique_id)
 
     except:
 
-        print("Could not create workdir %s !!!!" % (workdir))
+        print("Could not create workdir %s !!!!" % unique_id)
         raise
 
-    else:
-
-        # This will be executed if no exception is raised
-        print("Successfully created %s" % (workdir))
-
     # now you have to go there
     os.chdir(workdir)
 
-    # if using simulated data
-    if args.inp_fts:
+    failed = []
 
-        # Copy in the input files
+    prefetch = None
 
-        # get names of input files from in_fts
-        ft1_name = os.path.abspath(os.path.expandvars(os.path.expanduser(args.inp_fts.rsplit(",", 1)[0])))
-        ft2_name = os.path.abspath(os.path.expandvars(os.path.expanduser(args.inp_fts.rsplit(",", 1)[1])))
+    # Record of this job for the metrics of the campaign (see SULI.campaign_metrics), if the submission asked for it
+    record = JobRecord.from_environment(unique_id, len(days))
 
-        # create local files
-        local_ft1 = os.path.join(workdir, os.path.basename(ft1_name))
-        local_ft2 = os.path.join(workdir, os.path.basename(ft2_name))
+    try:
 
-        print("Copying %s into %s..." % (ft1_name, local_ft1))
-        print("Copying %s into %s..." % (ft2_name, local_ft2))
+        prefetch = Prefetch(days[0], os.path.join(workdir, 'day_000'))
 
-        # copy them to the files
-        shutil.copy(ft1_name, local_ft1)
-        shutil.copy(ft2_name, local_ft2)
+        for i, day in enumerate(days):
 
-        # run search
+            day_dir = os.path.join(workdir, 'day_%03i' % i)
 
-        # use start time of ft1 for outfile name, since ft2 starts early due to buffer
-        with fits.open(os.path.join(workdir, os.path.basename(ft1_name))) as ft1:
+            cmd_line = None
 
-            file_start = ft1[0].header['TSTART']
+            try:
 
-        out_name = str(file_start) + '_detections.txt'
+                current, prefetch = prefetch, None
 
-        cmd_line = "search_for_transients.py --inp_fts %s --irf %s --probability %s --min_dist %s " \
-                   "--out_file %s" % (args.inp_fts, args.irf, args.probability, args.min_dist, out_name)
+                stage_start = time.time()
 
-    # else using real data
-    else:
+                search_args, out_name = current.get()
 
-        out_name = str(args.date) + '_detections.txt'
+                if record is not None:
 
-        cmd_line = "search_for_transients.py --date %s --irf %s --probability %s --min_dist %s " \
-                   "--out_file %s" % (args.date, args.irf, args.probability, args.min_dist, out_name)
+                    # Only the time spent waiting for the stage-in (most of it is done during the previous search)
+                    record.add_time('stage_in', time.time() - stage_start)
 
-    try:
+                # Stage in the next day while this one is searched
+                prefetch = Prefetch(days[i + 1], os.path.join(workdir, 'day_%03i' % (i + 1))) \
+                    if i + 1 < len(days) else None
 
-        # Do search
-        print("\n\nAbout to execute command:")
-        print(cmd_line)
-        print('\n')
+                os.chdir(day_dir)
 
-        execute_command(cmd_line)
+                # No arguments if the results were already in the cache: just stage them out
+                if search_args is not None:
 
-    except:
+                    search_args = search_args + ['--out_file', out_name]
 
-        print("Cannot execute command: %s" % cmd_line)
-        print("Maybe this will help:")
-        print("\nContent of directory:\n")
+                    # The search runs in this process (see SULI.cli), so that the interpreter and the imports are
+                    # shared
+                    cmd_line = "search_for_transients.py %s" % " ".join(search_args)
 
-        execute_command("ls")
+                    # Do search
+                    print("\n\nAbout to execute command (day %s of %s):" % (i + 1, len(days)))
+                    print(cmd_line)
+                    print('\n')
 
-        print("\nFree space on disk:\n")
-        execute_command("df . -h")
+                    stage_start = time.time()
 
-    else:
+                    run('search', search_args)
+
+                    if record is not None:
+
+                        record.add_time('search', time.time() - stage_start)
 
-        # Stage-out
-        output_files = glob.glob("*_detections.txt")
+            except (Exception, SystemExit):
 
-        if len(output_files) != 1:
+                print("Cannot execute command: %s" % (cmd_line if cmd_line is not None else "(stage-in of %s)" % day))
+                print("Maybe this will help:")
+                print("\nContent of directory:\n")
 
-            print("\n\nCannot find output files!")
+                execute_command("ls")
 
-        else:
+                print("\nFree space on disk:\n")
+                execute_command("df . -h")
 
-            # Copy them back
+                failed.append(day)
 
-            for filename in output_files:
+                if record is not None:
 
-                shutil.copy(os.path.join(workdir, filename), args.out_dir)
+                    record.day_done(False)
+
+                if prefetch is None and i + 1 < len(days):
+
+                    # The stage-in of this day failed, so the next one was not started
+                    prefetch = Prefetch(days[i + 1], os.path.join(workdir, 'day_%03i' % (i + 1)))
+
+            else:
+
+                # Stage-out of this day
+                output_files = glob.glob("*_detections.txt")
+
+                if len(output_files) != 1:
+
+                    print("\n\nCannot find output files!")
+
+                    failed.append(day)
+
+                    if record is not None:
+
+                        record.day_done(False)
+
+                else:
+
+                    # Copy them back
+
+                    stage_start = time.time()
+
+                    for filename in output_files:
+
+                        staged_copy(os.path.join(day_dir, filename), out_dir)
+
+                    if record is not None:
+
+                        record.add_time('stage_out', time.time() - stage_start)
+
+                        record.day_done(True)
+
+            finally:
+
+                os.chdir(workdir)
+
+                if os.path.exists(day_dir):
+
+                    shutil.rmtree(day_dir)
 
     finally:
 
@@ -162,4 +411,27 @@ if __name__ == "__main__":
         # I use this so we are sure we are not leaving trash behind even
         # if this job fails
 
+        # Wait for a stage-in which might still be running, before removing its directory
+        if prefetch is not None:
+
+            try:
+
+                prefetch.get()
+
+            except Exception:
+
+                pass
+
+        if record is not None:
+
+            record.end()
+
         clean_up()
+
+    if len(days) > 1:
+
+        print("\n%s days searched, %s failed" % (len(days) - len(failed), len(failed)))
+
+        for day in failed:
+
+            print("Failed: %s" % day)
@@ -0,0 +1,177 @@
+"""Seeds for the simulations. Each simulated day of a campaign is identified by (campaign, replica, day), and its seed
+    is derived from a hash of the three, in the spirit of numpy's SeedSequence (which is not available in the version
+    of numpy used on the farm). Seeds are therefore reproducible, independent of the order in which jobs are run and
+    different for different campaigns. They are recorded in a manifest (a JSON file) which is also used to check that
+    no two days share a seed, within a campaign and across the campaigns in the same results directory"""
+
+import glob
+import hashlib
+import json
+import os
+
+# gtobssim takes a signed 32 bit seed
+MAX_SEED = 2 ** 31 - 1
+
+
+def derive_seed(campaign, replica, day, attempt=0):
+    """
+    Return the seed for a given day of a given replica of a campaign
+
+    :param campaign: name of the campaign
+    :param replica: number of the replica
+    :param day: identifier of the day (typically its start, as an integer MET)
+    :param attempt: used to get a different seed if the first one collides with another one
+    :return: an integer in [1, MAX_SEED]
+    """
+
+    key = "%s/%s/%s/%s" % (campaign, int(replica), int(day), int(attempt))
+
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    return int(digest[:16], 16) % MAX_SEED + 1
+
+
+def _entry_key(replica, day):
+
+    return "%s/%s" % (int(replica), int(day))
+
+
+def make_manifest(campaign, replicas, days, used_seeds=()):
+    """
+    Assign a seed to each (replica, day) of a campaign. In the (rare) case of a collision with a seed already assigned,
+    in this campaign or in used_seeds, the seed is derived again with the next attempt number. Entries are processed in
+    a fixed order, so the result does not depend on the order of replicas and days.
+
+    :param campaign: name of the campaign
+    :param replicas: list of replica numbers
+    :param days: list of days (integer METs)
+    :param used_seeds: seeds which must not be used (for example, those of other campaigns)
+    :return: the manifest (a dictionary)
+    """
+
+    used = set(used_seeds)
+
+    seeds = {}
+
+    for replica in sorted(set(int(r) for r in replicas)):
+
+        for day in sorted(set(int(d) for d in days)):
+
+            attempt = 0
+
+            seed = derive_seed(campaign, replica, day, attempt)
+
+            while seed in used:
+
+                attempt += 1
+
+                seed = derive_seed(campaign, replica, day, attempt)
+
+            used.add(seed)
+
+            seeds[_entry_key(replica, day)] = seed
+
+    return {'campaign': campaign, 'seeds': seeds}
+
+
+def manifest_file_name(directory, campaign):
+
+    return os.path.join(directory, 'seed_manifest_%s.json' % campaign)
+
+
+def write_manifest(manifest, filename):
+
+    with open(filename, 'w+') as f:
+
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def read_manifest(filename):
+
+    with open(filename) as f:
+
+        return json.load(f)
+
+
+def lookup_seed(manifest, replica, day):
+    """
+    Return the seed of a given (replica, day) from a manifest. A RuntimeError is raised if it is not there.
+    """
+
+    key = _entry_key(replica, day)
+
+    if key not in manifest['seeds']:
+
+        raise RuntimeError("No seed for replica %s, day %s in the manifest of campaign %s" % (replica, int(day),
+                                                                                             manifest['campaign']))
+
+    return manifest['seeds'][key]
+
+
+def find_collisions(manifests):
+    """
+    Return the seeds used more than once in the given manifests
+
+    :param manifests: list of manifests
+    :return: a dictionary seed -> list of "campaign/replica/day" using it (only for seeds used more than once)
+    """
+
+    users = {}
+
+    for manifest in manifests:
+
+        for key, seed in manifest['seeds'].items():
+
+            users.setdefault(seed, []).append("%s/%s" % (manifest['campaign'], key))
+
+    return dict((seed, names) for seed, names in users.items() if len(names) > 1)
+
+
+def check_manifests(manifests):
+    """
+    Raise a RuntimeError if any seed is used more than once in the given manifests
+    """
+
+    collisions = find_collisions(manifests)
+
+    if len(collisions) > 0:
+
+        examples = ["%s: %s" % (seed, ", ".join(names)) for seed, names in sorted(collisions.items())[:10]]
+
+        raise RuntimeError("%s seeds are used more than once:\n%s" % (len(collisions), "\n".join(examples)))
+
+
+def campaign_manifest(directory, campaign, replicas, days):
+    """
+    Return the manifest of a campaign in the given directory, creating it if it does not exist yet. A new manifest
+    avoids the seeds of the other campaigns in the directory, and all the manifests are checked for collisions.
+
+    :return: the manifest (a dictionary)
+    """
+
+    filename = manifest_file_name(directory, campaign)
+
+    others = [read_manifest(f) for f in sorted(glob.glob(manifest_file_name(directory, '*'))) if f != filename]
+
+    if os.path.exists(filename):
+
+        manifest = read_manifest(filename)
+
+        missing = [(r, d) for r in replicas for d in days if _entry_key(r, d) not in manifest['seeds']]
+
+        if len(missing) > 0:
+
+            raise RuntimeError("The manifest %s exists but it has no seeds for %s of the days requested. Use a new "
+                               "campaign name" % (filename, len(missing)))
+
+    else:
+
+        used = set(seed for other in others for seed in other['seeds'].values())
+
+        manifest = make_manifest(campaign, replicas, days, used)
+
+        write_manifest(manifest, filename)
+
+    check_manifests(others + [manifest])
+
+    return manifest
@@ -10,11 +10,19 @@ import argparse
 import os
 from astropy.io import fits
 from SULI.execute_command import execute_command
+from SULI.fits_access import time_extent
 from SULI.numsuf import numsuf
+from SULI.seeds import MAX_SEED, lookup_seed, read_manifest
+from SULI.time_index import cut_file
+from SULI.tool_layer import tool_command
+from SULI.profiling import profile_script
 
 # execute only if run from command line
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     # create parser for this script
     parser = argparse.ArgumentParser(
         'Split Fermi data file (.fits) into multiple smaller files each spanning 24 hours by default')
@@ -37,11 +45,51 @@ if __name__ == "__main__":
     parser.add_argument("--zmax", help="Zenith cut for the events", type=float, default=180)
     parser.add_argument("--interval", help="Length of time interval covered by output files (default 24 hours)",
                         type=float, default=86400.0)
-    parser.add_argument("--seed_mult", help="Seed is multiplied by this number", required=True, type=int)
+    parser.add_argument("--seed_mult", help="Seed is multiplied by this number (legacy: the seed is the start of the "
+                                            "day times this number). Use --seed or --seed_manifest instead",
+                        required=False, type=int, default=None)
+    parser.add_argument("--seed", help="Seed for the simulation (only with --n_days 1)", required=False, type=int,
+                        default=None)
+    parser.add_argument("--seed_manifest", help="Seed manifest (see SULI.seeds): the seed of each day is read from "
+                                                "here", required=False, type=str, default=None)
+    parser.add_argument("--replica", help="Replica to use from the seed manifest (default: 0)", type=int, default=0)
+    parser.add_argument("--use_index", help="Cut the input FT2 file using its time index (see SULI.time_index), "
+                                            "which is built if needed, instead of fcopy", action='store_true')
 
     # parse the arguments
     args = parser.parse_args()
 
+    if [args.seed_mult, args.seed, args.seed_manifest].count(None) != 2:
+
+        raise RuntimeError("You have to use one (and only one) of --seed_mult, --seed and --seed_manifest")
+
+    if args.seed is not None and args.n_days != 1:
+
+        raise RuntimeError("--seed can only be used with --n_days 1. Use --seed_manifest for more days")
+
+    manifest = read_manifest(args.seed_manifest) if args.seed_manifest is not None else None
+
+    def get_seed(day_start):
+
+        if args.seed is not None:
+
+            return args.seed
+
+        elif manifest is not None:
+
+            return lookup_seed(manifest, args.replica, day_start)
+
+        else:
+
+            seed = int(day_start) * args.seed_mult
+
+            if seed > MAX_SEED:
+
+                print("WARNING: seed %s does not fit in 32 bits and might collide with the seed of other days. "
+                      "Use --seed_manifest" % seed)
+
+            return seed
+
     # simulate ft1s from passed tstart, n_days
     for i in range(args.n_days):
 
@@ -58,24 +106,29 @@ if __name__ == "__main__":
         # prepare cut command
         out_ft2 = 'simulated_' + str(this_ft2_start) + '_ft2.fits'
 
-        cmd_line = "fcopy '%s[SC_DATA][START >= %s && STOP =< %s]' '!%s'" % (args.in_ft2, this_ft2_start,
-                                                                             this_ft2_stop, out_ft2)
-
         print "\nCreating Ft2 from %s to %s from input (%s of %s Ft2 files)" % (this_ft2_start, this_ft2_stop, i + 1,
                                                                                 args.n_days)
 
-        # execute cut
-        execute_command(cmd_line)
+        if args.use_index:
 
-        # Verify that the command executed and update the header
+            n_rows = cut_file(args.in_ft2, out_ft2, this_ft2_start, this_ft2_stop, stop_column='STOP')
 
-        with fits.open(out_ft2) as fits_file:
+            print("Copied %s rows to %s using the time index" % (n_rows, out_ft2))
 
-            # Check the start and stop in the binary table
-            ft2_starts = fits_file['SC_DATA'].data.field("START")
-            ft2_stops = fits_file['SC_DATA'].data.field("STOP")
+        else:
 
-            print '\nFt2 begins at %s, ends at %s \n' % (ft2_starts.min(), ft2_stops.max())
+            cmd_line = "%s '%s[SC_DATA][START >= %s && STOP =< %s]' '!%s'" % (tool_command('fcopy'), args.in_ft2,
+                                                                              this_ft2_start, this_ft2_stop, out_ft2)
+
+            # execute cut
+            execute_command(cmd_line)
+
+        # Verify that the command executed and update the header
+
+        # Check the start and stop in the binary table
+        ft2_start, ft2_stop = time_extent(out_ft2, 'SC_DATA', 'START', 'STOP')
+
+        print '\nFt2 begins at %s, ends at %s \n' % (ft2_start, ft2_stop)
 
         print "Simulating Ft1 beginning at %s, ending at %s (%s file)" % (this_ft1_start, this_ft1_stop,
                                                                           numsuf(i + 1))
@@ -83,7 +136,7 @@ if __name__ == "__main__":
         # The simulation neeeds an environment variable called SKYMODEL_DIR
         os.environ['SKYMODEL_DIR'] = args.src_dir
 
-        cmd_line = "gtobssim infile=%s " \
+        cmd_line = "%s infile=%s " \
                    "srclist=%s " \
                    "scfile=%s " \
                    "evroot=%s " \
@@ -96,13 +149,14 @@ if __name__ == "__main__":
                    "irfs=P8R2_SOURCE_V6 " \
                    "evtype=none maxrows=1000000 " \
                    "seed=%s " \
-                   "chatter=5" % (os.path.join(args.src_dir, args.xml),
+                   "chatter=5" % (tool_command('gtobssim'),
+                                  os.path.join(args.src_dir, args.xml),
                                   os.path.join(args.src_dir, args.source),
                                   out_ft2,
                                   str(int(this_ft1_start)),
                                   args.interval,
                                   this_ft1_start,
-                                  int(this_ft1_start) * args.seed_mult)
+                                  get_seed(this_ft1_start))
 
         # execute simulation
         execute_command(cmd_line)
@@ -128,23 +182,21 @@ if __name__ == "__main__":
         # Verify that the command executed and update the header
 
         # check that ft1 time range is completely inside ft2
-        with fits.open(out_ft2) as fits_file:
-
-            if ft2_starts.min() - this_ft1_start > 0:
+        if ft2_start - this_ft1_start > 0:
 
-                raise RuntimeError("FT2 file starts after the FT1 file")
+            raise RuntimeError("FT2 file starts after the FT1 file")
 
-            if ft2_stops.max() - this_ft1_stop < 0:
+        if ft2_stop - this_ft1_stop < 0:
 
-                raise RuntimeError("FT2 file stops before the end of the FT1 file")
+            raise RuntimeError("FT2 file stops before the end of the FT1 file")
 
         # Update the header
         with fits.open(out_ft2, mode='update') as out_ft2:
 
-            out_ft2['SC_DATA'].header.set("TSTART", ft2_starts.min())
-            out_ft2['SC_DATA'].header.set("TSTOP", ft2_stops.max())
+            out_ft2['SC_DATA'].header.set("TSTART", ft2_start)
+            out_ft2['SC_DATA'].header.set("TSTOP", ft2_stop)
 
-            out_ft2[0].header.set("TSTART", ft2_starts.min())
-            out_ft2[0].header.set("TSTOP", ft2_stops.max())
+            out_ft2[0].header.set("TSTART", ft2_start)
+            out_ft2[0].header.set("TSTOP", ft2_stop)
 
     print "\nFinished"
@@ -5,6 +5,8 @@ import os
 import shutil
 import glob
 import subprocess
+from SULI.profiling import profile_script
+from SULI.scratch import make_workdir, simulation_space, staged_copy
 
 
 def clean_up():
@@ -29,6 +31,9 @@ def clean_up():
 
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     parser = argparse.ArgumentParser('Wrapper around the simulation script')
 
     # Required parameters
@@ -56,7 +61,15 @@ if __name__ == "__main__":
     parser.add_argument("--zmax", help="Zenith cut for the events", type=float, default=180)
     parser.add_argument("--interval", help="Length of time interval covered by output files (default 24 hours)",
                         type=float, default=86400.0)
-    parser.add_argument("--seed_mult", help="Seed is multiplied by this number", required=True, type=int)
+    parser.add_argument("--seed_mult", help="Seed is multiplied by this number (legacy, use --seed or "
+                                            "--seed_manifest instead)", required=False, type=int, default=None)
+    parser.add_argument("--seed", help="Seed for the simulation (only with --n_days 1)", required=False, type=int,
+                        default=None)
+    parser.add_argument("--seed_manifest", help="Seed manifest (see SULI.seeds)", required=False, type=str,
+                        default=None)
+    parser.add_argument("--replica", help="Replica to use from the seed manifest (default: 0)", type=int, default=0)
+    parser.add_argument("--scratch_size", help="Scratch space needed by the job (GB, default: estimated from "
+                                               "--n_days, see SULI.scratch)", type=float, default=None)
 
     args = parser.parse_args()
 
@@ -67,25 +80,23 @@ if __name__ == "__main__":
 
     # First step of a farm job: Stage-in
 
-    # Create a work directory in the local disk on the node
+    # Create a work directory in the fastest scratch space of the node with enough room (see SULI.scratch)
 
     # This is your unique job ID (a number like 546127)
     unique_id = os.environ.get("PBS_JOBID").split(".")[0]
 
-    # os.path.join joins two path in a system-independent way
-    workdir = os.path.join('/dev/shm', unique_id)
+    # The simulated days are much larger than the inputs
+    if args.scratch_size is not None:
+        needed = args.scratch_size * 1024 ** 3
+    else:
+        needed = simulation_space([args.in_ft2, args.src_dir], args.n_days, args.interval)
 
     # Now create the workdir
-    print("About to create %s..." % (workdir))
-
     try:
-        os.makedirs(workdir)
+        workdir = make_workdir(needed, unique_id)
     except:
-        print("Could not create workdir %s !!!!" % (workdir))
+        print("Could not create workdir %s !!!!" % unique_id)
         raise
-    else:
-        # This will be executed if no exception is raised
-        print("Successfully created %s" % (workdir))
 
     # now you have to go there
     os.chdir(workdir)
@@ -94,9 +105,7 @@ if __name__ == "__main__":
 
     local_ft2 = os.path.join(workdir, os.path.basename(args.in_ft2))
 
-    print("Copying %s into %s..." % (args.in_ft2, local_ft2))
-
-    shutil.copy(args.in_ft2, local_ft2)
+    staged_copy(args.in_ft2, local_ft2)
 
     if args.src_dir[-1] == '/':
 
@@ -106,22 +115,31 @@ if __name__ == "__main__":
 
     local_src_dir = os.path.join(workdir, src_dir_basename)
 
-    print("Copying %s into %s..." % (args.src_dir, local_src_dir))
-
-    shutil.copytree(args.src_dir, local_src_dir)
+    staged_copy(args.src_dir, local_src_dir)
 
     cmd_line = "sim_day_fits.py --tstart %s --in_ft2 %s --src_dir %s --xml %s --source %s --buffer %s " \
-               "--n_days %s --evclass %s --zmax %s --interval %s --seed_mult %s" % (args.tstart,
-                                                                                    local_ft2,
-                                                                                    local_src_dir,
-                                                                                    args.xml,
-                                                                                    args.source,
-                                                                                    args.buffer,
-                                                                                    args.n_days,
-                                                                                    args.evclass,
-                                                                                    args.zmax,
-                                                                                    args.interval,
-                                                                                    args.seed_mult)
+               "--n_days %s --evclass %s --zmax %s --interval %s" % (args.tstart,
+                                                                     local_ft2,
+                                                                     local_src_dir,
+                                                                     args.xml,
+                                                                     args.source,
+                                                                     args.buffer,
+                                                                     args.n_days,
+                                                                     args.evclass,
+                                                                     args.zmax,
+                                                                     args.interval)
+
+    if args.seed is not None:
+
+        cmd_line += " --seed %s" % args.seed
+
+    elif args.seed_manifest is not None:
+
+        cmd_line += " --seed_manifest %s --replica %s" % (os.path.abspath(args.seed_manifest), args.replica)
+
+    elif args.seed_mult is not None:
+
+        cmd_line += " --seed_mult %s" % args.seed_mult
 
     try:
 
@@ -160,7 +178,7 @@ if __name__ == "__main__":
 
             for filename in output_files:
 
-                shutil.copy(os.path.join(workdir, filename), args.out_dir)
+                staged_copy(os.path.join(workdir, filename), args.out_dir)
 
     finally:
 
@@ -0,0 +1,177 @@
+"""Spatial index for positions on the sky. Positions are sorted by declination, so that the ones within a given
+    distance from a point can be found by taking the band of declinations [dec - radius, dec + radius] with a binary
+    search, and then computing the exact distances only for the positions in the band"""
+
+import numpy as np
+
+
+def _unit_vectors(ra, dec):
+
+    ra_rad = np.radians(ra)
+    dec_rad = np.radians(dec)
+
+    return np.column_stack((np.cos(dec_rad) * np.cos(ra_rad), np.cos(dec_rad) * np.sin(ra_rad), np.sin(dec_rad)))
+
+
+def angular_distance(ra1, dec1, ra2, dec2):
+    """
+    Angular distance (degrees) between positions given in degrees (arrays are broadcast)
+    """
+
+    ra1, dec1, ra2, dec2 = [np.radians(x) for x in (ra1, dec1, ra2, dec2)]
+
+    # Vincenty formula, accurate at all distances
+    delta_ra = ra2 - ra1
+
+    num = np.hypot(np.cos(dec2) * np.sin(delta_ra),
+                   np.cos(dec1) * np.sin(dec2) - np.sin(dec1) * np.cos(dec2) * np.cos(delta_ra))
+    den = np.sin(dec1) * np.sin(dec2) + np.cos(dec1) * np.cos(dec2) * np.cos(delta_ra)
+
+    return np.degrees(np.arctan2(num, den))
+
+
+class SkyIndex(object):
+    """
+    Index of a list of positions (degrees), to find quickly the positions near a given point
+    """
+
+    def __init__(self, ra, dec):
+
+        ra = np.asarray(ra, dtype=float)
+        dec = np.asarray(dec, dtype=float)
+
+        self._order = np.argsort(dec, kind='mergesort')
+
+        self._ra = ra[self._order]
+        self._dec = dec[self._order]
+        self._vectors = _unit_vectors(ra[self._order], self._dec)
+
+    def __len__(self):
+
+        return len(self._dec)
+
+    def query_radius(self, ra, dec, radius):
+        """
+        Return the indices (in the original order, sorted) of the positions within radius degrees from (ra, dec)
+        """
+
+        lo = np.searchsorted(self._dec, dec - radius, side='left')
+        hi = np.searchsorted(self._dec, dec + radius, side='right')
+
+        if hi <= lo:
+
+            return np.zeros(0, dtype=int)
+
+        center = _unit_vectors([ra], [dec])[0]
+
+        within = np.dot(self._vectors[lo:hi], center) >= np.cos(np.radians(radius))
+
+        return np.sort(self._order[lo:hi][within])
+
+    def query_many(self, ra, dec, radius):
+        """
+        Same as query_radius, for many points at once
+
+        :param ra: R.A. of the points (degrees)
+        :param dec: Dec. of the points (degrees)
+        :param radius: radius (degrees), either one value or one for each point
+        :return: a list with an array of indices for each point
+        """
+
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), np.shape(ra))
+
+        return [self.query_radius(r, d, rad) for r, d, rad in zip(ra, dec, radius)]
+
+    def pairs_within(self, radius):
+        """
+        Return all the pairs of positions closer than radius degrees to each other
+
+        :return: two arrays (i, j) of indices in the original order, with i < j
+        """
+
+        first = []
+        second = []
+
+        cos_radius = np.cos(np.radians(radius))
+
+        for k in range(len(self._dec)):
+
+            # Only look forward in the sorted order, so that each pair is found once
+            hi = np.searchsorted(self._dec, self._dec[k] + radius, side='right')
+
+            if hi <= k + 1:
+
+                continue
+
+            within = np.nonzero(np.dot(self._vectors[k + 1:hi], self._vectors[k]) >= cos_radius)[0] + k + 1
+
+            first.append(np.repeat(self._order[k], len(within)))
+            second.append(self._order[within])
+
+        if len(first) == 0:
+
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+        first = np.concatenate(first)
+        second = np.concatenate(second)
+
+        return np.minimum(first, second), np.maximum(first, second)
+
+    def nearest_within(self, ra, dec, radius):
+        """
+        Find, for each point, the closest indexed position within radius degrees. All the points are processed
+        together: at each step, every point is compared with the next position in its band of declinations.
+
+        :param ra: R.A. of the points (degrees)
+        :param dec: Dec. of the points (degrees)
+        :param radius: radius (degrees)
+        :return: two arrays (index, distance). The index (in the original order) is -1 and the distance is nan for
+        the points with no position within radius
+        """
+
+        ra = np.asarray(ra, dtype=float)
+        dec = np.asarray(dec, dtype=float)
+
+        lo = np.searchsorted(self._dec, dec - radius, side='left')
+        hi = np.searchsorted(self._dec, dec + radius, side='right')
+
+        # Points with the longest bands first: the points still active at each step are then the first ones
+        by_length = np.argsort(lo - hi, kind='mergesort')
+        lo = lo[by_length]
+        n_candidates = hi[by_length] - lo
+
+        vectors = _unit_vectors(ra[by_length], dec[by_length])
+
+        best_cos = np.zeros(len(ra)) + np.cos(np.radians(radius))
+        best = np.zeros(len(ra), dtype=int) - 1
+
+        n_steps = n_candidates[0] if len(ra) > 0 else 0
+
+        # Number of points still active at each step (n_candidates is decreasing)
+        n_active = np.searchsorted(-n_candidates, -np.arange(1, n_steps + 1), side='right')
+
+        for step in range(n_steps):
+
+            n = n_active[step]
+
+            candidates = lo[:n] + step
+
+            cos_distance = np.einsum('ij,ij->i', vectors[:n], self._vectors[candidates])
+
+            closer = np.nonzero(cos_distance >= best_cos[:n])[0]
+
+            best_cos[closer] = cos_distance[closer]
+            best[closer] = candidates[closer]
+
+        # Back to the order of the points
+        best[by_length] = best.copy()
+
+        found = best >= 0
+
+        index = np.where(found, self._order[np.maximum(best, 0)], -1)
+
+        distance = np.zeros(len(ra)) + np.nan
+
+        distance[found] = angular_distance(ra[found], dec[found], self._ra[best[found]], self._dec[best[found]])
+
+        return index, distance
@@ -0,0 +1,278 @@
+"""Sky-tiled search and removal of redundant triggers. The sky is divided in tiles (bands of declination with the
+    same area, each one divided in sectors of R.A.), and each tile is searched and cleaned with check_nearest on its
+    own, in a pool of processes: a worker only gets the events and the triggers of its tile. Two triggers in different
+    tiles can only overlap if both are closer than min_dist to the boundary of their tile (in the margin): the groups
+    of overlapping triggers which reach a margin are left to a last check_nearest, run after the tiles are done on
+    those triggers only. The result is the same as with a single check_nearest on the whole sky"""
+
+import multiprocessing
+
+import numpy as np
+
+from SULI.region_search import region_centers, search_events
+from SULI.remove_redundant_triggers import check_nearest
+from SULI.sky_index import SkyIndex
+
+
+def sky_tiles(n_tiles):
+    """
+    Divide the sky in about n_tiles tiles of similar area
+
+    :param n_tiles: number of tiles wanted
+    :return: a list of (dec_min, dec_max, ra_min, ra_max) in degrees
+    """
+
+    n_bands = max(1, int(round(np.sqrt(n_tiles / 2.0))))
+    n_sectors = max(1, int(round(n_tiles / float(n_bands))))
+
+    # Bands of equal area are equally spaced in sin(dec)
+    dec_edges = np.degrees(np.arcsin(np.linspace(-1, 1, n_bands + 1)))
+    ra_edges = np.linspace(0, 360, n_sectors + 1)
+
+    return [(dec_edges[i], dec_edges[i + 1], ra_edges[j], ra_edges[j + 1])
+            for i in range(n_bands) for j in range(n_sectors)]
+
+
+def tile_of(ra, dec, tiles):
+    """
+    Return the tile containing each position
+
+    :return: an array of indices in the list of tiles
+    """
+
+    ra = np.mod(np.asarray(ra, dtype=float), 360.0)
+    dec = np.asarray(dec, dtype=float)
+
+    index = np.zeros(len(ra), dtype=int) - 1
+
+    for k, (dec_min, dec_max, ra_min, ra_max) in enumerate(tiles):
+
+        # The northernmost band includes the pole
+        in_tile = (dec >= dec_min) & ((dec < dec_max) | (dec_max >= 90.0)) & (ra >= ra_min) & (ra < ra_max)
+
+        index[in_tile] = k
+
+    return index
+
+
+def boundary_distance(ra, dec, tile):
+    """
+    Return a lower limit on the distance (degrees) between each position and the boundary of its tile
+
+    :param ra: R.A. of the positions (degrees)
+    :param dec: Dec. of the positions (degrees)
+    :param tile: the tile (dec_min, dec_max, ra_min, ra_max)
+    :return: an array of distances
+    """
+
+    dec_min, dec_max, ra_min, ra_max = tile
+
+    ra = np.asarray(ra, dtype=float)
+    dec = np.asarray(dec, dtype=float)
+
+    distance = np.zeros(len(ra)) + 180.0
+
+    # The distance to a parallel is the difference in declination (the poles are not a boundary)
+    if dec_min > -90.0:
+
+        distance = np.minimum(distance, dec - dec_min)
+
+    if dec_max < 90.0:
+
+        distance = np.minimum(distance, dec_max - dec)
+
+    # The distance to a meridian, for the meridians which are boundaries
+    if ra_max - ra_min < 360.0:
+
+        for ra_edge in (ra_min, ra_max):
+
+            delta = np.radians(ra - ra_edge)
+
+            to_meridian = np.degrees(np.arcsin(np.minimum(1.0, np.cos(np.radians(dec)) * np.abs(np.sin(delta)))))
+
+            # On the other side of the sphere the closest point of the half meridian is a pole
+            to_meridian = np.where(np.cos(delta) >= 0, to_meridian, 90.0 - np.abs(dec))
+
+            distance = np.minimum(distance, to_meridian)
+
+    return distance
+
+
+def _map(function, tasks, n_processes):
+
+    if n_processes > 1 and len(tasks) > 1:
+
+        pool = multiprocessing.Pool(min(n_processes, len(tasks)))
+
+        try:
+
+            return pool.map(function, tasks)
+
+        finally:
+
+            pool.close()
+            pool.join()
+
+    else:
+
+        return [function(task) for task in tasks]
+
+
+def _components(ra, dec, min_dist):
+
+    # Connected components of the graph linking the positions closer than min_dist (a small tolerance makes sure that
+    # no pair considered overlapping by check_nearest is missed: extra links only make the components larger)
+    first, second = SkyIndex(ra, dec).pairs_within(min_dist + 1e-6)
+
+    label = np.arange(len(ra))
+
+    def root(k):
+
+        while label[k] != k:
+
+            label[k] = label[label[k]]
+            k = label[k]
+
+        return k
+
+    for a, b in zip(first, second):
+
+        label[root(a)] = root(b)
+
+    return np.array([root(k) for k in range(len(ra))], dtype=int)
+
+
+def _clean_tile(triggers, tile, min_dist):
+
+    # check_nearest only removes a trigger because of a trigger overlapping it, so it acts separately on each group of
+    # triggers connected by overlaps. The groups of this tile which do not reach its margin cannot be connected to
+    # other tiles: clean them here. The others are returned as they are, and cleaned together at the end
+    if len(triggers) == 0:
+
+        return triggers, triggers
+
+    labels = _components(triggers['ra'], triggers['dec'], min_dist)
+
+    in_margin = boundary_distance(triggers['ra'], triggers['dec'], tile) <= min_dist + 1e-6
+
+    deferred = np.in1d(labels, np.unique(labels[in_margin]))
+
+    return check_nearest(triggers[~deferred], min_dist), triggers[deferred]
+
+
+def _clean_tile_star(args):
+
+    return _clean_tile(*args)
+
+
+def _search_tile(args):
+
+    times, ra, dec, tstart, tstop, probability, spacing, radius, regions, tile, min_dist = args
+
+    triggers = search_events(times, ra, dec, tstart, tstop, probability, spacing, radius, regions)
+
+    # The triggers before the cleaning are returned as well (see tiled_search)
+    return _clean_tile(triggers, tile, min_dist) + (triggers,)
+
+
+def _resolve_margins(results, min_dist, names):
+
+    # Since each group of connected triggers is cleaned as a whole (either in its tile or here), and in the original
+    # order, the result is the same as check_nearest on the whole list
+    position = dict((name, k) for k, name in enumerate(names))
+
+    def in_original_order(triggers):
+
+        return triggers[np.argsort([position[name] for name in triggers['name']], kind='mergesort')]
+
+    cleaned = [result[0] for result in results]
+
+    deferred = in_original_order(np.concatenate([result[1] for result in results]).view(np.recarray))
+
+    n_deferred = len(deferred)
+
+    if n_deferred > 0:
+
+        deferred = check_nearest(deferred, min_dist)
+
+    print("Sky tiles: %s triggers connected to the margins, %s after removing the redundant ones" % (n_deferred,
+                                                                                                   len(deferred)))
+
+    return in_original_order(np.concatenate(cleaned + [deferred]).view(np.recarray))
+
+
+def tiled_check_nearest(regions, min_dist, n_tiles, n_processes=1):
+    """
+    Same as check_nearest, with the sky divided in tiles cleaned in parallel
+
+    :param regions: the triggers (a np.recarray, as returned by read_triggers)
+    :param min_dist: the minimum distance between the centers of two regions below which they are overlapping
+    :param n_tiles: number of tiles (approximately)
+    :param n_processes: number of tiles cleaned at the same time
+    :return: the cleaned list of triggers (a np.recarray)
+    """
+
+    tiles = sky_tiles(n_tiles)
+
+    index = tile_of(regions['ra'], regions['dec'], tiles)
+
+    results = _map(_clean_tile_star, [(regions[index == k], tiles[k], min_dist) for k in range(len(tiles))],
+                   n_processes)
+
+    return _resolve_margins(results, min_dist, regions['name'])
+
+
+def tiled_search(times, ra, dec, tstart, tstop, probability, min_dist, n_tiles, n_processes=1, spacing=5.0,
+                 radius=10.0, return_raw=False):
+    """
+    Search a list of events for transients (as region_search.search_events) and remove the redundant triggers (as
+    check_nearest), with the sky divided in tiles processed in parallel. Each worker gets only the events within
+    radius of the regions of its tile.
+
+    :param min_dist: the minimum distance between the centers of two regions below which they are overlapping
+    :param n_tiles: number of tiles (approximately)
+    :param n_processes: number of tiles processed at the same time
+    :param return_raw: if True, return also the triggers before removing the redundant ones (what search_events would
+    return), which can be cleaned again with another min_dist by tiled_check_nearest
+    :return: the cleaned list of triggers (a np.recarray), or (cleaned list, raw list) with return_raw
+    """
+
+    tiles = sky_tiles(n_tiles)
+
+    centers_ra, centers_dec = region_centers(spacing)
+
+    index = tile_of(centers_ra, centers_dec, tiles)
+
+    events = SkyIndex(ra, dec)
+
+    tasks = []
+
+    for k in range(len(tiles)):
+
+        regions = np.nonzero(index == k)[0]
+
+        # Events of the regions of this tile
+        selected = np.unique(np.concatenate([np.zeros(0, dtype=int)] +
+                                            events.query_many(centers_ra[regions], centers_dec[regions], radius)))
+
+        tasks.append((times[selected], ra[selected], dec[selected], tstart, tstop, probability, spacing, radius,
+                      regions, tiles[k], min_dist))
+
+    results = _map(_search_tile, tasks, n_processes)
+
+    names = ["region_%s" % i for i in range(len(centers_ra))]
+
+    cleaned = _resolve_margins(results, min_dist, names)
+
+    if not return_raw:
+
+        return cleaned
+
+    # In the order of the regions, as search_events would give them
+    raw = np.concatenate([result[2] for result in results]).view(np.recarray)
+
+    position = dict((name, k) for k, name in enumerate(names))
+
+    raw = raw[np.argsort([position[name] for name in raw['name']], kind='mergesort')]
+
+    return cleaned, raw
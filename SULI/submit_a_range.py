@@ -4,13 +4,17 @@ import numpy as np
 import subprocess
 import argparse
 import os
-import astropy.io.fits as pyfits
-
-from SULI import which
+from SULI.cli import script_path
+from SULI.fits_access import column_endpoints
+from SULI.seeds import campaign_manifest, lookup_seed, manifest_file_name
 from SULI.work_within_directory import work_within_directory
+from SULI.profiling import profile_script, profile_jobs
 
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     parser = argparse.ArgumentParser(
         'Submit simulation to the farm at Stanford')
 
@@ -23,7 +27,20 @@ if __name__ == "__main__":
     parser.add_argument("--res_dir", help="Directory where to put the results and logs for the simulation",
                         required=False, type=str, default=os.getcwd())
 
-    parser.add_argument("--seed_mult", help="Seed is multiplied by this number", required=False, type=int, default=1)
+    parser.add_argument("--seed_mult", help="Seed is multiplied by this number (legacy, ignored if --campaign is "
+                                            "used)", required=False, type=int, default=1)
+
+    parser.add_argument("--campaign", help="Name of the simulation campaign. If given, the seeds of each replica and "
+                                           "day are derived from it and recorded in "
+                                           "res_dir/seed_manifest_[campaign].json, which is checked against the "
+                                           "manifests of the other campaigns in res_dir", required=False, type=str,
+                        default=None)
+
+    parser.add_argument("--replicas", help="Number of replicas of each day to simulate (only with --campaign, "
+                                           "default: 1)", required=False, type=int, default=1)
+
+    parser.add_argument("--profile_jobs", help="Run the farm jobs with --profile (their profiles are written in "
+                                               "res_dir/profiles, see SULI.profiling)", action='store_true')
 
     parser.add_argument('--test', dest='test_run', action='store_true')
     parser.set_defaults(test_run=False)
@@ -65,9 +82,7 @@ if __name__ == "__main__":
 
         ft2_path = os.path.abspath(os.path.expandvars(os.path.expanduser(args.in_ft2)))
 
-        data = pyfits.getdata(ft2_path, "SC_DATA")
-
-        ft2_tstart = data.START.min()
+        ft2_tstart = column_endpoints(ft2_path, "SC_DATA", "START")[0]
 
         # Generate the command line
 
@@ -75,21 +90,36 @@ if __name__ == "__main__":
         out_path = os.path.abspath('generated_data')
 
         # Find executable
-        exe_path = which.which('simulate_in_the_farm.py')
+        exe_path = script_path('farm-simulate')
+
+        profile_option = profile_jobs(res_dir) if args.profile_jobs else ''
 
-        def get_cmd_line(sub_tstart):
+        def get_cmd_line(sub_tstart, replica=None):
+
+            if replica is None:
+
+                this_out_path = out_path
+                log_name = sub_tstart
+                seed_options = "--seed_mult %s" % args.seed_mult
+
+            else:
+
+                this_out_path = os.path.join(out_path, 'replica_%03i' % replica)
+                log_name = "%s_%03i" % (sub_tstart, replica)
+                seed_options = "--seed %s" % lookup_seed(manifest, replica, sub_tstart)
 
             cmd_line = "qsub -l vmem=30gb -o %s/%s.out -e %s/%s.err -V -F '--tstart %s --in_ft2 %s " \
-                       "--src_dir %s --out_dir %s --seed_mult %s' %s" % (log_path,
-                                                                         sub_tstart,
-                                                                         log_path,
-                                                                         sub_tstart,
-                                                                         sub_tstart,
-                                                                         ft2_path,
-                                                                         src_dir,
-                                                                         out_path,
-                                                                         args.seed_mult,
-                                                                         exe_path)
+                       "--src_dir %s --out_dir %s %s%s' %s" % (log_path,
+                                                             log_name,
+                                                             log_path,
+                                                             log_name,
+                                                             sub_tstart,
+                                                             ft2_path,
+                                                             src_dir,
+                                                             this_out_path,
+                                                             seed_options,
+                                                             profile_option,
+                                                             exe_path)
 
             return cmd_line
 
@@ -97,12 +127,41 @@ if __name__ == "__main__":
 
         tstarts = np.arange(ft2_tstart, ft2_tstart + (365.0 * 86400.0), 86400.0)
 
-        for this_tstart in tstarts:
+        if args.campaign is None:
+
+            for this_tstart in tstarts:
+
+                this_cmd_line = get_cmd_line(this_tstart)
+
+                print(this_cmd_line)
+
+                if not args.test_run:
+
+                    subprocess.check_call(this_cmd_line, shell=True)
+
+        else:
+
+            replicas = range(args.replicas)
+
+            # Seeds are assigned (or re-read, if the campaign already exists) before submitting anything
+            manifest = campaign_manifest(res_dir, args.campaign, replicas, tstarts)
+
+            print("Seeds of campaign %s are in %s" % (args.campaign, manifest_file_name(res_dir, args.campaign)))
+
+            for replica in replicas:
+
+                replica_dir = os.path.join(out_path, 'replica_%03i' % replica)
+
+                if not os.path.exists(replica_dir):
+
+                    os.mkdir(replica_dir)
+
+                for this_tstart in tstarts:
 
-            this_cmd_line = get_cmd_line(this_tstart)
+                    this_cmd_line = get_cmd_line(this_tstart, replica)
 
-            print(this_cmd_line)
+                    print(this_cmd_line)
 
-            if not args.test_run:
+                    if not args.test_run:
 
-                subprocess.check_call(this_cmd_line, shell=True)
+                        subprocess.check_call(this_cmd_line, shell=True)
@@ -5,15 +5,21 @@ import os
 import time
 import calendar
 
-from SULI import which
-from SULI.execute_command import execute_command
+from SULI.campaign_metrics import CampaignMetrics
+from SULI.cli import script_path
+from SULI.check_ft_pair import check_ft_pair
+from SULI.farm_queue import submit_job
+from SULI.result_cache import ResultCache, default_cache_dir, search_key, final_name, input_digests
 from SULI.work_within_directory import work_within_directory
-from astropy.io import fits
 from subprocess import check_output
+from SULI.profiling import profile_script, profile_jobs
 
 
 if __name__ == "__main__":
 
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
     parser = argparse.ArgumentParser('Submit transient search to the farm at Stanford')
 
     # add the arguments needed to the parser
@@ -23,17 +29,38 @@ if __name__ == "__main__":
     group.add_argument('--dates', help='Name of txt file containing dates to load real data from', type=str)
     group.add_argument('--date', help='Date of real data that will be searched', type=str)
     group.add_argument("--src_dir", help="Directory containing simulated data to be searched", type=str)
+    group.add_argument("--grbs", help="Name of txt file containing GRB names (or trigger times as MET, see "
+                                      "GRB_to_date.py): only a window around each trigger time is searched, and the "
+                                      "GRBs with overlapping windows are searched in the same job", type=str)
 
     parser.add_argument("--irf", help="Instrument response function name to be used", type=str, required=True)
     parser.add_argument("--probability", help="Probability of null hypothesis", type=float, default=1e-5)
     parser.add_argument("--min_dist", help="Distance above which regions are not considered to overlap", type=float,
                         required=True)
 
+    parser.add_argument("--before", help="With --grbs, seconds searched before each trigger time (default: 3600)",
+                        type=float, default=3600.0)
+    parser.add_argument("--after", help="With --grbs, seconds searched after each trigger time (default: 3600)",
+                        type=float, default=3600.0)
+
     parser.add_argument("--res_dir", help="Directory where to put the results and logs for the search",
                         required=False, type=str, default=os.getcwd())
     parser.add_argument("--job_size", help="Number of jobs to submit at a time", required=False, type=int, default=20)
     parser.add_argument("--last_job", help="Integer specifying the last job submitted in this folder/year",
                         required=False, type=int, default=0)
+    parser.add_argument("--cache_dir", help="Directory of the cache of the search results: the days already in the "
+                                            "cache are copied to the results instead of being submitted (see "
+                                            "SULI.result_cache). Default: the value of the SULI_RESULT_CACHE "
+                                            "environment variable, or no cache", type=str, default=None)
+    parser.add_argument("--metrics_port", help="If given, serve the metrics of the campaign (jobs submitted, running, "
+                                               "finished and failed, throughput, queue wait, time of each stage, "
+                                               "estimated completion) over HTTP on this port, in the Prometheus "
+                                               "format. They are always written in <res_dir>/metrics/metrics.prom "
+                                               "(see SULI.campaign_metrics)", type=int, default=None)
+    parser.add_argument("--watch", help="After the last submission, keep updating the metrics until all the days are "
+                                        "finished", action='store_true')
+    parser.add_argument("--profile_jobs", help="Run the farm jobs with --profile (their profiles are written in "
+                                               "res_dir/profiles, see SULI.profiling)", action='store_true')
     parser.add_argument('--test', dest='test_run', action='store_true')
     parser.set_defaults(test_run=False)
 
@@ -67,7 +94,56 @@ if __name__ == "__main__":
         # Generate universal command line parameters
         log_path = os.path.abspath('logs')
         out_path = os.path.abspath('generated_data')
-        exe_path = which.which('search_on_farm.py')
+        exe_path = script_path('farm-search')
+
+        # The jobs use (and fill) the same cache
+        cache_dir = args.cache_dir if args.cache_dir is not None else default_cache_dir()
+
+        cache = ResultCache(cache_dir) if cache_dir else None
+
+        cache_option = ' --cache_dir %s' % cache.directory if cache is not None else ''
+
+        # Options common to all the jobs
+        job_options = cache_option + (profile_jobs(res_dir) if args.profile_jobs else '')
+
+        def from_cache(inputs, out_name, mode='', digests=None):
+
+            # Copy the results of a day to generated_data if they are already in the cache
+            if cache is None:
+
+                return False
+
+            key = search_key(inputs, args.irf, args.probability, mode, digests=digests)
+
+            if cache.get(key, final_name(args.min_dist), os.path.join(out_path, out_name)):
+
+                print("Results of %s found in the cache: not submitted" % out_name)
+
+                return True
+
+            return False
+
+        # Metrics of the campaign (not for a test run, which would remove the records of a running campaign)
+        metrics = CampaignMetrics(res_dir, new=True) if not args.test_run else None
+
+        if metrics is not None and args.metrics_port is not None:
+
+            metrics.serve(args.metrics_port)
+
+        def submit_day(cmd_line, name, inputs, out_name, mode='', digests=None):
+
+            # Submit the job of a day, unless its results are already in the cache
+            cached = from_cache(inputs, out_name, mode, digests)
+
+            # (this also passes the submission time to the job, for the queue wait)
+            metrics.submitted(name, cached)
+
+            if not cached:
+
+                print("\nSubmitting: %s" % cmd_line)
+
+                # (the id of the job is kept, to find the jobs which leave the queue without finishing)
+                submit_job(cmd_line, metrics.job_ids_file)
 
         # loop-staggering function for bulk submissions to farm
 
@@ -98,6 +174,10 @@ if __name__ == "__main__":
                     num_fin = len(
                         [res for res in os.listdir(DIR) if os.path.isfile(os.path.join(DIR, res))])
 
+                    if metrics is not None:
+
+                        metrics.update()
+
                     # Job status for anyone watching
                     print "%s ouf of %s " \
                           "jobs in this pass finished." % ((num_fin - num_res_files) % args.job_size,
@@ -170,6 +250,9 @@ if __name__ == "__main__":
         # if using simulated data:
         if args.src_dir:
 
+            # Imported here because astropy is slow to import and not needed for real data
+            from SULI.fits_access import header_extent
+
             # get src directory from parser
             src_dir = os.path.abspath(os.path.expandvars(os.path.expanduser(args.src_dir)))
 
@@ -218,37 +301,33 @@ if __name__ == "__main__":
             # make sure pairs match
             for i in range(len(ft1_files)):
 
-                with fits.open(os.path.join(src_dir, ft1_files[i])) as fits_file:
-
-                    # Check the start and stop in the binary table
-                    ft1_times = fits_file['EVENTS'].data.field("TIME")
-                    ft1_starts = fits_file['GTI'].data.field("START")
-                    ft1_stops = fits_file['GTI'].data.field("STOP")
-
-                with fits.open(os.path.join(src_dir, ft2_files[i])) as fits_file:
-
-                    # Check the start and stop in the binary table
-                    ft2_starts = fits_file['SC_DATA'].data.field("START")
-                    ft2_stops = fits_file['SC_DATA'].data.field("STOP")
+                try:
 
-                if ft2_starts.min() - min(ft1_starts.min(), ft1_times.min()) > 0:
+                    check_ft_pair(os.path.join(src_dir, ft1_files[i]), os.path.join(src_dir, ft2_files[i]))
 
-                    raise RuntimeError("Mismatch in ft pair %s (FT2 file starts after the start of the FT1 file)" % i)
+                except RuntimeError as e:
 
-                if ft2_stops.max() - max(ft1_stops.max(), ft1_stops.max()) < 0:
-
-                    raise RuntimeError("Mismatch in ft pair %s (FT2 file stops before the end of the FT1 file)" % i)
+                    raise RuntimeError("Mismatch in ft pair %s (%s)" % (i, e))
 
             # generate command line
-            def sim_cmd_line(ft1, ft2, jobid):
+            def sim_cmd_line(ft1, ft2, jobid, digests=None):
+
+                # The job uses the digests of the input files for the cache, instead of reading them again
+                digests_option = ' --input_digests %s' % ','.join(digests) if digests is not None else ''
 
                 this_cmd_line = "qsub -l vmem=30gb -o %s/%s.out -e %s/%s.err -V -F '--inp_fts %s,%s --irf %s " \
-                                "--probability %s --min_dist %s --out_dir %s' %s" % (log_path, jobid, log_path,
-                                                                                     jobid, ft1, ft2, args.irf,
-                                                                                     args.probability, args.min_dist,
-                                                                                     out_path, exe_path)
+                                "--probability %s --min_dist %s --out_dir %s%s%s' %s" % (log_path, jobid, log_path,
+                                                                                         jobid, ft1, ft2, args.irf,
+                                                                                         args.probability,
+                                                                                         args.min_dist, out_path,
+                                                                                         job_options, digests_option,
+                                                                                         exe_path)
                 return this_cmd_line
 
+            if metrics is not None:
+
+                metrics.n_days = len(ft1_files) - args.last_job
+
             # iterate over input directory, calling search on each pair of fits
             fails = []
             for i in range(args.last_job, len(ft1_files)):
@@ -257,11 +336,17 @@ if __name__ == "__main__":
                 this_ft2 = src_dir + '/' + ft2_files[i]
                 this_id = ft1_files[i]
 
-                cmd_line = sim_cmd_line(this_ft1, this_ft2, this_id)
+                # The input files are hashed here only, for the cache
+                digests = input_digests([this_ft1, this_ft2]) if cache is not None else None
+
+                cmd_line = sim_cmd_line(this_ft1, this_ft2, this_id, digests)
                 if not args.test_run:
 
                     print "\nDay %s:" % (i + 1)
-                    execute_command(cmd_line)
+
+                    # use start time of ft1 for the name of the results, as search_on_farm.py
+                    submit_day(cmd_line, this_id, [this_ft1, this_ft2],
+                               str(header_extent(this_ft1)[0]) + '_detections.txt', digests=digests)
 
                     safe_run(i, fails)
 
@@ -275,13 +360,17 @@ if __name__ == "__main__":
         # else using real data
         else:
 
-            def rl_cmd_line(start):
+            def rl_cmd_line(start, duration=None):
+
+                duration_option = ' --duration %s' % duration if duration is not None else ''
 
                 this_cmd_line = "qsub -l vmem=30gb -o %s/%s.out -e %s/%s.err -V -F '--date %s --irf %s " \
-                                "--probability %s --min_dist %s --out_dir %s' %s" % (log_path, start, log_path,
-                                                                                     start, start, args.irf,
-                                                                                     args.probability, args.min_dist,
-                                                                                     out_path, exe_path)
+                                "--probability %s --min_dist %s --out_dir %s%s%s' %s" % (log_path, start, log_path,
+                                                                                         start, start, args.irf,
+                                                                                         args.probability,
+                                                                                         args.min_dist, out_path,
+                                                                                         duration_option,
+                                                                                         job_options, exe_path)
                 return this_cmd_line
 
             # single day
@@ -291,7 +380,9 @@ if __name__ == "__main__":
 
                 if not args.test_run:
 
-                    execute_command(cmd_line)
+                    metrics.n_days = 1
+
+                    submit_day(cmd_line, args.date, args.date, str(args.date) + '_detections.txt')
 
             # A list of dates
             elif args.dates:
@@ -299,6 +390,10 @@ if __name__ == "__main__":
                 # get dates from file as a list
                 dates = [line.rstrip('\n') for line in open(args.dates)]
 
+                if metrics is not None:
+
+                    metrics.n_days = len(dates)
+
                 # iterate over dates, searching each
                 fails = []
                 for i in range(len(dates)):
@@ -307,7 +402,7 @@ if __name__ == "__main__":
 
                     if not args.test_run:
 
-                        execute_command(cmd_line)
+                        submit_day(cmd_line, dates[i], dates[i], str(dates[i]) + '_detections.txt')
 
                         safe_run(i, fails)
 
@@ -315,6 +410,40 @@ if __name__ == "__main__":
                             pass
                             # raise RuntimeError('Too Many Jobs Have Failed')
 
+            # windows around the trigger times of GRBs
+            elif args.grbs:
+
+                from SULI.GRB_to_date import grb_name_to_met, grb_windows
+                from SULI.result_cache import interval_mode
+
+                grbs = [line.strip() for line in open(args.grbs) if line.strip() != '']
+
+                windows = grb_windows([grb_name_to_met(grb) for grb in grbs], args.before, args.after)
+
+                print('\n%s GRBs in %s windows (%s s searched instead of %s days)\n' %
+                      (len(grbs), len(windows), sum(stop - start for start, stop, _ in windows), len(grbs)))
+
+                if metrics is not None:
+
+                    metrics.n_days = len(windows)
+
+                fails = []
+                for i in range(len(windows)):
+
+                    start, stop, members = windows[i]
+
+                    print("Window %s: %s s from %s (%s)" % (i + 1, stop - start, repr(start),
+                                                            ", ".join(grbs[k] for k in members)))
+
+                    cmd_line = rl_cmd_line(repr(start), repr(stop - start))
+
+                    if not args.test_run:
+
+                        submit_day(cmd_line, repr(start), repr(start), repr(start) + '_detections.txt',
+                                   interval_mode(duration=stop - start))
+
+                        safe_run(i, fails)
+
             # a year of data
             else:
 
@@ -373,6 +502,10 @@ if __name__ == "__main__":
 
                         date_list.append(this_date)
 
+                if metrics is not None:
+
+                    metrics.n_days = year_length - args.last_job
+
                 # iterate over year, searching each day
                 fails = []
                 for i in range(args.last_job, year_length):
@@ -382,10 +515,27 @@ if __name__ == "__main__":
                     if not args.test_run:
 
                         print "\nDay %s:" % (i + 1)
-                        execute_command(cmd_line)
+
+                        submit_day(cmd_line, date_list[i], date_list[i], str(date_list[i]) + '_detections.txt')
 
                         safe_run(i, fails)
 
                         if len(fails) >= 10:
                             pass
                             # raise RuntimeError('Too Many Jobs Have Failed')
+
+        # Keep the metrics up to date until the end of the campaign
+        if args.watch and metrics is not None:
+
+            status = metrics.update()
+
+            # Jobs killed by the scheduler are counted as failed, and the loop also ends when no job is left
+            while not metrics.finished(status):
+
+                time.sleep(30)
+
+                status = metrics.update()
+
+                print "%s of %s days finished (%s failed), %s jobs running, %s lost, %.1f days/hour" % \
+                      (status['finished'], status['days'], status['failed'], status['running'], status['lost'],
+                       status['days_per_hour'])
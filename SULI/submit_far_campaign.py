@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+"""Submit a false alarm rate campaign to the farm: K replicas of D days of null simulations, each one simulated,
+    searched and cleaned of redundant triggers. Several days are packed in each farm job (see far_campaign_job.py), so
+    that the cost of starting a job and staging in the inputs is paid once for many days. The seeds of all the days
+    are assigned beforehand (see SULI.seeds).
+
+    As the trigger lists arrive, they are folded into the FAR curve of the campaign (see SULI.far): use --watch to
+    keep updating it until the campaign is over, or --aggregate to update it once without submitting anything. The
+    campaign is over when every day has either a trigger list or a failure, or when none of its jobs is left in the
+    queue (jobs killed by the scheduler leave neither). Days which already have a trigger list are not submitted
+    again, so the same command can be used to resubmit the days of a campaign which failed"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from SULI.cli import script_path
+from SULI.far import read_state, write_state, add_trigger_list, write_far_curve
+from SULI.far_campaign_job import write_tasks, detection_file_name, failed_file_name
+from SULI.farm_queue import submit_job, read_job_ids, jobs_in_queue
+from SULI.seeds import campaign_manifest, lookup_seed, manifest_file_name
+from SULI.work_within_directory import work_within_directory
+from SULI.profiling import profile_script, profile_jobs
+
+
+def update_far_curve(res_dir, campaign):
+    """
+    Fold the trigger lists which arrived since the last update into the FAR curve of the campaign, and write the curve
+    to res_dir/far_curve_[campaign].txt
+
+    :param res_dir: results directory of the campaign
+    :param campaign: name of the campaign
+    :return: the state of the FAR curve
+    """
+
+    state_file = os.path.join(res_dir, 'far_state_%s.json' % campaign)
+
+    state = read_state(state_file, campaign)
+
+    data_dir = os.path.join(res_dir, 'generated_data')
+
+    n_new = 0
+
+    for filename in sorted(glob.glob(os.path.join(data_dir, 'replica_*', '*_detections.txt'))):
+
+        if add_trigger_list(state, filename, os.path.relpath(filename, data_dir)):
+
+            n_new += 1
+
+    if n_new > 0:
+
+        write_state(state, state_file)
+
+        write_far_curve(state, os.path.join(res_dir, 'far_curve_%s.txt' % campaign))
+
+    print("%s new trigger lists, %s days in total (%s triggers)" % (n_new, state['n_days'], state['n_triggers']))
+
+    return state
+
+
+def count_failed_days(res_dir):
+    """
+    Return the number of days which failed (see far_campaign_job.failed_file_name) and have no trigger list
+    """
+
+    data_dir = os.path.join(res_dir, 'generated_data')
+
+    failures = glob.glob(os.path.join(data_dir, 'replica_*', '*_failed.txt'))
+
+    return len([f for f in failures if not os.path.exists(f.replace('_failed.txt', '_detections.txt'))])
+
+
+if __name__ == "__main__":
+
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
+    parser = argparse.ArgumentParser('Submit a false alarm rate campaign to the farm at Stanford')
+
+    parser.add_argument("--campaign", help="Name of the campaign", required=True, type=str)
+    parser.add_argument("--in_ft2", help="Ft2 file used for the simulations", required=True, type=str)
+    parser.add_argument("--src_dir", help="Directory containing input data for the simulation", required=True,
+                        type=str)
+    parser.add_argument("--irf", help="Instrument response function name to be used", type=str, required=True)
+    parser.add_argument("--probability", help="Probability of null hypothesis", type=float, default=1e-5)
+    parser.add_argument("--min_dist", help="Distance above which regions are not considered to overlap", type=float,
+                        required=True)
+
+    parser.add_argument("--res_dir", help="Directory where to put the results and logs of the campaign",
+                        required=False, type=str, default=os.getcwd())
+    parser.add_argument("--replicas", help="Number of replicas of each day (default: 10)", type=int, default=10)
+    parser.add_argument("--n_days", help="Number of days, starting from the beginning of the FT2 file (default: 365)",
+                        type=int, default=365)
+    parser.add_argument("--days_per_job", help="Number of days simulated and searched by each farm job "
+                                               "(default: 10)", type=int, default=10)
+    parser.add_argument("--watch", help="After submitting, update the FAR curve every this many seconds until all "
+                                        "the days are done (default: 0, do not wait)", type=float, default=0)
+    parser.add_argument("--max_wait", help="Stop watching after this many seconds (default: 0, no limit)",
+                        type=float, default=0)
+    parser.add_argument("--aggregate", help="Only update the FAR curve with the trigger lists already available",
+                        action='store_true')
+    parser.add_argument("--profile_jobs", help="Run the farm jobs with --profile (their profiles are written in "
+                                               "res_dir/profiles, see SULI.profiling)", action='store_true')
+    parser.add_argument('--test', dest='test_run', action='store_true')
+    parser.set_defaults(test_run=False)
+
+    args = parser.parse_args()
+
+    res_dir = os.path.abspath(os.path.expandvars(os.path.expanduser(args.res_dir)))
+
+    if not os.path.exists(res_dir):
+
+        raise RuntimeError("Directory %s does not exists" % res_dir)
+
+    if args.aggregate:
+
+        update_far_curve(res_dir, args.campaign)
+
+    else:
+
+        src_dir = os.path.abspath(os.path.expandvars(os.path.expanduser(args.src_dir)))
+
+        if not os.path.exists(src_dir):
+
+            raise RuntimeError("Directory %s does not exists" % src_dir)
+
+        with work_within_directory(res_dir):
+
+            for directory in ('logs', 'generated_data', 'tasks_%s' % args.campaign):
+
+                if not os.path.exists(directory):
+
+                    os.mkdir(directory)
+
+            # Imported here because astropy is slow to import and not needed for --aggregate
+            from SULI.fits_access import column_endpoints
+
+            ft2_path = os.path.abspath(os.path.expandvars(os.path.expanduser(args.in_ft2)))
+
+            ft2_tstart = column_endpoints(ft2_path, "SC_DATA", "START")[0]
+
+            log_path = os.path.abspath('logs')
+            out_path = os.path.abspath('generated_data')
+            task_path = os.path.abspath('tasks_%s' % args.campaign)
+
+            exe_path = script_path('farm-far')
+
+            profile_option = profile_jobs(res_dir) if args.profile_jobs else ''
+
+            day_starts = ft2_tstart + 86400.0 * np.arange(args.n_days)
+
+            replicas = range(args.replicas)
+
+            manifest = campaign_manifest(res_dir, args.campaign, replicas, day_starts)
+
+            print("Seeds of campaign %s are in %s" % (args.campaign, manifest_file_name(res_dir, args.campaign)))
+
+            # Days which still need to be done
+            tasks = [(replica, day_start, lookup_seed(manifest, replica, day_start))
+                     for replica in replicas for day_start in day_starts
+                     if not os.path.exists(detection_file_name(out_path, replica, day_start))]
+
+            n_jobs = int(np.ceil(len(tasks) / float(args.days_per_job)))
+
+            print("%s days to do (of %s), in %s jobs" % (len(tasks), len(replicas) * len(day_starts), n_jobs))
+
+            # Ids of the jobs of the campaign (of all the submissions)
+            ids_file = os.path.join(task_path, 'job_ids.txt')
+
+            for job in range(n_jobs):
+
+                job_name = '%s_%04i' % (args.campaign, job)
+
+                task_file = os.path.join(task_path, 'job_%04i.txt' % job)
+
+                write_tasks(tasks[job * args.days_per_job: (job + 1) * args.days_per_job], task_file)
+
+                cmd_line = "qsub -l vmem=30gb -o %s/%s.out -e %s/%s.err -V -F '--tasks %s --in_ft2 %s --src_dir %s " \
+                           "--out_dir %s --irf %s --probability %s --min_dist %s%s' %s" % (log_path, job_name,
+                                                                                          log_path, job_name,
+                                                                                          task_file, ft2_path,
+                                                                                          src_dir, out_path, args.irf,
+                                                                                          args.probability,
+                                                                                          args.min_dist,
+                                                                                          profile_option, exe_path)
+
+                print(cmd_line)
+
+                if not args.test_run:
+
+                    # The days are done again: forget their previous failures
+                    for replica, day_start, _ in tasks[job * args.days_per_job: (job + 1) * args.days_per_job]:
+
+                        if os.path.exists(failed_file_name(out_path, replica, day_start)):
+
+                            os.remove(failed_file_name(out_path, replica, day_start))
+
+                    submit_job(cmd_line, ids_file)
+
+        state = update_far_curve(res_dir, args.campaign)
+
+        n_total = len(replicas) * len(day_starts)
+
+        start_time = time.time()
+
+        while args.watch > 0 and not args.test_run:
+
+            n_failed = count_failed_days(res_dir)
+
+            if state['n_days'] + n_failed >= n_total:
+
+                break
+
+            in_queue = jobs_in_queue(read_job_ids(os.path.join(res_dir, 'tasks_%s' % args.campaign, 'job_ids.txt')))
+
+            # (None: qstat could not be run, check again later)
+            if in_queue is not None and len(in_queue) == 0:
+
+                # The jobs might have written their last trigger lists after the update above
+                state = update_far_curve(res_dir, args.campaign)
+                n_failed = count_failed_days(res_dir)
+
+                print("No jobs of the campaign left in the queue: %s days failed, %s never finished (jobs killed?)"
+                      % (n_failed, max(n_total - state['n_days'] - n_failed, 0)))
+
+                break
+
+            if 0 < args.max_wait <= time.time() - start_time:
+
+                print("Stopped watching after %.0f s" % args.max_wait)
+
+                break
+
+            time.sleep(args.watch)
+
+            state = update_far_curve(res_dir, args.campaign)
+
+            print("%s of %s days done, %s failed" % (state['n_days'], n_total, count_failed_days(res_dir)))
+
+        print("\nFAR curve in %s" % os.path.join(res_dir, 'far_curve_%s.txt' % args.campaign))
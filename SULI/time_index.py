@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+"""Index of the rows of FT1/FT2 files by time. For each extension indexed (EVENTS for FT1 files, SC_DATA for FT2
+    files) the index records the first row of every time bucket (one hour by default), and it is stored in a sidecar
+    file next to the data file (<file>.tindex.npz). With the index, the rows in a time range can be read (or copied
+    to a new file) by going straight to them in the memory-mapped table, instead of scanning the whole file as fcopy
+    does. The time columns must be sorted, which is the case for FT1 and FT2 files.
+
+    Run this script on FT1/FT2 files to build their indexes in advance:
+
+        time_index.py --files my_ft1.fits my_ft2.fits [--bucket 3600]"""
+
+import argparse
+import os
+import zipfile
+
+import numpy as np
+from astropy.io import fits
+
+from SULI.profiling import profile_script
+
+# Time column indexed for each extension
+INDEXED_COLUMNS = {'EVENTS': 'TIME', 'SC_DATA': 'START'}
+
+
+def index_file_name(filename):
+
+    return filename + '.tindex.npz'
+
+
+def _file_signature(filename):
+
+    stat = os.stat(filename)
+
+    return [stat.st_size, stat.st_mtime]
+
+
+def _find_extension(f):
+
+    for extension, column in INDEXED_COLUMNS.items():
+
+        if extension in [hdu.name for hdu in f]:
+
+            return extension, column
+
+    raise RuntimeError("%s has none of the extensions %s" % (f.filename(), ", ".join(INDEXED_COLUMNS.keys())))
+
+
+def build_index(filename, bucket=3600.0):
+    """
+    Build the index of a FT1 or FT2 file and write it to the sidecar file
+
+    :param filename: path of the FT1 or FT2 file
+    :param bucket: length of the time buckets (seconds)
+    :return: the index (a dictionary)
+    """
+
+    with fits.open(filename, memmap=True) as f:
+
+        extension, column = _find_extension(f)
+
+        # With memmap, only the pages touched by the binary searches are read
+        times = f[extension].data.field(column)
+
+        n_rows = len(times)
+
+        if n_rows == 0:
+
+            t0 = 0.0
+            offsets = np.array([0, 0])
+
+        else:
+
+            t0 = np.floor(times[0] / bucket) * bucket
+
+            n_buckets = int(np.floor((times[-1] - t0) / bucket)) + 1
+
+            # offsets[i] is the first row with time >= t0 + i * bucket (the last one is n_rows)
+            offsets = np.searchsorted(times, t0 + bucket * np.arange(n_buckets + 1), side='left')
+
+    index = {'extension': extension, 'column': column, 't0': t0, 'bucket': bucket, 'offsets': offsets,
+             'n_rows': n_rows, 'signature': _file_signature(filename)}
+
+    sidecar = index_file_name(filename)
+
+    # Written to a temporary file and renamed, so that a job reading the index at the same time (see load_index) never
+    # sees half of it
+    temp_file = "%s.%s.tmp" % (sidecar, os.getpid())
+
+    try:
+
+        with open(temp_file, 'wb') as f:
+
+            np.savez(f, **index)
+
+        os.rename(temp_file, sidecar)
+
+    except (IOError, OSError):
+
+        # e.g., the archive is read-only. The index can still be used by this process
+        print("Could not write the index to %s" % sidecar)
+
+        if os.path.exists(temp_file):
+
+            os.remove(temp_file)
+
+    return index
+
+
+def load_index(filename, build=False, bucket=3600.0):
+    """
+    Read the index of a file from its sidecar. The index is ignored if the file changed after it was built, or if the
+    sidecar cannot be read (for example, a sidecar left half-written by a job which died).
+
+    :param filename: path of the FT1 or FT2 file
+    :param build: if True, the index is built (and saved) when it does not exist or it is out of date
+    :param bucket: length of the time buckets, if the index needs to be built
+    :return: the index (a dictionary), or None if there is no valid index and build is False
+    """
+
+    sidecar = index_file_name(filename)
+
+    index = None
+
+    if os.path.exists(sidecar):
+
+        try:
+
+            # (np.load on a truncated file complains when it is garbage collected)
+            if not zipfile.is_zipfile(sidecar):
+
+                raise zipfile.BadZipfile("%s is not a zip file" % sidecar)
+
+            with np.load(sidecar) as data:
+
+                index = dict((key, data[key]) for key in data.files)
+
+            index['extension'] = str(index['extension'])
+            index['column'] = str(index['column'])
+
+        except (IOError, OSError, ValueError, KeyError, EOFError, zipfile.BadZipfile):
+
+            # (also if it was removed in the meantime)
+            print("Index %s cannot be read: ignoring it" % sidecar)
+
+            index = None
+
+    if index is not None:
+
+        if np.array_equal(index['signature'], _file_signature(filename)):
+
+            return index
+
+        print("Index %s is out of date" % sidecar)
+
+    if build:
+
+        print("Building time index for %s..." % filename)
+
+        return build_index(filename, bucket)
+
+    return None
+
+
+def row_range(filename, tmin, tmax, index=None, closed=False):
+    """
+    Return the range of rows with time in [tmin, tmax) (or [tmin, tmax] if closed is True)
+
+    :param filename: path of the FT1 or FT2 file
+    :param tmin: start of the range
+    :param tmax: end of the range
+    :param index: the index of the file (if None, it is read from the sidecar, or built if needed)
+    :param closed: whether to include rows with time equal to tmax
+    :return: (first row, last row + 1)
+    """
+
+    index = load_index(filename, build=True) if index is None else index
+
+    offsets = index['offsets']
+    n_buckets = len(offsets) - 1
+
+    # Rows in the buckets containing tmin and tmax: a superset of the rows needed
+    first_bucket = int(np.clip(np.floor((tmin - index['t0']) / index['bucket']), 0, n_buckets))
+    last_bucket = int(np.clip(np.floor((tmax - index['t0']) / index['bucket']) + 1, 0, n_buckets))
+
+    lo = int(offsets[first_bucket])
+    hi = int(offsets[last_bucket])
+
+    with fits.open(filename, memmap=True) as f:
+
+        times = f[index['extension']].data[lo:hi].field(index['column'])
+
+        first = lo + int(np.searchsorted(times, tmin, side='left'))
+        last = lo + int(np.searchsorted(times, tmax, side='right' if closed else 'left'))
+
+    return first, max(first, last)
+
+
+def read_range(filename, tmin, tmax, index=None, closed=False):
+    """
+    Return the rows with time in [tmin, tmax) (or [tmin, tmax] if closed is True) of the indexed table
+
+    :return: a np.array with the rows
+    """
+
+    index = load_index(filename, build=True) if index is None else index
+
+    first, last = row_range(filename, tmin, tmax, index, closed)
+
+    with fits.open(filename, memmap=True) as f:
+
+        return np.array(f[index['extension']].data[first:last])
+
+
+def cut_file(filename, out_file, tmin, tmax, index=None, closed=True, stop_column=None):
+    """
+    Write a copy of a FT1/FT2 file keeping only the rows of the indexed table with time in [tmin, tmax] (or
+    [tmin, tmax) if closed is False). The other extensions and the headers are copied as they are, as fcopy does.
+
+    :param filename: path of the FT1 or FT2 file
+    :param out_file: path of the output file (overwritten if it exists)
+    :param tmin: start of the range
+    :param tmax: end of the range
+    :param index: the index of the file (if None, it is read from the sidecar, or built if needed)
+    :param closed: whether to include rows with time equal to tmax
+    :param stop_column: if given, rows are also required to have this column <= tmax (like STOP for FT2 files)
+    :return: the number of rows written
+    """
+
+    index = load_index(filename, build=True) if index is None else index
+
+    first, last = row_range(filename, tmin, tmax, index, closed)
+
+    with fits.open(filename, memmap=True) as f:
+
+        extension = index['extension']
+
+        rows = f[extension].data[first:last]
+
+        if stop_column is not None:
+
+            rows = rows[rows.field(stop_column) <= tmax]
+
+        # Copying the indexed table would read all of it
+        hdus = [fits.BinTableHDU(data=rows, header=hdu.header) if hdu.name == extension else hdu.copy()
+                for hdu in f]
+
+        fits.HDUList(hdus).writeto(out_file, overwrite=True)
+
+    return len(rows)
+
+
+if __name__ == "__main__":
+
+    # With --profile, run this script under the profiler (see SULI.profiling)
+    profile_script(__file__)
+
+    parser = argparse.ArgumentParser('Build the time index of FT1/FT2 files')
+
+    parser.add_argument("--files", help="FT1 and/or FT2 files to index", nargs='+', type=str, required=True)
+    parser.add_argument("--bucket", help="Length of the time buckets (default: 1 hour)", type=float, default=3600.0)
+
+    args = parser.parse_args()
+
+    for this_file in args.files:
+
+        this_index = build_index(this_file, args.bucket)
+
+        print("%s: %s rows of %s in %s buckets -> %s" % (this_file, this_index['n_rows'], this_index['extension'],
+                                                          len(this_index['offsets']) - 1, index_file_name(this_file)))
@@ -0,0 +1,255 @@
+"""Search of overlapping time windows. An interval is divided into windows of a given length, starting every stride
+    seconds (for example 12 hour windows every 6 hours, as in Realtime_BB_Search.py), so that a transient close to the
+    boundary of one window is in the middle of another one. The windows are searched independently, and a transient
+    in the overlap of two windows is then found twice: the trigger lists are merged by keeping, among the triggers
+    close in position and with overlapping peaks in time, only the most significant one.
+
+    A single search can also be divided in shards (consecutive parts of the interval, with some overlap) searched in
+    parallel: in that case the trigger lists of the shards are stitched together into the list that a search of the
+    whole interval would give, before removing the redundant triggers"""
+
+import numpy as np
+
+from SULI.far import trigger_significance
+from SULI.remove_redundant_triggers import TRIGGER_DTYPE, read_triggers, write_triggers, check_nearest
+from SULI.sky_index import SkyIndex
+
+# Comment line at the end of a file written by write_window_triggers, with the number of triggers of each window
+WINDOW_SIZES = '# window sizes:'
+
+
+def sliding_windows(tstart, tstop, window, stride):
+    """
+    Return the windows covering [tstart, tstop). The last window is cut at tstop.
+
+    :param tstart: start of the interval
+    :param tstop: end of the interval
+    :param window: length of the windows
+    :param stride: time between the start of two consecutive windows (<= window, so there are no gaps)
+    :return: a list of (start, stop)
+    """
+
+    if window <= 0 or stride <= 0:
+
+        raise RuntimeError("The window (%s) and the stride (%s) must be positive" % (window, stride))
+
+    if stride > window:
+
+        raise RuntimeError("The stride (%s) is larger than the window (%s): some data would not be searched"
+                           % (stride, window))
+
+    windows = []
+
+    k = 0
+
+    while True:
+
+        start = tstart + k * stride
+        stop = min(start + window, tstop)
+
+        windows.append((start, stop))
+
+        if stop >= tstop:
+
+            break
+
+        k += 1
+
+    return windows
+
+
+def peak_interval(region):
+    """
+    Return the most significant block of a trigger (the one with the smallest probability)
+
+    :param region: a trigger (a row of a list returned by read_triggers)
+    :return: (start, stop) of the block
+    """
+
+    probabilities = map(float, region['probabilities'].split(","))
+
+    k = int(np.argmin(probabilities))
+
+    return float(region['tstarts'].split(",")[k]), float(region['tstops'].split(",")[k])
+
+
+def merge_window_triggers(trigger_lists, min_dist):
+    """
+    Merge the trigger lists of overlapping windows. Two triggers are the same detection if their centers are closer
+    than min_dist and their peaks (see peak_interval) overlap in time: only the most significant one is kept.
+
+    :param trigger_lists: list of trigger lists (np.recarray, as returned by read_triggers), one for each window,
+    already cleaned with check_nearest
+    :param min_dist: distance (degrees) below which two triggers are at the same position
+    :return: the merged list (a np.recarray)
+    """
+
+    regions = np.concatenate(trigger_lists).view(np.recarray)
+
+    if len(regions) == 0:
+
+        return regions
+
+    peaks = np.array([peak_interval(region) for region in regions])
+
+    i, j = SkyIndex(regions['ra'], regions['dec']).pairs_within(min_dist)
+
+    overlapping = (peaks[i, 0] < peaks[j, 1]) & (peaks[j, 0] < peaks[i, 1])
+
+    neighbours = [[] for _ in range(len(regions))]
+
+    for a, b in zip(i[overlapping], j[overlapping]):
+
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    # Most significant first: each trigger kept removes its duplicates
+    removed = np.zeros(len(regions), dtype=bool)
+
+    for k in np.argsort(trigger_significance(regions), kind='mergesort'):
+
+        if not removed[k]:
+
+            removed[neighbours[k]] = True
+
+    return regions[~removed]
+
+
+def clean_window_triggers(trigger_lists, min_dist):
+    """
+    Remove the redundant triggers of each window (with check_nearest), then merge the windows (see
+    merge_window_triggers)
+
+    :param trigger_lists: list of trigger lists (np.recarray, as returned by read_triggers), one for each window
+    :param min_dist: distance (degrees) below which two triggers are at the same position
+    :return: (the merged list, number of triggers in the windows after check_nearest)
+    """
+
+    window_triggers = [check_nearest(triggers, min_dist) for triggers in trigger_lists]
+
+    return merge_window_triggers(window_triggers, min_dist), sum(map(len, window_triggers))
+
+
+def write_window_triggers(trigger_lists, filename):
+    """
+    Write the trigger lists of the windows in one file, in the format of write_triggers, followed by a comment line
+    with the number of triggers of each window (so that read_window_triggers can split them again)
+
+    :param trigger_lists: list of trigger lists (np.recarray), one for each window
+    :param filename: name of the output text file
+    :return: none
+    """
+
+    write_triggers(np.concatenate(trigger_lists).view(np.recarray), filename)
+
+    with open(filename, 'a') as f:
+
+        f.write("%s %s\n" % (WINDOW_SIZES, ",".join(str(len(triggers)) for triggers in trigger_lists)))
+
+
+def read_window_triggers(filename):
+    """
+    Read a file written by write_window_triggers
+
+    :param filename: name of the text file
+    :return: the list of trigger lists (np.recarray), one for each window
+    """
+
+    with open(filename) as f:
+
+        last_line = f.read().rstrip("\n").split("\n")[-1]
+
+    if not last_line.startswith(WINDOW_SIZES):
+
+        raise RuntimeError("%s was not written by write_window_triggers" % filename)
+
+    sizes = [int(x) for x in last_line[len(WINDOW_SIZES):].split(",")]
+
+    # (an empty file gives an empty list, with a warning from numpy)
+    regions = read_triggers(filename) if sum(sizes) > 0 else np.zeros(0, dtype=TRIGGER_DTYPE).view(np.recarray)
+
+    if len(regions) != sum(sizes):
+
+        raise RuntimeError("%s contains %s triggers instead of %s" % (filename, len(regions), sum(sizes)))
+
+    return [triggers.view(np.recarray) for triggers in np.split(regions, np.cumsum(sizes)[:-1])]
+
+
+def time_shards(tstart, tstop, n_shards, overlap):
+    """
+    Divide [tstart, tstop) in n_shards consecutive parts of the same length (the cores), and extend each one by
+    overlap seconds on both sides (without going outside [tstart, tstop)), so that the search of a shard sees the
+    data around the edges of its core
+
+    :return: (shards, cores), two lists of (start, stop)
+    """
+
+    if n_shards < 1 or overlap < 0:
+
+        raise RuntimeError("The number of shards (%s) must be positive and the overlap (%s) must be >= 0"
+                           % (n_shards, overlap))
+
+    edges = tstart + (tstop - tstart) * np.arange(n_shards + 1) / float(n_shards)
+
+    # Avoid rounding errors at the end
+    edges[-1] = tstop
+
+    cores = list(zip(edges[:-1], edges[1:]))
+
+    shards = [(max(tstart, start - overlap), min(tstop, stop + overlap)) for start, stop in cores]
+
+    return shards, cores
+
+
+def stitch_shard_triggers(trigger_lists, cores):
+    """
+    Stitch together the trigger lists of the shards of an interval (see time_shards). The triggers of the same region
+    in different shards become one trigger, with the blocks of each shard which are centered in its core. A region
+    left with less than two blocks is dropped: its variability is outside the cores of the shards where it triggered,
+    so it is found by the shard whose core contains it.
+
+    :param trigger_lists: list of trigger lists (np.recarray, as returned by read_triggers), one for each shard
+    :param cores: list of the cores of the shards
+    :return: the stitched list (a np.recarray), in the same format, ready for check_nearest
+    """
+
+    names = []
+    blocks = {}
+    positions = {}
+
+    for triggers, (core_start, core_stop) in zip(trigger_lists, cores):
+
+        for region in triggers:
+
+            name = region['name']
+
+            if name not in blocks:
+
+                names.append(name)
+                blocks[name] = []
+                positions[name] = (region['ra'], region['dec'])
+
+            columns = [region[field].split(",") for field in ('tstarts', 'tstops', 'counts', 'probabilities')]
+
+            for start, stop, counts, probability in zip(*columns):
+
+                center = (float(start) + float(stop)) / 2.0
+
+                if core_start <= center < core_stop:
+
+                    blocks[name].append((float(start), start, stop, counts, probability))
+
+    rows = []
+
+    for name in names:
+
+        if len(blocks[name]) < 2:
+
+            continue
+
+        these_blocks = sorted(blocks[name])
+
+        rows.append((name, positions[name][0], positions[name][1]) +
+                    tuple(",".join(block[k] for block in these_blocks) for k in range(1, 5)))
+
+    return np.array(rows, dtype=TRIGGER_DTYPE).view(np.recarray)
@@ -0,0 +1,110 @@
+"""Choose between the Fermi ScienceTools (default) and the pure python stand-ins in SULI.local_tools.
+    Setting the environment variable SULI_TOOLS=local makes every script of the pipeline use the stand-ins, which
+    allows running and profiling the whole chain on a machine without the Fermi software"""
+
+import os
+import sys
+
+# Name used for the search done in-process with SULI.region_search (instead of ltfsearch), and the modules it runs
+IN_PROCESS_SEARCH = 'SULI.region_search'
+SEARCH_MODULES = ('region_search.py', 'bayesian_blocks.py')
+
+
+def local_tools_enabled():
+    """
+    Return True if the local stand-ins have been selected through the SULI_TOOLS environment variable
+    """
+
+    return os.environ.get('SULI_TOOLS', 'fermi').lower() == 'local'
+
+
+def tool_command(name):
+    """
+    Return the command to be used in a command line to execute the given tool (for example 'fcopy')
+
+    :param name: name of the executable of the tool
+    :return: the name itself, or the command executing the corresponding stand-in
+    """
+
+    if local_tools_enabled():
+
+        return "%s -m SULI.local_tools %s" % (sys.executable, name)
+
+    else:
+
+        return name
+
+
+def gt_app(name):
+    """
+    Return a GtApp instance for the given ScienceTool, or the equivalent stand-in
+
+    :param name: name of the tool (for example 'gtselect')
+    :return: an object with the same interface as GtApp (parameters set as items, and a run() method)
+    """
+
+    if local_tools_enabled():
+
+        from SULI.local_tools import LocalGtApp
+
+        return LocalGtApp(name)
+
+    else:
+
+        from GtApp import GtApp
+
+        return GtApp(name)
+
+
+def modules_digest(modules):
+    """
+    Return a hash of the source of the given modules of this package (file names)
+    """
+
+    import hashlib
+
+    digest = hashlib.sha256()
+
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+
+    for module in modules:
+
+        with open(os.path.join(package_dir, module), 'rb') as f:
+
+            digest.update(f.read())
+
+    return digest.hexdigest()[:16]
+
+
+def tool_version(name):
+    """
+    Return a string identifying the version of the given tool: for the Fermi tools the path, size and modification
+    time of the executable, for the local stand-ins and for the in-process search (IN_PROCESS_SEARCH) a hash of the
+    modules implementing them. Results produced by a different version of a tool have a different identifier (see
+    SULI.result_cache)
+
+    :param name: name of the executable of the tool, or IN_PROCESS_SEARCH
+    :return: a string
+    """
+
+    if name == IN_PROCESS_SEARCH:
+
+        return "in-process:%s" % modules_digest(SEARCH_MODULES)
+
+    elif local_tools_enabled():
+
+        return "local:%s" % modules_digest(('local_tools.py',) + SEARCH_MODULES)
+
+    else:
+
+        from SULI.which import which
+
+        path = which(name)
+
+        if path is None:
+
+            return "%s:not-found" % name
+
+        stat = os.stat(path)
+
+        return "%s:%s:%s" % (path, stat.st_size, int(stat.st_mtime))
@@ -1,10 +1,14 @@
 import os
 
+# Resolutions already done by this process, keyed by (program, PATH)
+_memo = {}
 
-def which(program):
 
-    def is_exe(fpath):
-        return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
+def is_exe(fpath):
+    return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
+
+
+def _search_path(program):
 
     fpath, fname = os.path.split(program)
     if fpath:
@@ -18,3 +22,25 @@ def which(program):
                 return exe_file
 
     return None
+
+
+def which(program):
+    """
+    Return the full path of the executable program as found in the PATH (or None if it is not found).
+
+    Results are memoized for the lifetime of the process, keyed by the value of PATH (a memoized path is used only
+    if it is still executable). There is no cache shared between processes: a PATH search costs a few stat calls,
+    and a shared cache could return a binary shadowed by a newer one installed earlier in the PATH.
+    """
+
+    key = (program, os.environ.get("PATH", ""))
+
+    if key in _memo and _memo[key] is not None and is_exe(_memo[key]):
+
+        return _memo[key]
+
+    result = _search_path(program)
+
+    _memo[key] = result
+
+    return result
@@ -4,7 +4,7 @@ from setuptools import setup
 setup(
     name="SULI",
 
-    packages=['SULI'],
+    packages=['SULI', 'SULI.benchmarks'],
 
     version='0.0.1',
 
@@ -22,5 +22,7 @@ setup(
 
     install_requires=['numpy','astropy'],
 
+    entry_points={'console_scripts': ['suli = SULI.cli:main']},
+
 )
 